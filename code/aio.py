@@ -0,0 +1,246 @@
+"""services.py 的 asyncio 外观层，供异步服务器（API 网关等）嵌入使用。
+
+同步服务会阻塞事件循环，这里把每次调用放到一个有上限的线程池里执行：
+- 底层必须是 PooledDatabase：每个工作线程有自己的读连接，写操作由其串行化；
+- 每个方法都接受 timeout（秒），超时或任务被取消时对正在执行查询的连接调用 interrupt()，
+  让 SQLite 尽快放弃这条语句，工作线程随即空出来；
+- iter_records 以异步迭代器返回，生产者线程分批把记录放进有界队列，消费慢时生产者自动等待；
+- 相互独立的统计查询可以用 asyncio.gather 并发执行，见 AsyncStatisticsService.overview。
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+try:
+    from .db import PooledDatabase
+    from .models import Record
+    from .services import (RecordService, StatisticsService, SearchService, AccountService, CategoryService,
+                           BudgetService, NotificationService)
+except Exception:
+    from db import PooledDatabase
+    from models import Record
+    from services import (RecordService, StatisticsService, SearchService, AccountService, CategoryService,
+                          BudgetService, NotificationService)
+
+
+_DONE = object()
+
+
+class _Call:
+    """一次在工作线程中执行的调用，记录它正在使用的连接以便取消时 interrupt。"""
+    def __init__(self, db: PooledDatabase):
+        self.db = db
+        self.conn = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            # 读连接按线程分配，这里取到的就是本工作线程的读连接
+            self.conn = self.db.conn
+
+    def finish(self) -> None:
+        with self._lock:
+            self.conn = None
+
+    def interrupt(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            if self.conn is not None:
+                # 持锁调用，保证不会打断这个线程之后执行的其他调用
+                self.conn.interrupt()
+
+
+class AsyncDatabase:
+    """持有 PooledDatabase 和有界线程池。max_workers 同时也是并发读连接数的上限。"""
+    def __init__(self, db: PooledDatabase, max_workers: int = 4):
+        if not isinstance(db, PooledDatabase):
+            raise TypeError("AsyncDatabase requires a PooledDatabase (sqlite3 connections cannot be shared across threads)")
+        self.db = db
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='acct-aio')
+
+    @classmethod
+    def open(cls, path: Optional[str] = None, max_workers: int = 4, **pool_options) -> 'AsyncDatabase':
+        return cls(PooledDatabase(path, **pool_options), max_workers)
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """在线程池中执行 fn(*args, **kwargs)。超时抛出 asyncio.TimeoutError，取消时中断正在执行的查询。"""
+        call = _Call(self.db)
+
+        def work():
+            if call.cancelled:
+                raise asyncio.CancelledError()
+            call.start()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                call.finish()
+
+        fut = asyncio.get_running_loop().run_in_executor(self._executor, work)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            call.interrupt()
+            raise
+
+    async def stream(self, make_iter: Callable[[], Any], batch_size: int = 500, max_batches: int = 4) -> AsyncIterator[Any]:
+        """把同步迭代器转换为异步迭代器。
+
+        生产者占用一个工作线程，每攒够 batch_size 项放入最多容纳 max_batches 批的队列；
+        消费方提前退出（break/aclose/取消）时，生产者在下一次放入时停止并关闭同步迭代器。
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(max_batches)
+        call = _Call(self.db)
+
+        def put(item) -> bool:
+            if call.cancelled:
+                return False
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+            return not call.cancelled
+
+        def produce():
+            call.start()
+            it = make_iter()
+            try:
+                batch: List[Any] = []
+                for item in it:
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        if not put(batch):
+                            return
+                        batch = []
+                if batch and not put(batch):
+                    return
+                put(_DONE)
+            except BaseException as e:
+                if not call.cancelled:
+                    put(e)
+            finally:
+                call.finish()
+                close = getattr(it, 'close', None)
+                if close:
+                    close()
+
+        fut = loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is _DONE:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                for item in batch:
+                    yield item
+        finally:
+            if not fut.done():
+                call.interrupt()
+                # 腾出队列空间，让阻塞在 put 上的生产者醒来并看到取消标记
+                while not fut.done():
+                    while not queue.empty():
+                        queue.get_nowait()
+                    await asyncio.sleep(0.001)
+            try:
+                await fut
+            except BaseException:
+                pass
+
+    async def close(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, functools.partial(self._executor.shutdown, wait=True))
+        self.db.close()
+
+    async def __aenter__(self) -> 'AsyncDatabase':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+
+def _async_method(name: str):
+    """生成把同名同步方法放到线程池执行的协程方法，额外接受 timeout 关键字参数。"""
+    async def method(self, *args, timeout: Optional[float] = None, **kwargs):
+        return await self.adb.run(getattr(self._sync, name), *args, timeout=timeout, **kwargs)
+    method.__name__ = name
+    method.__qualname__ = name
+    return method
+
+
+class _AsyncService:
+    _service_cls: Any = None
+
+    def __init__(self, adb: AsyncDatabase):
+        self.adb = adb
+        self._sync = self._service_cls(adb.db)
+
+
+class AsyncRecordService(_AsyncService):
+    _service_cls = RecordService
+    add_record = _async_method('add_record')
+    add_records = _async_method('add_records')
+    update_record = _async_method('update_record')
+    delete_record = _async_method('delete_record')
+    delete_records = _async_method('delete_records')
+    get_record = _async_method('get_record')
+    list_records = _async_method('list_records')
+    list_records_page = _async_method('list_records_page')
+
+    def iter_records(self, filters: Optional[Dict[str, Any]] = None, batch_size: int = 500) -> AsyncIterator[Record]:
+        """async for r in service.iter_records(...)：流式读取，内存占用与总行数无关。"""
+        return self.adb.stream(lambda: self._sync.iter_records(filters, batch_size), batch_size)
+
+
+class AsyncStatisticsService(_AsyncService):
+    _service_cls = StatisticsService
+    summary = _async_method('summary')
+    account_summary = _async_method('account_summary')
+    by_category = _async_method('by_category')
+    by_tag = _async_method('by_tag')
+    verify_rollup = _async_method('verify_rollup')
+
+    async def overview(self, start: date, end: date, account_id: Optional[str] = None,
+                       timeout: Optional[float] = None) -> Dict[str, Any]:
+        """并发执行 summary/by_category/by_tag，各自占用一个工作线程和读连接。"""
+        summary, categories, tags = await asyncio.gather(
+            self.summary(start, end, account_id, timeout=timeout),
+            self.by_category(start, end, account_id, timeout=timeout),
+            self.by_tag(start, end, account_id, timeout=timeout),
+        )
+        return {'summary': summary, 'by_category': categories, 'by_tag': tags}
+
+
+class AsyncSearchService(_AsyncService):
+    _service_cls = SearchService
+    search = _async_method('search')
+
+
+class AsyncAccountService(_AsyncService):
+    _service_cls = AccountService
+    add_account = _async_method('add_account')
+    list_accounts = _async_method('list_accounts')
+    get_balance = _async_method('get_balance')
+    balance_as_of = _async_method('balance_as_of')
+    delete_account = _async_method('delete_account')
+
+
+class AsyncCategoryService(_AsyncService):
+    _service_cls = CategoryService
+    add_category = _async_method('add_category')
+    list_categories = _async_method('list_categories')
+    delete_category = _async_method('delete_category')
+
+
+class AsyncBudgetService(_AsyncService):
+    _service_cls = BudgetService
+    set_budget = _async_method('set_budget')
+    list_budgets = _async_method('list_budgets')
+    spent = _async_method('spent')
+    evaluate = _async_method('evaluate')
+
+
+class AsyncNotificationService(_AsyncService):
+    _service_cls = NotificationService
+    send_notification = _async_method('send_notification')
+    list_notifications = _async_method('list_notifications')
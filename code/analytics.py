@@ -0,0 +1,221 @@
+"""基于 NumPy 的向量化时间序列统计。
+
+StatisticsService 只提供区间合计；趋势图需要按日/周/月的序列、滑动平均、余额曲线和分类占比。
+这个模块把筛选后的记录分块读成列式数组（日期为 1970-01-01 起的天数），之后全部用向量运算完成，
+不再逐行循环。NumPy 是可选依赖，只有使用本模块时才需要安装。
+"""
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 取决于运行环境
+    np = None
+try:
+    from .db import Database
+    from .models import RecordType
+    from .services import AccountService
+except Exception:
+    from db import Database
+    from models import RecordType
+    from services import AccountService
+
+
+_EPOCH = date(1970, 1, 1)
+FREQS = ('D', 'W', 'M')
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("analytics requires numpy; install it with 'pip install numpy'")
+
+
+def day_number(d: date) -> int:
+    return (d - _EPOCH).days
+
+
+def day_from_number(n: int) -> date:
+    return _EPOCH + timedelta(days=int(n))
+
+
+@dataclass
+class RecordColumns:
+    """列式的记录数据。category/account 用整数编码，编码到 id 的映射见 categories/accounts。"""
+    day: 'np.ndarray'        # int32，1970-01-01 起的天数
+    amount: 'np.ndarray'     # float64
+    income: 'np.ndarray'     # bool，True 为收入
+    category: 'np.ndarray'   # int32，categories 的下标
+    account: 'np.ndarray'    # int32，accounts 的下标
+    count: 'np.ndarray'      # int32，每行代表的记录笔数（从日汇总加载时 > 1）
+    categories: List[Optional[str]] = field(default_factory=list)
+    accounts: List[Optional[str]] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @property
+    def record_count(self) -> int:
+        return int(self.count.sum())
+
+    @property
+    def signed(self) -> 'np.ndarray':
+        """收入为正、支出为负的金额。"""
+        return np.where(self.income, self.amount, -self.amount)
+
+
+def _period_index(day: 'np.ndarray', freq: str) -> 'np.ndarray':
+    if freq == 'D':
+        return day.astype(np.int64)
+    if freq == 'W':
+        # 1970-01-01 是周四，+3 后按 7 整除得到以周一开始的周序号
+        return (day.astype(np.int64) + 3) // 7
+    if freq == 'M':
+        return day.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    raise ValueError(f"unknown frequency {freq!r}, expected one of {FREQS}")
+
+
+def _period_start(index: 'np.ndarray', freq: str) -> 'np.ndarray':
+    """周期序号 -> 周期第一天（datetime64[D]）。"""
+    if freq == 'D':
+        return index.astype('datetime64[D]')
+    if freq == 'W':
+        return (index * 7 - 3).astype('datetime64[D]')
+    return index.astype('datetime64[M]').astype('datetime64[D]')
+
+
+def rolling_mean(values: 'np.ndarray', window: int) -> 'np.ndarray':
+    """窗口为 window 的滑动平均；序列开头不足一个窗口时用已有的值求平均。"""
+    _require_numpy()
+    if window < 1:
+        raise ValueError("window must be >= 1")
+    values = np.asarray(values, dtype=np.float64)
+    c = np.concatenate(([0.0], np.cumsum(values)))
+    idx = np.arange(1, len(values) + 1)
+    lo = np.maximum(idx - window, 0)
+    return (c[idx] - c[lo]) / (idx - lo)
+
+
+class AnalyticsService:
+    """与 StatisticsService 并列使用的向量化统计。"""
+    def __init__(self, db: Database):
+        _require_numpy()
+        self.db = db
+
+    def load(self, start: Optional[date] = None, end: Optional[date] = None, account_id: Optional[str] = None,
+             category_id: Optional[str] = None, chunk_size: int = 100000, source: str = 'rollup') -> RecordColumns:
+        """按条件分块读取为列式数组。
+
+        source='rollup'（默认）从 daily_rollup 日汇总读取，每行是同一天同账户同分类同类型的合计，
+        序列、余额曲线和分类占比的结果与逐条读取完全相同，但行数只与天数相关；
+        source='records' 逐条读取原始记录。
+        日期换算和分类/账户的整数编码都在 SQL 中完成（编码表放在 TEMP 表里），
+        每块只返回纯数字的行，由 NumPy 在 C 层一次性转换为二维数组再拆成列。
+        """
+        if source == 'rollup':
+            table, day_col, amount_col, count_col = 'daily_rollup', 'day', 'total', 'cnt'
+        elif source == 'records':
+            table, day_col, amount_col, count_col = 'records', 'date', 'amount', '1'
+        else:
+            raise ValueError(f"unknown source {source!r}, expected 'rollup' or 'records'")
+        where = ""
+        params: List = []
+        if start:
+            where += f" AND r.{day_col} >= ?"
+            params.append(start.isoformat())
+        if end:
+            where += f" AND r.{day_col} <= ?"
+            params.append(end.isoformat())
+        if account_id:
+            where += " AND r.account_id = ?"
+            params.append(account_id)
+        if category_id:
+            where += " AND r.category_id = ?"
+            params.append(category_id)
+        conn = self.db.conn
+        categories: List[Optional[str]] = []
+        accounts: List[Optional[str]] = []
+        for col, code_table, ids in (('category_id', 'analytics_cat_codes', categories),
+                                ('account_id', 'analytics_acc_codes', accounts)):
+            ids.extend(r[0] or None for r in conn.execute(
+                f"SELECT DISTINCT COALESCE(r.{col}, '') FROM {table} r WHERE 1=1{where}", tuple(params)))
+            conn.execute(f"DROP TABLE IF EXISTS temp.{code_table}")
+            conn.execute(f"CREATE TEMP TABLE {code_table} (id TEXT PRIMARY KEY, code INTEGER NOT NULL)")
+            conn.executemany(f"INSERT INTO temp.{code_table}(id, code) VALUES (?, ?)",
+                             ((i or '', code) for code, i in enumerate(ids)))
+        sql = (f"SELECT CAST(julianday(r.{day_col}) - 2440587.5 AS INTEGER), r.{amount_col}, r.type = 'income', "
+               f"c.code, a.code, {count_col} FROM {table} r "
+               "JOIN temp.analytics_cat_codes c ON c.id = COALESCE(r.category_id, '') "
+               "JOIN temp.analytics_acc_codes a ON a.id = COALESCE(r.account_id, '') "
+               "WHERE 1=1" + where)
+        chunks = []
+        cur = conn.cursor()
+        cur.row_factory = None
+        try:
+            cur.execute(sql, tuple(params))
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                chunks.append(np.array(rows, dtype=np.float64))
+        finally:
+            cur.close()
+            conn.execute("DROP TABLE IF EXISTS temp.analytics_cat_codes")
+            conn.execute("DROP TABLE IF EXISTS temp.analytics_acc_codes")
+            if not self.db.in_transaction:
+                # 写编码表时 sqlite3 隐式开启了事务，这里结束它
+                conn.commit()
+        data = np.concatenate(chunks) if chunks else np.empty((0, 6), dtype=np.float64)
+        return RecordColumns(
+            day=data[:, 0].astype(np.int32),
+            amount=np.ascontiguousarray(data[:, 1]),
+            income=data[:, 2].astype(np.bool_),
+            category=data[:, 3].astype(np.int32),
+            account=data[:, 4].astype(np.int32),
+            count=data[:, 5].astype(np.int32),
+            categories=categories,
+            accounts=accounts,
+        )
+
+    def series(self, cols: RecordColumns, freq: str = 'D', start: Optional[date] = None,
+               end: Optional[date] = None) -> Dict[str, 'np.ndarray']:
+        """按日 ('D')、周 ('W'，周一开始) 或月 ('M') 汇总收入、支出和净额。
+
+        返回 {'period': 周期首日 (datetime64[D]), 'income', 'expense', 'net'}；
+        没有记录的周期也会出现（值为 0），便于直接画图。
+        """
+        if start is None and end is None and len(cols) == 0:
+            empty = np.empty(0, dtype=np.float64)
+            return {'period': np.empty(0, dtype='datetime64[D]'), 'income': empty, 'expense': empty, 'net': empty}
+        lo = day_number(start) if start else int(cols.day.min())
+        hi = day_number(end) if end else int(cols.day.max())
+        mask = (cols.day >= lo) & (cols.day <= hi)
+        idx = _period_index(cols.day[mask], freq)
+        first = int(_period_index(np.array([lo]), freq)[0])
+        last = int(_period_index(np.array([hi]), freq)[0])
+        offset = idx - first
+        size = last - first + 1
+        amount = cols.amount[mask]
+        income_mask = cols.income[mask]
+        income = np.bincount(offset, weights=np.where(income_mask, amount, 0.0), minlength=size)
+        expense = np.bincount(offset, weights=np.where(income_mask, 0.0, amount), minlength=size)
+        return {
+            'period': _period_start(np.arange(first, last + 1), freq),
+            'income': income,
+            'expense': expense,
+            'net': income - expense,
+        }
+
+    def balance_curve(self, account_id: str, start: date, end: date) -> Dict[str, 'np.ndarray']:
+        """账户在 [start, end] 每天结束时的余额曲线：起点余额来自 balance_as_of，之后累加每日净额。"""
+        opening = AccountService(self.db).balance_as_of(account_id, start - timedelta(days=1)) or 0.0
+        daily = self.series(self.load(start, end, account_id=account_id), 'D', start, end)
+        return {'period': daily['period'], 'balance': opening + np.cumsum(daily['net'])}
+
+    def category_shares(self, cols: RecordColumns, rtype: RecordType = RecordType.EXPENSE) -> Dict[str, float]:
+        """各分类金额占该类型总额的比例，键与 StatisticsService.by_category 一致（无分类为 'uncategorized'）。"""
+        mask = cols.income if rtype == RecordType.INCOME else ~cols.income
+        totals = np.bincount(cols.category[mask], weights=cols.amount[mask], minlength=len(cols.categories))
+        grand = totals.sum()
+        if grand == 0:
+            return {}
+        return {(cid or 'uncategorized'): float(t / grand) for cid, t in zip(cols.categories, totals) if t}
@@ -0,0 +1,283 @@
+"""冷热分离：把早于截止日期的记录移出 records，按年份存入独立的归档库（SQLite 文件），查询时按需 ATTACH。
+
+- 归档库与主库的 records 同结构，另有 record_tags 和全文索引，默认放在数据库旁边：<库名>.<年份>.archive.db；
+- 主库的 archives 表登记每个归档年份的文件和该年的汇总（笔数、收入、支出、日期范围）；
+- 归档时不改动 daily_rollup、账户余额、预算计数和同步日志（相关删除触发器在 meta.archiving 存在时不执行），
+  所以只走日汇总表的统计（StatisticsService.summary/by_category、余额、预算）完全不读归档库；
+  已归档部分的日汇总另存于 archived_rollup，校验/重建 daily_rollup 时也不必打开归档库；
+- SearchService、StatisticsService 中需要明细的统计（金额区间/全文/标签条件、by_tag）和 RecordService.get_record
+  会同时查询主库和日期范围相关的归档库；其余的 RecordService 列表接口只返回主库（热数据）中的记录。
+- 归档库中的记录不直接修改：RecordService.update_record/delete_record 和同步（sync.apply_changes）写到已归档的
+  记录时，先用 restore_records 把它移回主库，再按普通记录处理。备份（Database.backup）把各归档库复制到备份文件旁边，restore 时放回原位。
+
+用法：
+    result = archive_records(db, date(2024, 1, 1))        # 2024 年以前的记录移入各年份的归档库
+    ArchiveSet.for_db(db).summaries()                      # 各归档年份的汇总
+"""
+import os
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+try:
+    from .db import Database, BULK_LOADING_FLAG, fts_tags_expr, index_inserted_records
+except Exception:
+    from db import Database, BULK_LOADING_FLAG, fts_tags_expr, index_inserted_records
+
+
+# SQLite 默认最多同时 ATTACH 10 个库，留出余量给调用方自己 ATTACH 的库
+MAX_ATTACHED = 8
+
+_RECORD_COLUMNS = 'record_id, amount, type, date, category_id, account_id, tags, note, attachments, updated_at'
+
+_ARCHIVE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS {s}.records (
+        record_id TEXT PRIMARY KEY,
+        amount REAL NOT NULL,
+        type TEXT NOT NULL,
+        date TEXT NOT NULL,
+        category_id TEXT,
+        account_id TEXT,
+        tags TEXT,
+        note TEXT,
+        attachments TEXT,
+        updated_at TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS {s}.idx_records_date_id ON records(date, record_id)",
+    "CREATE INDEX IF NOT EXISTS {s}.idx_records_account_date ON records(account_id, date)",
+    "CREATE INDEX IF NOT EXISTS {s}.idx_records_category_date ON records(category_id, date)",
+    """CREATE TABLE IF NOT EXISTS {s}.record_tags (
+        tag TEXT NOT NULL,
+        record_id TEXT NOT NULL,
+        PRIMARY KEY (tag, record_id)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS {s}.idx_record_tags_record ON record_tags(record_id)",
+]
+
+# 按 (日, 账户, 分类, 类型) 聚合 {table} 中 {where} 的记录，sign 为 '-' 时取负，用于增减 archived_rollup
+_ARCHIVED_ROLLUP_ADD = (
+    "INSERT INTO main.archived_rollup(day, account_id, category_id, type, total, cnt) "
+    "SELECT date, COALESCE(account_id, ''), COALESCE(category_id, ''), type, {sign}SUM(amount), {sign}COUNT(*) "
+    "FROM {table} WHERE {where} GROUP BY 1, 2, 3, 4 "
+    "ON CONFLICT(day, account_id, category_id, type) DO UPDATE SET total = total + excluded.total, cnt = cnt + excluded.cnt")
+
+# archives 表中一个年份的汇总列，由归档库 {s} 的 records 计算
+_SUMMARY_SELECT = ("SELECT COUNT(*), COALESCE(SUM(CASE type WHEN 'income' THEN amount END), 0), "
+                   "COALESCE(SUM(CASE type WHEN 'expense' THEN amount END), 0), MIN(date), MAX(date) FROM {s}.records")
+
+
+@dataclass
+class ArchiveSummary:
+    """一个归档年份的登记信息（archives 表的一行）。"""
+    year: int
+    path: str
+    records: int
+    income: float
+    expense: float
+    first_day: Optional[str]
+    last_day: Optional[str]
+    archived_at: Optional[str]
+
+
+@dataclass
+class ArchivalResult:
+    moved: Dict[int, int] = field(default_factory=dict)  # 年份 -> 本次移入归档库的记录数
+    seconds: float = 0.0
+
+    @property
+    def total(self) -> int:
+        return sum(self.moved.values())
+
+
+def archive_path(db: Database, year: int, directory: Optional[str] = None) -> Path:
+    """year 年归档库的默认位置：与数据库同目录（或 directory 下），<库名>.<年份>.archive.db。"""
+    return Path(directory or db.path.parent) / f"{db.path.stem}.{year}.archive.db"
+
+
+class ArchiveSet:
+    """一个 Database 的归档库集合：读取登记信息，并把需要的归档库 ATTACH 到当前连接上。
+
+    ATTACH 的库名为 arc_<年份>。同时挂载的库超过 MAX_ATTACHED 时按最近使用顺序 DETACH 最久未用的库。
+    PooledDatabase 的每个线程有自己的连接，挂载状态按连接分别判断（PRAGMA database_list）。
+    """
+    _instances: 'weakref.WeakKeyDictionary[Database, ArchiveSet]' = weakref.WeakKeyDictionary()
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._recent: 'OrderedDict[str, None]' = OrderedDict()
+
+    @classmethod
+    def for_db(cls, db: Database) -> 'ArchiveSet':
+        """同一个 Database 共享同一个实例。"""
+        inst = cls._instances.get(db)
+        if inst is None:
+            inst = cls._instances[db] = cls(db)
+        return inst
+
+    @staticmethod
+    def schema(year: int) -> str:
+        return f"arc_{year}"
+
+    def summaries(self) -> List[ArchiveSummary]:
+        rows = self.db.query("SELECT year, path, records, income, expense, first_day, last_day, archived_at "
+                             "FROM archives ORDER BY year", tuples=True)
+        return [ArchiveSummary(*r) for r in rows]
+
+    def years(self, start: Optional[date] = None, end: Optional[date] = None) -> List[int]:
+        """与 [start, end] 有交集的归档年份，新的在前；两端都可省略。"""
+        rows = self.db.query("SELECT year FROM archives WHERE year >= ? AND year <= ? ORDER BY year DESC",
+                             (start.year if start else 0, end.year if end else 9999), tuples=True)
+        return [r[0] for r in rows]
+
+    def files(self) -> Dict[int, Path]:
+        """各归档年份的归档库文件。"""
+        return {year: self._resolve(path) for year, path in self.db.query("SELECT year, path FROM archives", tuples=True)}
+
+    def _resolve(self, path: str) -> Path:
+        p = Path(path)
+        return p if p.is_absolute() else self.db.path.parent / p
+
+    def attach(self, year: int, path: Optional[Path] = None) -> str:
+        """确保 year 年的归档库已挂载到当前连接，返回库名。path 缺省时使用 archives 中登记的文件。"""
+        name = self.schema(year)
+        conn = self.db.conn
+        attached = {r[1] for r in conn.execute("PRAGMA database_list")}
+        if name not in attached:
+            if path is None:
+                row = self.db.query("SELECT path FROM archives WHERE year = ?", (year,))
+                if not row:
+                    raise KeyError(f'year {year} is not archived')
+                path = self._resolve(row[0][0])
+                if not path.exists():
+                    raise FileNotFoundError(f'archive for {year} is missing: {path}')
+            self._evict(conn, attached - {'main', 'temp'})
+            conn.execute("ATTACH DATABASE ? AS " + name, (str(path),))
+        self._recent.pop(name, None)
+        self._recent[name] = None
+        return name
+
+    def _evict(self, conn, attached) -> None:
+        ours = [n for n in self._recent if n in attached]
+        while len(attached) >= MAX_ATTACHED and ours:
+            victim = ours.pop(0)
+            try:
+                conn.execute("DETACH DATABASE " + victim)
+            except Exception:
+                # 当前事务正在使用该库时不能 DETACH，换下一个
+                continue
+            attached = attached - {victim}
+
+    def detach_all(self) -> None:
+        conn = self.db.conn
+        for name in [r[1] for r in conn.execute("PRAGMA database_list")]:
+            if name.startswith('arc_'):
+                conn.execute("DETACH DATABASE " + name)
+        self._recent.clear()
+
+
+def _create_archive_schema(db: Database, schema: str, fts: bool) -> None:
+    for stmt in _ARCHIVE_SCHEMA:
+        db.execute(stmt.format(s=schema))
+    if fts:
+        db.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.records_fts USING fts5(note, tags, tokenize='trigram')")
+
+
+def archive_records(db: Database, cutoff: date, directory: Optional[str] = None, vacuum: bool = False) -> ArchivalResult:
+    """把日期早于 cutoff 的记录按年份移入归档库，返回各年份移动的记录数。
+
+    每个年份在一个事务内完成（写归档库、更新 archived_rollup 和 archives、从 records 删除），中途失败不会丢数据；
+    已有归档库的年份会追加（例如之后又补记了旧日期的记录）。vacuum=True 时最后对主库执行 VACUUM 回收空间。
+    """
+    if db.in_transaction:
+        raise RuntimeError('archive_records() cannot run inside a transaction')
+    t0 = time.perf_counter()
+    result = ArchivalResult()
+    archives = ArchiveSet.for_db(db)
+    fts = db.has_table('records_fts')
+    cutoff_day = cutoff.isoformat()
+    years = [int(r[0]) for r in db.query("SELECT DISTINCT substr(date, 1, 4) FROM records WHERE date < ?", (cutoff_day,))]
+    for year in years:
+        path = archive_path(db, year, directory)
+        rng = "date >= ? AND date < ?"
+        bounds = (f"{year:04d}-01-01", min(cutoff_day, f"{year + 1:04d}-01-01"))
+        with db.transaction():
+            s = archives.attach(year, path)
+            _create_archive_schema(db, s, fts)
+            moving = f"(SELECT record_id FROM main.records WHERE {rng})"
+            # 归档库里已有同 id 的旧版本（例如同步又把记录写回了主库）时，先撤掉它在 archived_rollup 中的份额
+            db.execute(_ARCHIVED_ROLLUP_ADD.format(sign='-', table=f"{s}.records", where=f"record_id IN {moving}"), bounds)
+            db.execute(f"DELETE FROM {s}.record_tags WHERE record_id IN {moving}", bounds)
+            db.execute(f"INSERT OR REPLACE INTO {s}.records({_RECORD_COLUMNS}) SELECT {_RECORD_COLUMNS} "
+                       f"FROM main.records WHERE {rng}", bounds)
+            db.execute(f"INSERT OR IGNORE INTO {s}.record_tags(tag, record_id) SELECT t.tag, t.record_id "
+                       f"FROM main.record_tags t JOIN main.records r ON r.record_id = t.record_id "
+                       f"WHERE r.date >= ? AND r.date < ?", bounds)
+            db.execute(_ARCHIVED_ROLLUP_ADD.format(sign='', table="main.records", where=rng), bounds)
+            db.execute("DELETE FROM main.archived_rollup WHERE cnt <= 0")
+            db.execute("INSERT OR REPLACE INTO main.meta(key, value) VALUES ('archiving', '1')")
+            result.moved[year] = db.execute(f"DELETE FROM main.records WHERE {rng}", bounds).rowcount
+            db.execute("DELETE FROM main.meta WHERE key = 'archiving'")
+            if fts:
+                # 归档库不再变化，整体重建全文索引比逐行维护简单
+                db.execute(f"DELETE FROM {s}.records_fts")
+                db.execute(f"INSERT INTO {s}.records_fts(rowid, note, tags) "
+                           f"SELECT rowid, note, {fts_tags_expr('tags')} FROM {s}.records")
+            try:
+                stored = os.path.relpath(path, db.path.parent)
+            except ValueError:  # Windows 上不同盘符
+                stored = str(path)
+            db.execute(f"""
+                INSERT OR REPLACE INTO main.archives(year, path, records, income, expense, first_day, last_day, archived_at)
+                SELECT ?, ?, *, datetime('now') FROM ({_SUMMARY_SELECT.format(s=s)})""", (year, stored))
+    if vacuum and years:
+        db.execute("VACUUM main")
+    result.seconds = time.perf_counter() - t0
+    return result
+
+
+def restore_records(db: Database, record_ids: Iterable[str]) -> int:
+    """把 record_ids 中已归档（且主库中没有）的记录移回主库，返回移回的条数。
+
+    日汇总、余额、预算计数和同步日志一直包含已归档的记录，所以移回时只从 archived_rollup 中减掉它们的份额，
+    插入 records 时跳过派生表的触发器（meta.bulk_loading），只补写全文索引和 record_tags。
+    之后对这些记录的修改、删除由普通触发器维护，不会重复计算。
+    """
+    archives = ArchiveSet.for_db(db)
+    years = archives.years()
+    if not years:
+        return 0
+    restored = 0
+    with db.transaction():
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS restore_ids (record_id TEXT PRIMARY KEY)")
+        db.execute("DELETE FROM temp.restore_ids")
+        db.executemany("INSERT OR IGNORE INTO temp.restore_ids(record_id) SELECT ? "
+                       "WHERE NOT EXISTS (SELECT 1 FROM main.records WHERE record_id = ?)",
+                       ((rid, rid) for rid in record_ids))
+        ids = "record_id IN (SELECT record_id FROM temp.restore_ids)"
+        for year in years:
+            if not db.query("SELECT 1 FROM temp.restore_ids LIMIT 1"):
+                break
+            s = archives.attach(year)
+            if not db.query(f"SELECT 1 FROM {s}.records WHERE {ids} LIMIT 1"):
+                continue
+            db.execute(_ARCHIVED_ROLLUP_ADD.format(sign='-', table=f"{s}.records", where=ids))
+            db.execute("DELETE FROM main.archived_rollup WHERE cnt <= 0")
+            last_rowid = db.query("SELECT COALESCE(MAX(rowid), 0) FROM main.records")[0][0]
+            db.execute("INSERT INTO main.meta(key, value) VALUES (?, '1')", (BULK_LOADING_FLAG,))
+            moved = db.execute(f"INSERT INTO main.records({_RECORD_COLUMNS}) SELECT {_RECORD_COLUMNS} "
+                               f"FROM {s}.records WHERE {ids}").rowcount
+            index_inserted_records(db.conn, last_rowid)
+            db.execute("DELETE FROM main.meta WHERE key = ?", (BULK_LOADING_FLAG,))
+            if db.has_table('records_fts'):
+                db.execute(f"DELETE FROM {s}.records_fts WHERE rowid IN (SELECT rowid FROM {s}.records WHERE {ids})")
+            db.execute(f"DELETE FROM {s}.record_tags WHERE {ids}")
+            db.execute(f"DELETE FROM {s}.records WHERE {ids}")
+            db.execute(f"UPDATE main.archives SET (records, income, expense, first_day, last_day) = "
+                       f"({_SUMMARY_SELECT.format(s=s)}) WHERE year = ?", (year,))
+            db.execute("DELETE FROM temp.restore_ids WHERE EXISTS "
+                       "(SELECT 1 FROM main.records r WHERE r.record_id = restore_ids.record_id)")
+            restored += moved
+    return restored
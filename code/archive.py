@@ -0,0 +1,308 @@
+"""记录的二进制列式归档格式（.acar）。
+
+CSV 体积大、重新解析慢，不适合做分析的数据源。归档文件按列存放：
+- 日期（1970-01-01 起的天数，int32）、金额（float64）、类型（uint8，0 支出 / 1 收入）为定长列；
+- 账户、分类、备注、标签、附件为 uint32 引用，指向文件末尾的字符串堆，
+  堆内字符串去重（字典编码），重复的分类/账户/标签组合只存一份；NULL 用 0xFFFFFFFF 表示；
+- record_id 全部是标准格式的 UUID 时按 16 字节定长存放（类型码 'U'），否则同样存为字符串引用。
+
+文件布局（小端）：
+    头部      magic 'ACCTARC1' | version u16 | flags u16 | 行数 u64 | 列数 u32
+    列目录    每列：名称 16s | 类型码 1s | 7 字节填充 | 偏移 u64 | 字节数 u64
+    字符串堆  偏移表偏移 u64 | 字符串数 u64 | 数据偏移 u64 | 数据字节数 u64
+    列数据    各列按 8 字节对齐依次存放
+    偏移表    (字符串数 + 1) 个 u64，第 i 个字符串为 data[off[i]:off[i+1]]（UTF-8）
+    数据
+
+读取时 mmap 整个文件，ArchiveReader.column() 返回直接指向映射内存的 memoryview，不复制数据；
+可以用 numpy.frombuffer(view) 零拷贝转成数组。
+"""
+import json
+import mmap
+import struct
+import time
+import uuid
+from array import array
+from itertools import islice
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+try:
+    from .db import Database
+    from .models import Record, RecordType
+    from .services import RECORD_SELECT, record_from_row
+    from .query import RecordQuery
+    from .export_import import ExportStats, bulk_insert_rows
+except Exception:
+    from db import Database
+    from models import Record, RecordType
+    from services import RECORD_SELECT, record_from_row
+    from query import RecordQuery
+    from export_import import ExportStats, bulk_insert_rows
+
+
+MAGIC = b'ACCTARC1'
+VERSION = 1
+NULL_REF = 0xFFFFFFFF
+
+_HEADER = struct.Struct('<8sHHQI')
+_COLUMN = struct.Struct('<16ss7xQQ')
+_HEAP = struct.Struct('<QQQQ')
+
+# (列名, array 类型码)；列的顺序即文件中的顺序。record_id 可能改为 'U'，见 ArchiveWriter._id_column
+ARCHIVE_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ('record_id', 'I'),
+    ('date', 'i'),
+    ('amount', 'd'),
+    ('type', 'B'),
+    ('category_id', 'I'),
+    ('account_id', 'I'),
+    ('tags', 'I'),
+    ('note', 'I'),
+    ('attachments', 'I'),
+)
+_TYPE_CODES = {'expense': 0, 'income': 1}
+_TYPE_NAMES = ('expense', 'income')
+_EPOCH = date(1970, 1, 1)
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class ArchiveWriter:
+    """逐行写入归档。列在内存中以 array 累积（每行约 37 字节加上去重后的字符串），close() 时一次写出。"""
+    def __init__(self, path: str):
+        self.path = path
+        self._columns: Dict[str, array] = {name: array(code) for name, code in ARCHIVE_COLUMNS if name != 'record_id'}
+        self._string_index: Dict[str, int] = {}
+        self._strings: List[bytes] = []
+        self._days: Dict[str, int] = {}
+        # record_id 在 close() 时再决定按 UUID 定长列还是字符串引用写出
+        self._ids: List[str] = []
+        self.rows = 0
+
+    def _ref(self, s: Optional[str]) -> int:
+        if s is None:
+            return NULL_REF
+        ref = self._string_index.get(s)
+        if ref is None:
+            ref = self._string_index[s] = len(self._strings)
+            self._strings.append(s.encode('utf-8'))
+        return ref
+
+    def _day(self, dstr: str) -> int:
+        n = self._days.get(dstr)
+        if n is None:
+            n = self._days[dstr] = (date.fromisoformat(dstr) - _EPOCH).days
+        return n
+
+    def add_rows(self, rows: Iterable[Tuple]) -> None:
+        """写入按 RECORD_COLUMNS 顺序的行（与 Database.query(..., tuples=True) 的结果相同）。"""
+        cols = self._columns
+        ids, days, amounts, types = self._ids, cols['date'], cols['amount'], cols['type']
+        cats, accs, tags, notes, atts = (cols['category_id'], cols['account_id'], cols['tags'], cols['note'],
+                                         cols['attachments'])
+        ref, day = self._ref, self._day
+        n = 0
+        for record_id, amount, rtype, dstr, category_id, account_id, tags_json, note, attachments in rows:
+            ids.append(record_id)
+            days.append(day(dstr))
+            amounts.append(amount)
+            types.append(_TYPE_CODES[rtype])
+            cats.append(ref(category_id))
+            accs.append(ref(account_id))
+            tags.append(ref(tags_json))
+            notes.append(ref(note))
+            atts.append(ref(attachments))
+            n += 1
+        self.rows += n
+
+    def add(self, record: Record) -> None:
+        self.add_rows([(record.record_id, record.amount, record.type.value, (record.date or date.today()).isoformat(),
+                        record.category_id, record.account_id, json.dumps(record.tags), record.note,
+                        json.dumps(record.attachments))])
+
+    def _id_column(self) -> Tuple[str, bytes]:
+        try:
+            raw = b''.join(uuid.UUID(s).bytes for s in self._ids)
+            # 只有能原样还原的标准小写格式才用定长列
+            if all(len(s) == 36 and s == s.lower() for s in self._ids):
+                return 'U', raw
+        except (ValueError, TypeError, AttributeError):
+            pass
+        return 'I', array('I', map(self._ref, self._ids)).tobytes()
+
+    def close(self) -> int:
+        """写出文件，返回字节数。"""
+        id_code, id_bytes = self._id_column()
+        data = {name: self._columns[name].tobytes() for name, _ in ARCHIVE_COLUMNS if name != 'record_id'}
+        data['record_id'] = id_bytes
+        offset = _align(_HEADER.size + _COLUMN.size * len(ARCHIVE_COLUMNS) + _HEAP.size)
+        directory = []
+        for name, code in ARCHIVE_COLUMNS:
+            if name == 'record_id':
+                code = id_code
+            nbytes = len(data[name])
+            directory.append((name, code, offset, nbytes))
+            offset = _align(offset + nbytes)
+        offsets = array('Q', [0])
+        total = 0
+        for b in self._strings:
+            total += len(b)
+            offsets.append(total)
+        offsets_at = offset
+        data_at = offsets_at + len(offsets) * offsets.itemsize
+        with open(self.path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, 0, self.rows, len(ARCHIVE_COLUMNS)))
+            for name, code, off, nbytes in directory:
+                f.write(_COLUMN.pack(name.encode('ascii'), code.encode('ascii'), off, nbytes))
+            f.write(_HEAP.pack(offsets_at, len(self._strings), data_at, total))
+            for name, code, off, nbytes in directory:
+                f.write(b'\0' * (off - f.tell()))
+                f.write(data[name])
+            f.write(b'\0' * (offsets_at - f.tell()))
+            offsets.tofile(f)
+            f.write(b''.join(self._strings))
+            return f.tell()
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+
+
+class ArchiveReader:
+    """以 mmap 只读打开归档。column() 返回零拷贝的 memoryview；close() 前需释放取得的 memoryview。"""
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空文件无法映射
+            self._file.close()
+            raise ValueError(f"{path} is not an archive")
+        self._buf = memoryview(self._mm)
+        try:
+            if len(self._buf) < _HEADER.size or self._buf[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not an archive")
+            _magic, version, _flags, self.rows, ncols = _HEADER.unpack_from(self._buf, 0)
+            if version > VERSION:
+                raise ValueError(f"{path} uses archive version {version}, newer than supported {VERSION}")
+            self.columns: Dict[str, Tuple[str, int, int]] = {}
+            pos = _HEADER.size
+            for _ in range(ncols):
+                name, code, off, nbytes = _COLUMN.unpack_from(self._buf, pos)
+                self.columns[name.rstrip(b'\0').decode('ascii')] = (code.decode('ascii'), off, nbytes)
+                pos += _COLUMN.size
+            offsets_at, self._nstrings, self._data_at, data_len = _HEAP.unpack_from(self._buf, pos)
+        except Exception:
+            self.close()
+            raise
+        self._offsets = self._buf[offsets_at:offsets_at + (self._nstrings + 1) * 8].cast('Q')
+        self._cache: List[Optional[str]] = [None] * self._nstrings
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, name: str) -> memoryview:
+        """列 name 的零拷贝视图；字符串列的元素是字符串引用，用 string() 解码。
+
+        UUID 格式的 record_id 列（类型码 'U'）返回按字节的视图，每 16 字节一个 UUID。
+        """
+        code, off, nbytes = self.columns[name]
+        return self._buf[off:off + nbytes].cast('B' if code == 'U' else code)
+
+    def record_ids(self, lo: int = 0, hi: Optional[int] = None) -> List[str]:
+        hi = self.rows if hi is None else hi
+        code, off, _ = self.columns['record_id']
+        if code == 'U':
+            raw = self._buf[off + lo * 16:off + hi * 16].tobytes()
+            return [str(uuid.UUID(bytes=raw[i:i + 16])) for i in range(0, len(raw), 16)]
+        view = self.column('record_id')
+        try:
+            return [self.string(ref) for ref in view[lo:hi].tolist()]
+        finally:
+            view.release()
+
+    def string(self, ref: int) -> Optional[str]:
+        if ref == NULL_REF:
+            return None
+        s = self._cache[ref]
+        if s is None:
+            start = self._data_at + self._offsets[ref]
+            s = self._cache[ref] = str(self._buf[start:self._data_at + self._offsets[ref + 1]], 'utf-8')
+        return s
+
+    def dates(self) -> memoryview:
+        """日期列（1970-01-01 起的天数）。"""
+        return self.column('date')
+
+    def iter_rows(self, chunk_size: int = 10000) -> Iterator[Tuple]:
+        """按 RECORD_COLUMNS 顺序逐行返回 tuple，可直接交给 record_from_row 或写入数据库。"""
+        string = self.string
+        day_cache: Dict[int, str] = {}
+        views = {name: self.column(name) for name, _ in ARCHIVE_COLUMNS if name != 'record_id'}
+        try:
+            for lo in range(0, self.rows, chunk_size):
+                hi = min(lo + chunk_size, self.rows)
+                ids = self.record_ids(lo, hi)
+                days, amounts, types, cats, accs, tags, notes, atts = (
+                    views[name][lo:hi].tolist() for name, _ in ARCHIVE_COLUMNS if name != 'record_id')
+                for i in range(hi - lo):
+                    d = days[i]
+                    dstr = day_cache.get(d)
+                    if dstr is None:
+                        dstr = day_cache[d] = (_EPOCH + timedelta(days=d)).isoformat()
+                    yield (ids[i], amounts[i], _TYPE_NAMES[types[i]], dstr, string(cats[i]), string(accs[i]),
+                           string(tags[i]), string(notes[i]), string(atts[i]))
+        finally:
+            for v in views.values():
+                v.release()
+
+    def __iter__(self) -> Iterator[Record]:
+        for row in self.iter_rows():
+            yield record_from_row(row)
+
+    def close(self) -> None:
+        if getattr(self, '_offsets', None) is not None:
+            self._offsets.release()
+        self._buf.release()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> 'ArchiveReader':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def export_archive(db: Database, path: str, start: Optional[date] = None, end: Optional[date] = None,
+                   account_id: Optional[str] = None, category_id: Optional[str] = None,
+                   rtype: Optional[Union[RecordType, str]] = None, batch_size: int = 5000) -> ExportStats:
+    """把符合条件的记录写成归档，筛选条件与 export_import.export_records 相同。"""
+    sql, params = RecordQuery(start=start, end=end, account_id=account_id, category_id=category_id, type=rtype or None,
+                              order=None).select(RECORD_SELECT)
+    t0 = time.perf_counter()
+    writer = ArchiveWriter(path)
+    writer.add_rows(db.iter_query(sql, params, batch_size, tuples=True))
+    writer.close()
+    return ExportStats(writer.rows, time.perf_counter() - t0)
+
+
+def load_archive(db: Database, path: str, chunk_size: int = 10000) -> int:
+    """把归档批量写入 db（与 CSV 导入走同一条批量路径），已存在的 record_id 跳过。返回新增条数。"""
+    with ArchiveReader(path) as reader:
+        rows = reader.iter_rows(chunk_size)
+        try:
+            def chunks():
+                while True:
+                    chunk = list(islice(rows, chunk_size))
+                    if not chunk:
+                        return
+                    yield chunk
+            return bulk_insert_rows(db, chunks())[1]
+        finally:
+            rows.close()
@@ -0,0 +1 @@
+"""性能基准脚本。在 code 目录中用 python -m benchmarks.<模块名> 运行。"""
@@ -0,0 +1,75 @@
+"""对比逐行 Python 循环与 analytics 向量化（分别从原始记录和日汇总加载）计算按月收支序列、30 日滑动平均和分类占比的耗时。
+
+用法（在 code 目录）：python -m benchmarks.bench_analytics [记录数，默认 500000]
+"""
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+try:
+    from ..db import Database
+    from ..models import Record, RecordType
+    from ..services import RecordService
+    from ..analytics import AnalyticsService, rolling_mean
+except Exception:
+    from db import Database
+    from models import Record, RecordType
+    from services import RecordService
+    from analytics import AnalyticsService, rolling_mean
+
+
+def _per_row(db, start, end):
+    # 优化前的做法：取出原始行后在 Python 中逐行累加
+    monthly = defaultdict(lambda: [0.0, 0.0])
+    daily = defaultdict(float)
+    cats = defaultdict(float)
+    for r in db.query("SELECT date, amount, type, category_id FROM records WHERE date BETWEEN ? AND ?",
+                      (start.isoformat(), end.isoformat())):
+        d = date.fromisoformat(r["date"])
+        income = r["type"] == 'income'
+        monthly[(d.year, d.month)][0 if income else 1] += r["amount"]
+        daily[d] += r["amount"] if income else -r["amount"]
+        if not income:
+            cats[r["category_id"] or 'uncategorized'] += r["amount"]
+    days = (end - start).days + 1
+    series = [daily.get(start + timedelta(days=i), 0.0) for i in range(days)]
+    rolling = [sum(series[max(0, i - 29):i + 1]) / (i + 1 - max(0, i - 29)) for i in range(days)]
+    total = sum(cats.values())
+    return monthly, rolling, {k: v / total for k, v in cats.items()}
+
+
+def _vectorized(db, start, end, source='rollup'):
+    an = AnalyticsService(db)
+    cols = an.load(start, end, source=source)
+    monthly = an.series(cols, 'M', start, end)
+    rolling = rolling_mean(an.series(cols, 'D', start, end)['net'], 30)
+    return monthly, rolling, an.category_shares(cols)
+
+
+def run(n: int = 500000) -> None:
+    tf = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    tf.close()
+    db = Database(tf.name)
+    try:
+        start = date(2020, 1, 1)
+        span = 5 * 365
+        RecordService(db).add_records(
+            Record.create(float(i % 997) / 10, RecordType.EXPENSE if i % 5 else RecordType.INCOME,
+                          start + timedelta(days=i % span), category_id=f'c{i % 20}', account_id=f'a{i % 3}')
+            for i in range(n))
+        end = start + timedelta(days=span - 1)
+        for label, fn in (('per-row', _per_row),
+                          ('numpy/records', lambda *a: _vectorized(*a, source='records')),
+                          ('numpy/rollup', _vectorized)):
+            t0 = time.perf_counter()
+            fn(db, start, end)
+            print(f"{label:<14} {time.perf_counter() - t0:8.3f}s for {n:,} records")
+    finally:
+        db.close()
+        os.unlink(tf.name)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,92 @@
+"""对比 CSV 与二进制列式归档的文件大小、写出时间、重新载入数据库的时间，以及读取金额列做分析的时间。
+
+用法（在 code 目录）：python -m benchmarks.bench_archive [记录数，默认 200000]
+"""
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+try:
+    from ..db import Database
+    from ..models import Record, RecordType
+    from ..services import RecordService
+    from ..export_import import export_records, bulk_import_csv
+    from ..archive import ArchiveReader, export_archive, load_archive
+except Exception:
+    from db import Database
+    from models import Record, RecordType
+    from services import RecordService
+    from export_import import export_records, bulk_import_csv
+    from archive import ArchiveReader, export_archive, load_archive
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def _csv_expense_total(path):
+    total = 0.0
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        i_amount, i_type = header.index('amount'), header.index('type')
+        for row in reader:
+            if row[i_type] == 'expense':
+                total += float(row[i_amount])
+    return total
+
+
+def _archive_expense_total(path):
+    with ArchiveReader(path) as ar:
+        amounts, types = ar.column('amount'), ar.column('type')
+        try:
+            import numpy as np
+            total = float(np.frombuffer(amounts, dtype=np.float64)[np.frombuffer(types, dtype=np.uint8) == 0].sum())
+        except ImportError:
+            total = sum(a for a, t in zip(amounts, types) if t == 0)
+        amounts.release()
+        types.release()
+    return total
+
+
+def run(n: int = 200000) -> None:
+    tmpdir = tempfile.mkdtemp()
+    notes = ['公司楼下吃午饭', '地铁通勤', '超市采购', '房租', '工资', None]
+    tags = [['餐饮'], ['交通'], ['日用', '超市'], [], ['工资收入'], []]
+    try:
+        db = Database(os.path.join(tmpdir, 'src.db'))
+        start = date(2020, 1, 1)
+        RecordService(db).add_records(
+            Record.create(float(i % 997) / 10, RecordType.EXPENSE if i % 5 else RecordType.INCOME,
+                          start + timedelta(days=i % 1825), category_id=f'c{i % 20}', account_id=f'a{i % 3}',
+                          note=notes[i % 6], tags=tags[i % 6])
+            for i in range(n))
+        csv_path, arc_path = os.path.join(tmpdir, 'out.csv'), os.path.join(tmpdir, 'out.acar')
+        _, csv_write = _timed(lambda: export_records(db, csv_path))
+        _, arc_write = _timed(lambda: export_archive(db, arc_path))
+        db.close()
+
+        csv_db, arc_db = Database(os.path.join(tmpdir, 'csv.db')), Database(os.path.join(tmpdir, 'arc.db'))
+        _, csv_load = _timed(lambda: bulk_import_csv(csv_db, csv_path))
+        _, arc_load = _timed(lambda: load_archive(arc_db, arc_path))
+        csv_db.close()
+        arc_db.close()
+        csv_total, csv_scan = _timed(lambda: _csv_expense_total(csv_path))
+        arc_total, arc_scan = _timed(lambda: _archive_expense_total(arc_path))
+        assert abs(csv_total - arc_total) < 1e-6 * max(1.0, csv_total)
+
+        print(f"{'':<8} {'size MB':>9} {'write s':>9} {'load s':>9} {'scan s':>9}   ({n:,} records)")
+        for label, path, write, load, scan in (('csv', csv_path, csv_write, csv_load, csv_scan),
+                                               ('archive', arc_path, arc_write, arc_load, arc_scan)):
+            print(f"{label:<8} {os.path.getsize(path) / 1e6:9.1f} {write:9.3f} {load:9.3f} {scan:9.3f}")
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
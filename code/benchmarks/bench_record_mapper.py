@@ -0,0 +1,78 @@
+"""对比旧的逐行映射（sqlite3.Row + 立即解码 JSON 的 Record）与 record_from_row 的耗时和内存。
+
+用法（在 code 目录）：python -m benchmarks.bench_record_mapper [记录数，默认 200000]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+try:
+    from ..db import Database
+    from ..models import Record, RecordType
+    from ..services import RecordService, RECORD_SELECT, record_from_row
+except Exception:
+    from db import Database
+    from models import Record, RecordType
+    from services import RecordService, RECORD_SELECT, record_from_row
+
+
+def _legacy_map(r) -> Record:
+    # 优化前 list_records 中的写法
+    dstr = (r["date"] if ("date" in r.keys() and r["date"]) else date.today().isoformat())
+    account_id = (r["account_id"] if ("account_id" in r.keys() and r["account_id"]) else None)
+    return Record(
+        record_id=r["record_id"],
+        amount=r["amount"],
+        type=RecordType(r["type"]),
+        date=date.fromisoformat(dstr),
+        category_id=(r["category_id"] if ("category_id" in r.keys() and r["category_id"]) else None),
+        tags=json.loads(r["tags"] or "[]"),
+        note=r["note"],
+        attachments=json.loads(r["attachments"] or "[]"),
+        account_id=account_id,
+    )
+
+
+def _measure(label, fn, n):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(out) == n
+    print(f"{label:<10} {elapsed:8.3f}s  {n / elapsed:12,.0f} rows/s  retained {current / n:7.1f} B/record  peak {peak / 2**20:8.1f} MiB")
+    return elapsed, current
+
+
+def run(n: int = 200000) -> None:
+    tf = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    tf.close()
+    db = Database(tf.name)
+    try:
+        start = date(2020, 1, 1)
+        RecordService(db).add_records(
+            Record.create(float(i % 997), RecordType.EXPENSE if i % 5 else RecordType.INCOME, start + timedelta(days=i % 1500),
+                          category_id=f'c{i % 20}', tags=['餐饮', f't{i % 7}'], note=f'备注 {i}', account_id=f'a{i % 3}')
+            for i in range(n))
+
+        def legacy():
+            return [_legacy_map(r) for r in db.query("SELECT * FROM records")]
+
+        def mapped():
+            return [record_from_row(r) for r in db.query(f"SELECT {RECORD_SELECT} FROM records", tuples=True)]
+
+        print(f"mapping {n:,} records")
+        t_old, m_old = _measure('legacy', legacy, n)
+        t_new, m_new = _measure('mapper', mapped, n)
+        print(f"speedup x{t_old / t_new:.2f}, retained memory -{(1 - m_new / m_old):.0%}")
+    finally:
+        db.close()
+        os.unlink(tf.name)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,124 @@
+"""可复现的合成账本数据生成器。
+
+同一个 seed 总是生成完全相同的账户、分类和记录（包括 record_id），便于在不同机器和不同版本之间比较基准结果。
+分布大致模拟真实账本：
+- 每月 10 日发工资（收入），其余为日常支出；周末的支出笔数更多；
+- 各分类的金额服从对数正态分布（餐饮小额高频、房租大额低频）；
+- 备注是中文模板拼接，标签从分类对应的标签池中抽取。
+
+用法（在 code 目录）：python -m benchmarks.datagen <数据库路径> [记录数，默认 100000] [seed]
+"""
+import random
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+from typing import Iterator, List, Optional, Tuple
+try:
+    from ..db import Database
+    from ..models import Record, RecordType, Category, Account
+    from ..services import RecordService, CategoryService, AccountService
+except Exception:
+    from db import Database
+    from models import Record, RecordType, Category, Account
+    from services import RecordService, CategoryService, AccountService
+
+
+# (分类名, 对数正态 mu, sigma, 相对频率, 标签池, 备注模板)
+CATEGORY_PROFILES: List[Tuple[str, float, float, float, List[str], List[str]]] = [
+    ('餐饮', 3.2, 0.6, 30, ['午饭', '晚饭', '外卖', '咖啡'], ['公司楼下{}', '和同事吃{}', '{}外卖']),
+    ('交通', 2.5, 0.7, 15, ['地铁', '打车', '公交'], ['{}通勤', '加班{}回家']),
+    ('购物', 4.5, 1.0, 10, ['网购', '超市', '日用'], ['{}采购', '双十一{}']),
+    ('娱乐', 4.0, 0.8, 6, ['电影', '游戏', '演出'], ['周末{}', '和朋友{}']),
+    ('住房', 8.0, 0.1, 1, ['房租', '物业'], ['本月{}']),
+    ('医疗', 4.8, 1.1, 2, ['药店', '门诊'], ['{}买药', '{}挂号']),
+    ('教育', 5.5, 0.9, 2, ['课程', '书籍'], ['在线{}', '买{}']),
+    ('通讯', 4.0, 0.2, 1, ['话费', '宽带'], ['{}充值']),
+]
+INCOME_CATEGORY = '工资'
+NOTE_WORDS = ['午饭', '晚饭', '地铁', '打车', '日用品', '水果', '零食', '电影', '书', '药', '话费']
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+class LedgerGenerator:
+    """确定性的账本生成器。records() 按日期顺序产生记录，记录条数恰好为 n。"""
+    def __init__(self, n: int, seed: int = 42, start: date = date(2022, 1, 1), days: int = 3 * 365,
+                 accounts: int = 4):
+        self.n = n
+        self.seed = seed
+        self.start = start
+        self.days = days
+        rng = random.Random(seed)
+        self.categories = [Category(category_id=_uuid(rng), name=name) for name, *_ in CATEGORY_PROFILES]
+        self.income_category = Category(category_id=_uuid(rng), name=INCOME_CATEGORY)
+        names = ['现金', '招商银行', '支付宝', '微信', '信用卡', '公积金']
+        self.accounts = [Account(account_id=_uuid(rng), name=names[i % len(names)] + ('' if i < len(names) else str(i)),
+                                 type='bank', balance=round(rng.uniform(0, 20000), 2))
+                         for i in range(accounts)]
+
+    def records(self) -> Iterator[Record]:
+        rng = random.Random(self.seed + 1)
+        weights = [p[3] for p in CATEGORY_PROFILES]
+        # 周末的支出笔数是工作日的 1.5 倍；按权重把 n 条记录分到每一天
+        day_weights = [1.5 if (self.start + timedelta(days=i)).weekday() >= 5 else 1.0 for i in range(self.days)]
+        salary_days = [i for i in range(self.days) if (self.start + timedelta(days=i)).day == 10]
+        n_income = min(len(salary_days), self.n)
+        n_expense = self.n - n_income
+        total_w = sum(day_weights)
+        produced = 0
+        carry = 0.0
+        salary = set(salary_days[:n_income])
+        for i, w in enumerate(day_weights):
+            d = self.start + timedelta(days=i)
+            if i in salary:
+                yield Record(record_id=_uuid(rng), amount=round(rng.gauss(15000, 1500), 2), type=RecordType.INCOME,
+                             date=d, category_id=self.income_category.category_id, tags=['工资收入'],
+                             note=f'{d.month}月工资', account_id=self.accounts[0].account_id)
+            carry += n_expense * w / total_w
+            count = int(carry) if i < self.days - 1 else n_expense - produced
+            carry -= count
+            for _ in range(count):
+                k = rng.choices(range(len(CATEGORY_PROFILES)), weights)[0]
+                name, mu, sigma, _, tag_pool, templates = CATEGORY_PROFILES[k]
+                tags = rng.sample(tag_pool, rng.randint(0, min(2, len(tag_pool))))
+                note: Optional[str] = rng.choice(templates).format(rng.choice(NOTE_WORDS)) if rng.random() < 0.8 else None
+                yield Record(record_id=_uuid(rng), amount=round(rng.lognormvariate(mu, sigma), 2),
+                             type=RecordType.EXPENSE, date=d, category_id=self.categories[k].category_id, tags=tags,
+                             note=note, account_id=rng.choice(self.accounts).account_id)
+            produced += count
+
+    def populate(self, db: Database, batch_size: int = 50000) -> int:
+        """写入分类、账户和全部记录，返回记录数。"""
+        cs, acs, rs = CategoryService(db), AccountService(db), RecordService(db)
+        for c in self.categories + [self.income_category]:
+            cs.add_category(c)
+        for a in self.accounts:
+            acs.add_account(a)
+        total = 0
+        batch: List[Record] = []
+        for r in self.records():
+            batch.append(r)
+            if len(batch) >= batch_size:
+                total += rs.add_records(batch)
+                batch = []
+        if batch:
+            total += rs.add_records(batch)
+        return total
+
+
+def generate_ledger(db: Database, n: int, seed: int = 42, **options) -> LedgerGenerator:
+    gen = LedgerGenerator(n, seed, **options)
+    gen.populate(db)
+    return gen
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 42
+    t0 = time.perf_counter()
+    generate_ledger(Database(path), count, seed)
+    print(f"generated {count:,} records into {path} in {time.perf_counter() - t0:.1f}s")
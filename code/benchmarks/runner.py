@@ -0,0 +1,243 @@
+"""基准测试运行器：在不同数据规模下计时各服务方法，输出 JSON，并与基线比较。
+
+每个规模用 datagen 生成一份固定 seed 的账本（缓存在 --cache-dir 中可跨次复用），
+每个用例重复 --repeat 次，记录 p50/p95 延迟；另外在 tracemalloc 下单独运行一次，记录 Python 侧的峰值内存
+（SQLite 自己的页缓存不在统计范围内）。
+
+用法（在 code 目录）：
+    python -m benchmarks.runner --sizes 10000,100000 --out bench.json
+    python -m benchmarks.runner --sizes 10000 --baseline benchmarks/baseline.json        # 回归检查，超出阈值时退出码为 1
+    python -m benchmarks.runner --sizes 10000 --baseline benchmarks/baseline.json --update-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+try:
+    from ..db import Database
+    from ..models import Budget, Record, RecordType
+    from ..services import (AccountService, BudgetService, CategoryService, RecordService, StatisticsService,
+                            SearchService)
+    from ..export_import import export_records, bulk_import_csv
+    from .datagen import LedgerGenerator
+except Exception:
+    from db import Database
+    from models import Budget, Record, RecordType
+    from services import (AccountService, BudgetService, CategoryService, RecordService, StatisticsService,
+                          SearchService)
+    from export_import import export_records, bulk_import_csv
+    from benchmarks.datagen import LedgerGenerator
+
+
+# 默认阈值：p50 比基线慢 30% 以上且绝对差超过 MIN_REGRESSION_MS 才算回归，避免把毫秒级抖动当成回归
+DEFAULT_THRESHOLD = 1.3
+MIN_REGRESSION_MS = 2.0
+
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值的分位数，q 取 0..100。"""
+    s = sorted(values)
+    if not s:
+        return 0.0
+    k = (len(s) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def measure(fn: Callable[[], Any], repeat: int, setup: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    """运行 fn repeat 次（每次前调用 setup），返回 p50/p95/min 毫秒和 tracemalloc 峰值 KiB。"""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'p50_ms': round(percentile(times, 50), 3), 'p95_ms': round(percentile(times, 95), 3),
+            'min_ms': round(min(times), 3), 'peak_kb': round(peak / 1024, 1), 'runs': repeat}
+
+
+def _cases(db: Database, gen: LedgerGenerator, workdir: str) -> List[Tuple[str, Callable[[], Any], Optional[Callable[[], None]], int]]:
+    """(名称, 函数, 每次运行前的准备, 重复次数的除数)。写入类和全量类用例较慢，少跑几次。"""
+    rs, stats, search = RecordService(db), StatisticsService(db), SearchService(db)
+    start = gen.start
+    end = gen.start + timedelta(days=gen.days - 1)
+    month_end = start + timedelta(days=30)
+    account = gen.accounts[1].account_id
+    csv_path = os.path.join(workdir, 'export.csv')
+    import_db_path = os.path.join(workdir, 'import.db')
+    count = db.query("SELECT COUNT(*) FROM records")[0][0]
+
+    def reset_import_db():
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(import_db_path + suffix):
+                os.unlink(import_db_path + suffix)
+
+    def import_csv():
+        target = Database(import_db_path)
+        try:
+            bulk_import_csv(target, csv_path)
+        finally:
+            target.close()
+
+    def reset_ledger_import_db():
+        # 完整的派生表链路：导入目标已有账户、分类和预算，余额、预算计数器都要随导入更新
+        reset_import_db()
+        target = Database(import_db_path)
+        try:
+            for c in gen.categories + [gen.income_category]:
+                CategoryService(target).add_category(c)
+            for a in gen.accounts:
+                AccountService(target).add_account(a)
+            BudgetService(target).set_budget(Budget(budget_id='all', category_id=None, limit=5000.0, period='monthly'))
+            for c in gen.categories:
+                BudgetService(target).set_budget(Budget(budget_id=c.category_id, category_id=c.category_id,
+                                                        limit=1000.0, period='weekly'))
+        finally:
+            target.close()
+
+    inserted: List[str] = []
+
+    def add_batch():
+        batch = [Record.create(12.5, RecordType.EXPENSE, month_end, account_id=account, note='基准测试')
+                 for _ in range(1000)]
+        rs.add_records(batch)
+        inserted.extend(r.record_id for r in batch)
+
+    def drop_inserted():
+        if inserted:
+            rs.delete_records(inserted)
+            inserted.clear()
+
+    export_records(db, csv_path)
+    return [
+        ('stats.summary_all', lambda: stats.summary(start, end), None, 1),
+        ('stats.summary_account_month', lambda: stats.summary(start, month_end, account), None, 1),
+        ('stats.by_category', lambda: stats.by_category(start, end), None, 1),
+        ('stats.by_tag_month', lambda: stats.by_tag(start, month_end), None, 1),
+        ('search.text', lambda: search.search('公司楼下'), None, 1),
+        ('search.tags_any', lambda: search.search(tags_any=['打车'], start=start, end=month_end), None, 1),
+        ('records.list_first_page', lambda: rs.list_records(limit=50), None, 1),
+        ('records.list_deep_offset', lambda: rs.list_records(limit=50, offset=max(0, count - 100)), None, 1),
+        ('records.list_page_keyset', lambda: rs.list_records_page(limit=50, filters={'account_id': account}), None, 1),
+        ('records.iter_all', lambda: sum(1 for _ in rs.iter_records()), None, 5),
+        ('records.add_batch_1000', add_batch, drop_inserted, 2),
+        ('csv.export', lambda: export_records(db, csv_path), None, 5),
+        ('csv.import', import_csv, reset_import_db, 5),
+        ('csv.import_ledger', import_csv, reset_ledger_import_db, 5),
+    ]
+
+
+def _dataset(size: int, seed: int, cache_dir: str) -> Tuple[str, LedgerGenerator]:
+    gen = LedgerGenerator(size, seed)
+    path = os.path.join(cache_dir, f'ledger-{size}-{seed}.db')
+    if not os.path.exists(path):
+        tmp = path + '.tmp'
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        db = Database(tmp)
+        gen.populate(db)
+        db.close()
+        os.replace(tmp, path)
+    return path, gen
+
+
+def run_benchmarks(sizes: List[int], repeat: int = 20, seed: int = 42, cache_dir: Optional[str] = None,
+                   only: Optional[List[str]] = None, log: Callable[[str], None] = print) -> Dict[str, Any]:
+    cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'acct-bench')
+    os.makedirs(cache_dir, exist_ok=True)
+    results: Dict[str, Dict[str, float]] = {}
+    for size in sizes:
+        path, gen = _dataset(size, seed, cache_dir)
+        workdir = tempfile.mkdtemp()
+        # 在副本上运行，写入类用例不会改动缓存的数据集
+        work_path = os.path.join(workdir, 'bench.db')
+        shutil.copy2(path, work_path)
+        db = Database(work_path)
+        try:
+            for name, fn, setup, divisor in _cases(db, gen, workdir):
+                if only and not any(name.startswith(o) for o in only):
+                    continue
+                key = f'{size}/{name}'
+                results[key] = measure(fn, max(1, repeat // divisor), setup)
+                r = results[key]
+                log(f"{key:<40} p50 {r['p50_ms']:10.3f} ms  p95 {r['p95_ms']:10.3f} ms  peak {r['peak_kb']:10.1f} KiB")
+        finally:
+            db.close()
+            shutil.rmtree(workdir)
+    return {
+        'meta': {'seed': seed, 'repeat': repeat, 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                 'platform': platform.platform(), 'date': date.today().isoformat()},
+        'results': results,
+    }
+
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD,
+                        min_ms: float = MIN_REGRESSION_MS) -> List[str]:
+    """返回回归描述列表：p50 超过基线 threshold 倍且绝对差超过 min_ms 的用例。基线中没有的用例不参与比较。"""
+    regressions = []
+    for key, cur in results['results'].items():
+        base = baseline.get('results', {}).get(key)
+        if not base:
+            continue
+        if cur['p50_ms'] > base['p50_ms'] * threshold and cur['p50_ms'] - base['p50_ms'] > min_ms:
+            regressions.append(f"{key}: p50 {cur['p50_ms']:.3f} ms vs baseline {base['p50_ms']:.3f} ms "
+                               f"(x{cur['p50_ms'] / base['p50_ms']:.2f} > x{threshold})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--sizes', default='10000,100000', help='comma-separated record counts, e.g. 10000,1000000')
+    p.add_argument('--repeat', type=int, default=20)
+    p.add_argument('--seed', type=int, default=42)
+    p.add_argument('--only', help='comma-separated case name prefixes, e.g. stats.,search.')
+    p.add_argument('--cache-dir', help='where generated datasets are kept between runs')
+    p.add_argument('--out', help='write results JSON here')
+    p.add_argument('--baseline', help='baseline JSON to compare against')
+    p.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    p.add_argument('--update-baseline', action='store_true', help='write the results to --baseline instead of comparing')
+    args = p.parse_args(argv)
+
+    results = run_benchmarks([int(s) for s in args.sizes.split(',')], args.repeat, args.seed, args.cache_dir,
+                             args.only.split(',') if args.only else None)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        if args.update_baseline or not os.path.exists(args.baseline):
+            with open(args.baseline, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+            print(f'baseline written to {args.baseline}')
+            return 0
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print('REGRESSIONS:')
+            for line in regressions:
+                print('  ' + line)
+            return 1
+        print('no regressions against', args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
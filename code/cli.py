@@ -1,17 +1,34 @@
+# Only export_import is imported inside its handlers (_cmd_import/_cmd_export). Everything else loads
+# here: services already pulls in archival and currency, and every writing command runs the recurring
+# materializer, so deferring those imports would not shorten startup.
 try:
     # package-relative imports
-    from .db import Database
-    from .services import RecordService, CategoryService, BudgetService, NotificationService, StatisticsService
-    from .models import Record, RecordType, Category, Budget, Notification
+    from .db import Database, list_backups
+    from .services import RecordService, CategoryService, BudgetService, NotificationService, StatisticsService, SearchService, ReferenceCache
+    from .models import Record, RecordType, Category, Budget, Notification, Account, RecurringRule
     from .utils import parse_date
+    from .query import RecordQuery
+    from .currency import BASE_CURRENCY, load_rates
+    from .archival import ArchiveSet
+    from .recurring import FREQUENCIES, RecurringService
 except Exception:
     # fallback when running script directly from code/ folder
-    from db import Database
-    from services import RecordService, CategoryService, BudgetService, NotificationService, StatisticsService
-    from models import Record, RecordType, Category, Budget, Notification
+    from db import Database, list_backups
+    from services import RecordService, CategoryService, BudgetService, NotificationService, StatisticsService, SearchService, ReferenceCache
+    from models import Record, RecordType, Category, Budget, Notification, Account, RecurringRule
     from utils import parse_date
+    from query import RecordQuery
+    from currency import BASE_CURRENCY, load_rates
+    from archival import ArchiveSet
+    from recurring import FREQUENCIES, RecurringService
 
-from datetime import date
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO
+import argparse
+import json
+import shlex
+import sqlite3
+import sys
 import uuid
 
 
@@ -61,6 +78,8 @@ def run_cli(db_path: str = None):
     except Exception:
         from .services import AccountService
     asvc = AccountService(db)
+    # 分类/账户的缓存映射，只在它们被修改（包括其他进程修改）后才重新查询
+    ref = ReferenceCache.for_db(db)
 
     print("Simple Accounting CLI. Type 'help' for commands.")
     while True:
@@ -74,14 +93,12 @@ def run_cli(db_path: str = None):
         if cmd in ('q', 'quit', 'exit'):
             break
         if cmd == 'help':
-            print("commands: add, list, stats, addcat, listcat, addacct, listacct, delrec, delacct, delcat, reset, showrecords, help, exit")
+            print("commands: add, list, stats, addcat, listcat, addacct, listacct, delrec, delacct, delcat, reset, restore, showrecords, reindex, rollup, profile, help, exit")
             continue
         if cmd == 'addacct':
             # create a new account
             name = input('account name: ').strip()
-            from uuid import uuid4
-            from models import Account
-            acc = Account(account_id=str(uuid4()), name=name)
+            acc = Account(account_id=str(uuid.uuid4()), name=name)
             asvc.add_account(acc)
             # For user friendliness, do not show full UUIDs; show name and short id
             print('account added:', acc.name, f"(id={acc.account_id[:8]}...)")
@@ -96,14 +113,12 @@ def run_cli(db_path: str = None):
             rtype = _ask_type('type (income/expense): ')
             d = _ask_date('date (YYYY-MM-DD, optional): ')
             # Account selection (required for scheme B): ensure at least one account exists
-            accs = asvc.list_accounts()
+            accs = ref.accounts()
             if not accs:
                 print('No accounts found. Creating a default account named "默认账户".')
-                from uuid import uuid4
-                from models import Account
-                default_acc = Account(account_id=str(uuid4()), name='默认账户')
+                default_acc = Account(account_id=str(uuid.uuid4()), name='默认账户')
                 asvc.add_account(default_acc)
-                accs = asvc.list_accounts()
+                accs = ref.accounts()
             # Prompt user to choose account by index (required)
             while True:
                 print('Choose an account by index:')
@@ -140,22 +155,25 @@ def run_cli(db_path: str = None):
                         print('invalid input, leaving as 其他')
             else:
                 # no categories defined; create '其他' automatically
-                from uuid import uuid4
-                from models import Category
-                other = Category(category_id=str(uuid4()), name='其他')
+                other = Category(category_id=str(uuid.uuid4()), name='其他')
                 cs.add_category(other)
                 cat = other.category_id
             note = input('note (optional): ').strip() or None
             r = Record.create(amount=amount, rtype=rtype, date_obj=d, category_id=cat, note=note, account_id=account_id)
-            rs.add_record(r)
+            with db.transaction():
+                # 写入前补写到期的周期性记录（没有到期的规则时只是一次查询）
+                added = RecurringService(db).materialize()
+                rs.add_record(r)
+            if added:
+                print(f"{added} recurring record(s) added")
             # Do not print full UUID to user; show short id
             print('added:', f"{r.amount} {r.type.value} on {r.date.isoformat()} (id={r.record_id[:8]}...)")
             continue
         if cmd == 'list':
             rows = rs.list_records(50, 0)
             # build category id -> name map and account id -> name map
-            cat_map = {c.category_id: c.name for c in cs.list_categories()}
-            acc_map = {a.account_id: a.name for a in asvc.list_accounts()}
+            cat_map = ref.category_names()
+            acc_map = ref.account_names()
             for idx, r in enumerate(rows, start=1):
                 cname = cat_map.get(r.category_id, '其他') if r.category_id else '其他'
                 aname = acc_map.get(r.account_id, '无账户') if getattr(r, 'account_id', None) else '无账户'
@@ -165,7 +183,7 @@ def run_cli(db_path: str = None):
             continue
         if cmd == 'stats':
             # Simplified stats: choose account and show account_summary (all time)
-            accs = asvc.list_accounts()
+            accs = ref.accounts()
             if not accs:
                 print('No accounts found. Please create an account first (addacct).')
                 continue
@@ -192,7 +210,7 @@ def run_cli(db_path: str = None):
 
         if cmd == 'showrecords':
             # New filter: choose account (required), choose category (optional), choose date range (optional), then list matching records
-            accs = asvc.list_accounts()
+            accs = ref.accounts()
             if not accs:
                 print('No accounts found. Please create an account first (addacct).')
                 continue
@@ -269,24 +287,7 @@ def run_cli(db_path: str = None):
             else:
                 end = None
 
-            # Build SQL
-            sql = "SELECT * FROM records WHERE account_id = ?"
-            params = [account_choice]
-            if category_choice:
-                sql += " AND category_id = ?"
-                params.append(category_choice)
-            if start and end:
-                sql += " AND date BETWEEN ? AND ?"
-                params.extend([start.isoformat(), end.isoformat()])
-            elif start and not end:
-                sql += " AND date >= ?"
-                params.append(start.isoformat())
-            elif end and not start:
-                sql += " AND date <= ?"
-                params.append(end.isoformat())
-            sql += " ORDER BY date DESC"
-
-            rows = db.query(sql, tuple(params))
+            rows = rs.find(RecordQuery(start=start, end=end, account_id=account_choice, category_id=category_choice))
             # prepare maps
             cat_map = {c.category_id: c.name for c in cats}
             acc_map = {a.account_id: a.name for a in accs}
@@ -294,11 +295,38 @@ def run_cli(db_path: str = None):
                 print('No records found for the given filters.')
             else:
                 for idx, r in enumerate(rows, start=1):
-                    cname = cat_map.get(r['category_id'], '其他') if r['category_id'] else '其他'
-                    aname = acc_map.get(r['account_id'], '未知账户')
-                    rec_id = r['record_id'] if 'record_id' in r.keys() else None
-                    short_id = (rec_id[:8] + '...') if rec_id else ''
-                    print(f"{idx}) {r['date']} {r['type']} {r['amount']} {cname} {aname} {r['note']} {short_id}")
+                    cname = cat_map.get(r.category_id, '其他') if r.category_id else '其他'
+                    aname = acc_map.get(r.account_id, '未知账户')
+                    short_id = r.record_id[:8] + '...'
+                    print(f"{idx}) {r.date.isoformat()} {r.type.value} {r.amount} {cname} {aname} {r.note} {short_id}")
+            continue
+        if cmd == 'reindex':
+            # 重建全文搜索索引（旧数据库首次升级后或外部 VACUUM 之后）
+            n = SearchService(db).rebuild_index()
+            print(f'search index rebuilt: {n} records')
+            continue
+        if cmd == 'rollup':
+            # 校验统计用的日汇总表，发现偏差时自动重建
+            drift = stats.verify_rollup(repair=True)
+            print(f'rollup drift rows: {len(drift)}' + (' (repaired)' if drift else ''))
+            continue
+        if cmd == 'profile' or cmd.startswith('profile '):
+            # profile on [慢查询阈值毫秒] | off | reset；不带参数时输出统计
+            args = cmd.split()[1:]
+            if args and args[0] == 'on':
+                slow_ms = float(args[1]) if len(args) > 1 else 100.0
+                db.enable_profiling(slow_ms)
+                print(f'profiling on (slow query threshold {slow_ms:g} ms)')
+            elif args and args[0] == 'off':
+                db.disable_profiling()
+                print('profiling off')
+            elif db.profiler is None:
+                print("profiling is off; use 'profile on [ms]'")
+            elif args and args[0] == 'reset':
+                db.profiler.reset()
+                print('profile reset')
+            else:
+                print(db.profiler.report())
             continue
         if cmd == 'addcat':
             name = input('name: ')
@@ -318,10 +346,10 @@ def run_cli(db_path: str = None):
                 print('No records available to delete.')
                 continue
             print('Recent records:')
+            # category and account maps for display
+            catmap = ref.category_names()
+            accmap = ref.account_names()
             for i, r in enumerate(recent, start=1):
-                # build category and account maps for display
-                catmap = {c.category_id: c.name for c in cs.list_categories()}
-                accmap = {a.account_id: a.name for a in asvc.list_accounts()}
                 cname = catmap.get(r.category_id, '其他') if r.category_id else '其他'
                 aname = accmap.get(r.account_id, '无账户') if getattr(r, 'account_id', None) else '无账户'
                 short_id = (r.record_id[:8] + '...') if getattr(r, 'record_id', None) else ''
@@ -351,7 +379,7 @@ def run_cli(db_path: str = None):
             print('deleted' if ok else 'record not found')
             continue
         if cmd == 'delacct':
-            accs = asvc.list_accounts()
+            accs = ref.accounts()
             if not accs:
                 print('No accounts found.')
                 continue
@@ -418,17 +446,16 @@ def run_cli(db_path: str = None):
             print('deleted' if ok else 'cannot delete category (has dependent records)')
             continue
         if cmd == 'reset':
-            print('WARNING: this will delete ALL user data (records, accounts, categories, budgets, notifications)')
+            print('WARNING: this will delete ALL user data (records, archives, accounts, categories, budgets, '
+                  'recurring rules, exchange rates, notifications)')
             confirm = input("Type YES to proceed and create a backup: ").strip()
             if confirm != 'YES':
                 print('aborted')
                 continue
             # create backup first
-            import time
-            backup_path = str(db.path) + '.backup.' + time.strftime('%Y%m%d%H%M%S')
             try:
-                db.backup(backup_path)
-                print('backup saved to', backup_path)
+                st = db.backup_rotating()
+                print(f'backup saved to {st.path} ({st.bytes_done / 1e6:.1f} MB, {st.bytes_per_second / 1e6:.1f} MB/s)')
             except Exception as e:
                 print('backup failed:', e)
                 # still proceed only if user re-confirms
@@ -436,18 +463,360 @@ def run_cli(db_path: str = None):
                 if more != 'YES':
                     print('aborted')
                     continue
-            # delete all rows
-            db.execute('DELETE FROM records')
-            db.execute('DELETE FROM accounts')
-            db.execute('DELETE FROM categories')
-            db.execute('DELETE FROM budgets')
-            db.execute('DELETE FROM notifications')
+            # delete all rows; archived records are only summarised in main, so their tables go too
+            archives = ArchiveSet.for_db(db)
+            archive_files = archives.files()
+            archives.detach_all()
+            with db.transaction():
+                for table in ('records', 'accounts', 'categories', 'budgets', 'notifications', 'daily_rollup',
+                              'archived_rollup', 'archives', 'balance_checkpoints', 'budget_spend', 'exchange_rates',
+                              'recurring_rules'):
+                    db.execute(f'DELETE FROM {table}')
+            db.bump_generation()
+            # the backup carries copies of the archive databases; 'restore' puts them back
+            for path in archive_files.values():
+                if path.exists():
+                    path.unlink()
             print('database reset complete')
             continue
+        if cmd == 'restore':
+            backups = list_backups(db.path.parent / 'backups', db.path.stem)
+            if not backups:
+                print('no backups found')
+                continue
+            for i, p in enumerate(backups, 1):
+                print(f"{i}) {p.name}")
+            sel = input('Select backup number to restore: ').strip()
+            try:
+                src = backups[int(sel) - 1]
+            except Exception:
+                print('invalid selection')
+                continue
+            if input(f"Type YES to replace current data with {src.name}: ").strip() != 'YES':
+                print('aborted')
+                continue
+            try:
+                st = db.restore(str(src))
+                print(f'restored {st.bytes_done / 1e6:.1f} MB in {st.seconds:.2f}s')
+            except Exception as e:
+                print('restore failed:', e)
+            continue
         print('unknown command')
 
     db.close()
 
 
+# ---------------------------------------------------------------------------
+# 非交互的子命令模式：python -m cli [--db PATH] <command> [options]
+#
+# 每条结果输出为一行 JSON（JSON Lines），便于脚本处理；出错时输出 {"error": ...} 并以非零码退出。
+# batch 子命令从文件或标准输入逐行读取同样格式的命令，全部在同一个事务中执行，任一条失败则整体回滚。
+# 导入/导出相关的模块只在用到时才导入，单次 stats 之类的调用启动更快。
+# ---------------------------------------------------------------------------
+
+class CommandError(Exception):
+    """子命令的参数错误或执行失败。"""
+
+
+class _ArgumentParser(argparse.ArgumentParser):
+    # batch 中的某一行参数有误时不能直接 sys.exit，改为抛出异常由调用方处理
+    def error(self, message):
+        raise CommandError(message)
+
+
+def _record_json(r: Record, ref: ReferenceCache) -> Dict[str, Any]:
+    cat, acc = ref.category(r.category_id), ref.account(r.account_id)
+    return {'record_id': r.record_id, 'date': r.date.isoformat(), 'type': r.type.value, 'amount': r.amount,
+            'category_id': r.category_id, 'category': cat.name if cat else None,
+            'account_id': r.account_id, 'account': acc.name if acc else None,
+            'tags': list(r.tags), 'note': r.note}
+
+
+def _resolve(kind: str, value: Optional[str], by_id: Callable, by_name: Callable) -> Optional[str]:
+    """按 id 或名称查找分类/账户，返回 id。"""
+    if not value:
+        return None
+    found = by_id(value) or by_name(value)
+    if found is None:
+        raise CommandError(f'unknown {kind}: {value}')
+    return found.category_id if kind == 'category' else found.account_id
+
+
+def _filters(args: argparse.Namespace, ref: ReferenceCache) -> RecordQuery:
+    return RecordQuery(start=args.start, end=args.end, type=args.type, min_amount=args.min_amount,
+                       max_amount=args.max_amount, text=getattr(args, 'text', None) or "",
+                       tags_any=tuple(t for t in (args.tags or '').split(',') if t),
+                       account_id=_resolve('account', args.account, ref.account, ref.account_by_name),
+                       category_id=_resolve('category', args.category, ref.category, ref.category_by_name))
+
+
+def _cmd_add(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    ref = ReferenceCache.for_db(db)
+    r = Record.create(args.amount, RecordType(args.type), args.date or date.today(),
+                      category_id=_resolve('category', args.category, ref.category, ref.category_by_name),
+                      account_id=_resolve('account', args.account, ref.account, ref.account_by_name),
+                      tags=[t for t in (args.tags or '').split(',') if t], note=args.note)
+    RecordService(db).add_record(r)
+    yield {'added': r.record_id}
+
+
+def _cmd_list(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    ref = ReferenceCache.for_db(db)
+    records, cursor = RecordService(db).list_records_page(args.limit, args.cursor, _filters(args, ref))
+    for r in records:
+        yield _record_json(r, ref)
+    if cursor:
+        yield {'next_cursor': cursor}
+
+
+def _cmd_showrecords(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    ref = ReferenceCache.for_db(db)
+    for r in RecordService(db).iter_records(_filters(args, ref)):
+        yield _record_json(r, ref)
+
+
+def _cmd_stats(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    ref = ReferenceCache.for_db(db)
+    account_id = _resolve('account', args.account, ref.account, ref.account_by_name)
+    start, end = args.start or date.min, args.end or date.max
+    stats = StatisticsService(db)
+    out = stats.summary(start, end, account_id, args.currency)
+    names = ref.category_names()
+    out['by_category'] = {names.get(cid, cid): total
+                          for cid, total in stats.by_category(start, end, account_id, args.currency).items()}
+    out['currency'] = (args.currency or BASE_CURRENCY).upper()
+    yield out
+
+
+def _cmd_rates(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    yield {'loaded': load_rates(db, args.path)}
+
+
+def _cmd_import(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    try:
+        from .export_import import bulk_import_csv
+    except Exception:
+        from export_import import bulk_import_csv
+    result = bulk_import_csv(db, args.path)
+    yield {'added': result.added, 'skipped': result.skipped, 'malformed': result.malformed}
+
+
+def _cmd_export(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    try:
+        from .export_import import export_records
+    except Exception:
+        from export_import import export_records
+    ref = ReferenceCache.for_db(db)
+    st = export_records(db, args.path, query=_filters(args, ref).replace(order=None))
+    yield {'exported': st.rows, 'path': args.path, 'seconds': round(st.seconds, 3)}
+
+
+def _rule_json(rule: RecurringRule, ref: ReferenceCache) -> Dict[str, Any]:
+    cat, acc = ref.category(rule.category_id), ref.account(rule.account_id)
+    return {'rule_id': rule.rule_id, 'amount': rule.amount, 'type': rule.type.value, 'frequency': rule.frequency,
+            'interval': rule.interval, 'start': rule.start.isoformat(), 'end': rule.end.isoformat() if rule.end else None,
+            'category': cat.name if cat else None, 'account': acc.name if acc else None, 'tags': rule.tags,
+            'note': rule.note,
+            'materialized_through': rule.materialized_through.isoformat() if rule.materialized_through else None}
+
+
+def _cmd_recur_add(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    ref = ReferenceCache.for_db(db)
+    rule = RecurringRule(rule_id=args.id or str(uuid.uuid4()), amount=args.amount, type=RecordType(args.type),
+                         frequency=args.every, start=args.start or date.today(), interval=args.interval, end=args.end,
+                         category_id=_resolve('category', args.category, ref.category, ref.category_by_name),
+                         account_id=_resolve('account', args.account, ref.account, ref.account_by_name),
+                         tags=[t for t in (args.tags or '').split(',') if t], note=args.note)
+    RecurringService(db).add_rule(rule)
+    yield {'added_rule': rule.rule_id}
+
+
+def _cmd_recur_list(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    ref = ReferenceCache.for_db(db)
+    for rule in RecurringService(db).list_rules():
+        yield _rule_json(rule, ref)
+
+
+def _cmd_recur_delete(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    if not RecurringService(db).delete_rule(args.rule_id):
+        raise CommandError(f'rule not found: {args.rule_id}')
+    yield {'deleted_rule': args.rule_id}
+
+
+def _cmd_recur_run(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    yield {'materialized': RecurringService(db).materialize(args.through)}
+
+
+def _cmd_recur_upcoming(db: Database, args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    ref = ReferenceCache.for_db(db)
+    start = args.start or date.today()
+    for r in RecurringService(db).upcoming(start, args.end or start + timedelta(days=args.days)):
+        yield _record_json(r, ref)
+
+
+def _add_filter_options(p: argparse.ArgumentParser) -> None:
+    p.add_argument('--account', help='account name or id')
+    p.add_argument('--category', help='category name or id')
+    p.add_argument('--type', choices=[t.value for t in RecordType])
+    p.add_argument('--start', type=parse_date, help='YYYY-MM-DD')
+    p.add_argument('--end', type=parse_date, help='YYYY-MM-DD')
+    p.add_argument('--min-amount', type=float)
+    p.add_argument('--max-amount', type=float)
+    p.add_argument('--tags', help='comma-separated; records with any of these tags')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = _ArgumentParser(prog='cli', description='Simple Accounting CLI (interactive when no command is given)')
+    parser.add_argument('--db', help='database path (default: ./accounting.db)')
+    sub = parser.add_subparsers(dest='command')
+
+    p = sub.add_parser('add', help='add a record')
+    p.add_argument('--amount', type=float, required=True)
+    p.add_argument('--type', choices=[t.value for t in RecordType], default=RecordType.EXPENSE.value)
+    p.add_argument('--date', type=parse_date, help='YYYY-MM-DD (default: today)')
+    p.add_argument('--account', help='account name or id')
+    p.add_argument('--category', help='category name or id')
+    p.add_argument('--tags', help='comma-separated tags')
+    p.add_argument('--note')
+    p.set_defaults(handler=_cmd_add, materialize=True)
+
+    p = sub.add_parser('list', help='list records, newest first, one page at a time')
+    p.add_argument('--limit', type=int, default=50)
+    p.add_argument('--cursor', help='next_cursor from the previous page')
+    _add_filter_options(p)
+    p.set_defaults(handler=_cmd_list)
+
+    p = sub.add_parser('showrecords', help='stream every record matching the filters')
+    _add_filter_options(p)
+    p.add_argument('--text', help='full-text search over notes and tags')
+    p.set_defaults(handler=_cmd_showrecords)
+
+    p = sub.add_parser('stats', help='income/expense summary and totals by category')
+    p.add_argument('--account', help='account name or id')
+    p.add_argument('--start', type=parse_date, help='YYYY-MM-DD')
+    p.add_argument('--end', type=parse_date, help='YYYY-MM-DD')
+    p.add_argument('--currency', help='report currency (default: CNY); other currencies are converted at daily rates')
+    p.set_defaults(handler=_cmd_stats)
+
+    p = sub.add_parser('rates', help='load exchange rates from CSV with columns date,currency,rate (.gz supported)')
+    p.add_argument('path')
+    p.set_defaults(handler=_cmd_rates)
+
+    p = sub.add_parser('recur', help='recurring records: add/list/delete rules, run the scheduler, preview upcoming')
+    recur = p.add_subparsers(dest='action', required=True)
+    r = recur.add_parser('add', help='add a recurring rule')
+    r.add_argument('--amount', type=float, required=True)
+    r.add_argument('--type', choices=[t.value for t in RecordType], default=RecordType.EXPENSE.value)
+    r.add_argument('--every', choices=FREQUENCIES, default='monthly')
+    r.add_argument('--interval', type=int, default=1, help='every N days/weeks/months/years')
+    r.add_argument('--start', type=parse_date, help='first occurrence, YYYY-MM-DD (default: today)')
+    r.add_argument('--end', type=parse_date, help='last possible occurrence, YYYY-MM-DD')
+    r.add_argument('--account', help='account name or id')
+    r.add_argument('--category', help='category name or id')
+    r.add_argument('--tags', help='comma-separated tags')
+    r.add_argument('--note')
+    r.add_argument('--id', help='rule id (default: generated)')
+    r.set_defaults(handler=_cmd_recur_add)
+    r = recur.add_parser('list', help='list rules')
+    r.set_defaults(handler=_cmd_recur_list)
+    r = recur.add_parser('delete', help='delete a rule (records already written are kept)')
+    r.add_argument('rule_id')
+    r.set_defaults(handler=_cmd_recur_delete)
+    r = recur.add_parser('run', help='write every occurrence due up to --through (default: today)')
+    r.add_argument('--through', type=parse_date, help='YYYY-MM-DD')
+    r.set_defaults(handler=_cmd_recur_run)
+    r = recur.add_parser('upcoming', help='occurrences not written yet, without writing them')
+    r.add_argument('--start', type=parse_date, help='YYYY-MM-DD (default: today)')
+    r.add_argument('--end', type=parse_date, help='YYYY-MM-DD (default: start + --days)')
+    r.add_argument('--days', type=int, default=30)
+    r.set_defaults(handler=_cmd_recur_upcoming)
+
+    p = sub.add_parser('import', help='import records from CSV (.gz supported)')
+    p.add_argument('path')
+    p.set_defaults(handler=_cmd_import, materialize=True)
+
+    p = sub.add_parser('export', help='export records to CSV (.gz supported)')
+    p.add_argument('path')
+    _add_filter_options(p)
+    p.set_defaults(handler=_cmd_export)
+
+    p = sub.add_parser('batch', help='run commands read from a file (or - for stdin) in one transaction')
+    p.add_argument('file', nargs='?', default='-')
+    return parser
+
+
+def _emit(out: TextIO, obj: Dict[str, Any]) -> None:
+    out.write(json.dumps(obj, ensure_ascii=False, default=str) + '\n')
+
+
+def _run_command(db: Database, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """执行一条已解析的命令并收集结果。写入记录的命令（materialize=True）先在同一事务中补写到期的周期性记录，
+    只读命令不写数据库。"""
+    if getattr(args, 'materialize', False):
+        RecurringService(db).materialize()
+    return list(args.handler(db, args))
+
+
+def run_batch(db: Database, lines: Iterator[str], out: TextIO = sys.stdout,
+              parser: Optional[argparse.ArgumentParser] = None) -> int:
+    """在一个事务中依次执行 lines 中的命令（每行一条，格式同命令行参数，# 开头为注释），返回执行的条数。
+
+    任一条出错时回滚全部修改并抛出 CommandError（消息中带行号）。各条的结果缓存到提交之后才写入 out，
+    回滚时不会输出任何结果。
+    """
+    parser = parser or build_parser()
+    count = 0
+    results: List[Dict[str, Any]] = []
+    with db.transaction():
+        for lineno, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                args = parser.parse_args(shlex.split(line))
+                if args.command in (None, 'batch'):
+                    raise CommandError('expected a command other than batch')
+                results.extend(_run_command(db, args))
+            except (CommandError, ValueError, sqlite3.Error) as e:
+                raise CommandError(f'line {lineno}: {e}') from e
+            count += 1
+    for obj in results:
+        _emit(out, obj)
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except CommandError as e:
+        parser.print_usage(sys.stderr)
+        _emit(sys.stdout, {'error': str(e)})
+        return 2
+    if args.command is None:
+        run_cli(args.db)
+        return 0
+    db = Database(args.db)
+    try:
+        if args.command == 'batch':
+            if args.file == '-':
+                n = run_batch(db, sys.stdin, parser=parser)
+            else:
+                with open(args.file, encoding='utf-8') as f:
+                    n = run_batch(db, f, parser=parser)
+            _emit(sys.stdout, {'committed': n})
+        else:
+            with db.transaction():
+                results = _run_command(db, args)
+            for obj in results:
+                _emit(sys.stdout, obj)
+    except (CommandError, ValueError, OSError, sqlite3.Error) as e:
+        _emit(sys.stdout, {'error': str(e)})
+        return 1
+    finally:
+        db.close()
+    return 0
+
+
 if __name__ == '__main__':
-    run_cli()
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""多币种：本地汇率表、按日期取汇率（as-of）和统计时的换算。
+
+- 每条记录的币种是其账户的币种（Account.currency，默认 CNY）；没有账户的记录按 BASE_CURRENCY 处理；
+- exchange_rates(currency, day, rate) 记录 1 单位外币在 day 当天折合多少 BASE_CURRENCY，主键 (currency, day)
+  本身就是 as-of 查找用的索引：某日的汇率取该日及以前最近的一条；早于第一条汇率的日期用第一条；
+- 统计在 SQL 中换算（rate_factor_sql），只有币种与报告币种不同的账户的记录需要查汇率，见 StatisticsService；
+  Python 中的单次换算用带 LRU 缓存的 RateResolver。
+
+汇率文件为 CSV，表头 date,currency,rate（可 .gz 压缩），用 load_rates() 导入。
+"""
+import csv
+import gzip
+import weakref
+from datetime import date
+from functools import lru_cache
+from typing import Iterable, List, Set, Tuple
+try:
+    from .db import Database
+except Exception:
+    from db import Database
+
+
+BASE_CURRENCY = 'CNY'
+RATE_CACHE_SIZE = 4096
+
+
+def _as_of_sql(cur: str, day: str) -> str:
+    """cur 币种在 day 当天的汇率（折合 BASE_CURRENCY）的 SQL 表达式，走 exchange_rates 主键索引。"""
+    return (f"(CASE WHEN {cur} = '{BASE_CURRENCY}' THEN 1.0 ELSE COALESCE("
+            f"(SELECT rate FROM main.exchange_rates WHERE currency = {cur} AND day <= {day} ORDER BY day DESC LIMIT 1), "
+            f"(SELECT rate FROM main.exchange_rates WHERE currency = {cur} ORDER BY day LIMIT 1)) END)")
+
+
+def rate_factor_sql(day: str) -> str:
+    """day 当天 1 单位币种 A 折合多少币种 B 的 SQL 表达式，参数为 fx_params(A, B)。B 为 BASE_CURRENCY 时分母不查表。"""
+    return f"({_as_of_sql('?', day)} / {_as_of_sql('?', day)})"
+
+
+def fx_params(from_currency: str, to_currency: str) -> Tuple[str, ...]:
+    return (from_currency,) * 3 + (to_currency,) * 3
+
+
+def missing_rates(db: Database, currencies: Iterable[str]) -> List[str]:
+    """currencies 中（除 BASE_CURRENCY 外）在汇率表里一条汇率都没有的币种。"""
+    wanted = sorted({c for c in currencies if c and c != BASE_CURRENCY})
+    if not wanted:
+        return []
+    rows = db.query(f"SELECT DISTINCT currency FROM exchange_rates WHERE currency IN ({', '.join('?' * len(wanted))})",
+                    tuple(wanted))
+    have = {r[0] for r in rows}
+    return [c for c in wanted if c not in have]
+
+
+class RateResolver:
+    """按日期取汇率并换算金额，最近的查找结果缓存在 LRU 中。
+
+    同一个 Database 共享一个实例（for_db）；load_rates() 导入后会清空缓存，
+    db.generation 变化（restore、重置等）后第一次查询时也会清空。
+    其他进程修改汇率表不会被发现，必要时调用 clear()。
+    """
+    _instances: 'weakref.WeakKeyDictionary[Database, RateResolver]' = weakref.WeakKeyDictionary()
+
+    def __init__(self, db: Database, cache_size: int = RATE_CACHE_SIZE):
+        self.db = db
+        self._rate = lru_cache(maxsize=cache_size)(self._lookup)
+        self._generation = db.generation
+
+    @classmethod
+    def for_db(cls, db: Database) -> 'RateResolver':
+        inst = cls._instances.get(db)
+        if inst is None:
+            inst = cls._instances[db] = cls(db)
+        return inst
+
+    def _lookup(self, currency: str, day: str) -> float:
+        rows = self.db.query(f"SELECT {_as_of_sql('?', '?')}", (currency, currency, day, currency))
+        if rows[0][0] is None:
+            raise KeyError(f'no exchange rate for {currency}')
+        return rows[0][0]
+
+    def rate(self, currency: str, day: date) -> float:
+        """1 单位 currency 在 day 当天折合多少 BASE_CURRENCY。"""
+        if self._generation != self.db.generation:
+            self.clear()
+        return self._rate(currency.upper(), day.isoformat())
+
+    def convert(self, amount: float, from_currency: str, to_currency: str, day: date) -> float:
+        if from_currency.upper() == to_currency.upper():
+            return amount
+        return amount * self.rate(from_currency, day) / self.rate(to_currency, day)
+
+    def cache_info(self):
+        return self._rate.cache_info()
+
+    def clear(self) -> None:
+        self._rate.cache_clear()
+        self._generation = self.db.generation
+
+
+def load_rates(db: Database, path: str, batch_size: int = 5000) -> int:
+    """从 CSV（date,currency,rate）导入汇率，同一 (币种, 日期) 已有时覆盖，返回导入条数。"""
+    opener = gzip.open if str(path).endswith('.gz') else open
+    count = 0
+    insert = "INSERT OR REPLACE INTO exchange_rates(currency, day, rate) VALUES (?, ?, ?)"
+    with opener(path, 'rt', newline='', encoding='utf-8') as f, db.transaction():
+        batch = []
+        for row in csv.DictReader(f):
+            rate = float(row['rate'])
+            if rate <= 0:
+                raise ValueError(f"invalid rate {row['rate']!r} for {row['currency']} on {row['date']}")
+            batch.append((row['currency'].strip().upper(), date.fromisoformat(row['date'].strip()).isoformat(), rate))
+            if len(batch) >= batch_size:
+                db.executemany(insert, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            db.executemany(insert, batch)
+            count += len(batch)
+    RateResolver.for_db(db).clear()
+    return count
+
+
+def currencies_in_use(accounts: Iterable) -> Set[str]:
+    """账户币种集合（没有账户的记录按 BASE_CURRENCY，总是包含在内）。"""
+    return {(a.currency or BASE_CURRENCY).upper() for a in accounts} | {BASE_CURRENCY}
@@ -1,5 +1,13 @@
+import os
+import re
 import sqlite3
-from typing import Optional, List, Any, Tuple
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from contextlib import contextmanager
+from typing import Optional, List, Any, Tuple, Iterable, Iterator, Callable, Dict, Deque
 from pathlib import Path
 from datetime import date, datetime
 import json
@@ -54,52 +62,1134 @@ DB_SCHEMA = [
 ]
 
 
+def _migrate_base_schema(conn: sqlite3.Connection) -> None:
+    for s in DB_SCHEMA:
+        conn.execute(s)
+    # Ensure legacy databases get account_id column if missing
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(records)")]
+    if 'account_id' not in cols:
+        conn.execute('ALTER TABLE records ADD COLUMN account_id TEXT')
+
+
+def _migrate_record_indexes(conn: sqlite3.Connection) -> None:
+    # 覆盖按账户/分类筛选并按日期排序的查询，以及按日期区间统计收支的查询
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_records_account_date ON records(account_id, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_records_category_date ON records(category_id, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_records_date_type ON records(date, type)")
+
+
+def _migrate_keyset_index(conn: sqlite3.Connection) -> None:
+    # 支持按 (date, record_id) 的游标分页，避免 OFFSET 逐行跳过
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_records_date_id ON records(date, record_id)")
+
+
+# records.tags 是 JSON 数组，写入全文索引前展开成空格分隔的文本，避免匹配到 JSON 的引号和逗号
+def fts_tags_expr(col: str) -> str:
+    return (f"CASE WHEN json_valid({col}) THEN (SELECT group_concat(value, ' ') FROM json_each({col})) "
+            f"ELSE {col} END")
+
+
+_FTS_INSERT_NEW = f"INSERT INTO records_fts(rowid, note, tags) VALUES (new.rowid, new.note, {fts_tags_expr('new.tags')})"
+
+
+def _migrate_search_index(conn: sqlite3.Connection) -> None:
+    # trigram 分词按 3 字符切分，不依赖空格分词，适合以中文为主的备注
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(note, tags, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        # sqlite 未编译 FTS5（或版本低于 3.34 不支持 trigram），搜索退回 LIKE 扫描
+        return
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS records_fts_ai AFTER INSERT ON records BEGIN
+            {_FTS_INSERT_NEW};
+        END""")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS records_fts_ad AFTER DELETE ON records BEGIN
+            DELETE FROM records_fts WHERE rowid = old.rowid;
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS records_fts_au AFTER UPDATE OF note, tags ON records BEGIN
+            UPDATE records_fts SET note = new.note, tags = {fts_tags_expr('new.tags')} WHERE rowid = new.rowid;
+        END""")
+    # 一次性回填已有记录
+    rebuild_search_index(conn)
+
+
+def rebuild_search_index(conn: sqlite3.Connection) -> int:
+    """清空并重建 records_fts，返回索引的记录数。"""
+    conn.execute("DELETE FROM records_fts")
+    cur = conn.execute(f"INSERT INTO records_fts(rowid, note, tags) SELECT rowid, note, {fts_tags_expr('tags')} FROM records")
+    return cur.rowcount
+
+
+def _valid_tags_json(col: str) -> str:
+    # json_each 遇到非法 JSON 会直接报错，先兜底成空数组
+    return f"CASE WHEN json_valid({col}) THEN {col} ELSE '[]' END"
+
+
+_RECORD_TAGS_INSERT_NEW = (f"INSERT OR IGNORE INTO record_tags(tag, record_id) SELECT CAST(value AS TEXT), new.record_id "
+                           f"FROM json_each({_valid_tags_json('new.tags')}) WHERE value IS NOT NULL AND value != ''")
+
+
+def _migrate_record_tags(conn: sqlite3.Connection) -> None:
+    # 规范化的标签表：按 (tag, record_id) 聚簇，按标签筛选/聚合不必再逐行解析 JSON
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS record_tags (
+            tag TEXT NOT NULL,
+            record_id TEXT NOT NULL,
+            PRIMARY KEY (tag, record_id)
+        ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_record_tags_record ON record_tags(record_id)")
+    insert_tags = _RECORD_TAGS_INSERT_NEW
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS record_tags_ai AFTER INSERT ON records BEGIN
+            {insert_tags};
+        END""")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS record_tags_ad AFTER DELETE ON records BEGIN
+            DELETE FROM record_tags WHERE record_id = old.record_id;
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS record_tags_au AFTER UPDATE OF tags, record_id ON records BEGIN
+            DELETE FROM record_tags WHERE record_id = old.record_id;
+            {insert_tags};
+        END""")
+    conn.execute(f"INSERT OR IGNORE INTO record_tags(tag, record_id) SELECT CAST(j.value AS TEXT), r.record_id "
+                 f"FROM records r, json_each({_valid_tags_json('r.tags')}) j WHERE j.value IS NOT NULL AND j.value != ''")
+
+
+def _rollup_upsert(prefix: str, sign: str) -> str:
+    # NULL 不能参与主键冲突判断，账户/分类为空时统一存成 ''
+    return (f"INSERT INTO daily_rollup(day, account_id, category_id, type, total, cnt) "
+            f"VALUES ({prefix}.date, COALESCE({prefix}.account_id, ''), COALESCE({prefix}.category_id, ''), {prefix}.type, "
+            f"{sign}{prefix}.amount, {sign}1) "
+            f"ON CONFLICT(day, account_id, category_id, type) DO UPDATE SET total = total + excluded.total, cnt = cnt + excluded.cnt")
+
+
+_ROLLUP_PRUNE = ("DELETE FROM daily_rollup WHERE day = old.date AND account_id = COALESCE(old.account_id, '') "
+                 "AND category_id = COALESCE(old.category_id, '') AND type = old.type AND cnt <= 0")
+
+
+def _migrate_daily_rollup(conn: sqlite3.Connection) -> None:
+    # 按 (日, 账户, 分类, 类型) 预聚合的金额与笔数，由触发器随 records 的增删改增量维护
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_rollup (
+            day TEXT NOT NULL,
+            account_id TEXT NOT NULL,
+            category_id TEXT NOT NULL,
+            type TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, account_id, category_id, type)
+        ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_rollup_account ON daily_rollup(account_id, day)")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS daily_rollup_ai AFTER INSERT ON records BEGIN
+            {_rollup_upsert('new', '')};
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS daily_rollup_ad AFTER DELETE ON records BEGIN
+            {_rollup_upsert('old', '-')};
+            {_ROLLUP_PRUNE};
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS daily_rollup_au AFTER UPDATE OF amount, type, date, category_id, account_id ON records BEGIN
+            {_rollup_upsert('old', '-')};
+            {_ROLLUP_PRUNE};
+            {_rollup_upsert('new', '')};
+        END""")
+    rebuild_daily_rollup(conn)
+
+
+# 从 records 重新计算的“真实”日汇总，重建和校验 daily_rollup 时共用
+ROLLUP_SOURCE_SQL = ("SELECT date AS day, COALESCE(account_id, '') AS account_id, COALESCE(category_id, '') AS category_id, "
+                     "type, SUM(amount) AS total, COUNT(*) AS cnt FROM records GROUP BY 1, 2, 3, 4")
+
+
+def rollup_source_sql(conn: sqlite3.Connection) -> str:
+    """daily_rollup 应有的内容：records 的实时聚合，加上已移入归档库的记录的汇总（archived_rollup）。"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'archived_rollup'").fetchone():
+        return ROLLUP_SOURCE_SQL
+    return (f"SELECT day, account_id, category_id, type, SUM(total) AS total, SUM(cnt) AS cnt FROM ({ROLLUP_SOURCE_SQL} "
+            f"UNION ALL SELECT day, account_id, category_id, type, total, cnt FROM archived_rollup) GROUP BY 1, 2, 3, 4")
+
+
+def rebuild_daily_rollup(conn: sqlite3.Connection) -> int:
+    """清空并按 records（及 archived_rollup）重建 daily_rollup，返回汇总行数。"""
+    conn.execute("DELETE FROM daily_rollup")
+    cur = conn.execute(f"INSERT INTO daily_rollup(day, account_id, category_id, type, total, cnt) {rollup_source_sql(conn)}")
+    return cur.rowcount
+
+
+def _signed_amount(prefix: str) -> str:
+    return f"(CASE {prefix}.type WHEN 'income' THEN {prefix}.amount ELSE -{prefix}.amount END)"
+
+
+_BALANCE_REVERT_OLD = f"UPDATE accounts SET balance = balance - {_signed_amount('old')} WHERE account_id = old.account_id"
+_CHECKPOINT_DROP_OLD = "DELETE FROM balance_checkpoints WHERE account_id = old.account_id AND day >= old.date"
+_BALANCE_APPLY_NEW = f"UPDATE accounts SET balance = balance + {_signed_amount('new')} WHERE account_id = new.account_id"
+_CHECKPOINT_DROP_NEW = "DELETE FROM balance_checkpoints WHERE account_id = new.account_id AND day >= new.date"
+
+
+def _migrate_account_balances(conn: sqlite3.Connection) -> None:
+    # accounts.balance 改为实时余额 = opening_balance + 该账户所有记录的净额，由触发器在写入时维护
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(accounts)")]
+    if 'opening_balance' not in cols:
+        conn.execute("ALTER TABLE accounts ADD COLUMN opening_balance REAL DEFAULT 0.0")
+        # 旧版本从未更新过 balance，它就是开户余额
+        conn.execute("UPDATE accounts SET opening_balance = COALESCE(balance, 0.0)")
+    conn.execute("""
+        UPDATE accounts SET balance = opening_balance + COALESCE((
+            SELECT SUM(CASE type WHEN 'income' THEN total ELSE -total END)
+            FROM daily_rollup WHERE daily_rollup.account_id = accounts.account_id), 0.0)""")
+    # 余额检查点：某账户在 day 当天结束时的余额；早于检查点的写入会使其失效
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS balance_checkpoints (
+            account_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            balance REAL NOT NULL,
+            PRIMARY KEY (account_id, day)
+        ) WITHOUT ROWID""")
+    apply_new = _BALANCE_APPLY_NEW
+    revert_old = _BALANCE_REVERT_OLD
+    drop_new = _CHECKPOINT_DROP_NEW
+    drop_old = _CHECKPOINT_DROP_OLD
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS account_balance_ai AFTER INSERT ON records BEGIN
+            {apply_new};
+            {drop_new};
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS account_balance_ad AFTER DELETE ON records BEGIN
+            {revert_old};
+            {drop_old};
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS account_balance_au AFTER UPDATE OF amount, type, date, account_id ON records BEGIN
+            {revert_old};
+            {apply_new};
+            {drop_old};
+            {drop_new};
+        END""")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS account_opening_au AFTER UPDATE OF opening_balance ON accounts BEGIN
+            UPDATE accounts SET balance = balance + (new.opening_balance - old.opening_balance)
+            WHERE account_id = new.account_id;
+            DELETE FROM balance_checkpoints WHERE account_id = new.account_id;
+        END""")
+
+
+def budget_period_start_sql(period: str, day: str) -> str:
+    # 周预算从周一开始，月预算从每月 1 日开始；其他周期按月处理
+    return f"(CASE {period} WHEN 'weekly' THEN date({day}, '-6 days', 'weekday 1') ELSE strftime('%Y-%m-01', {day}) END)"
+
+
+def _budget_spend_upsert(prefix: str, sign: str) -> str:
+    return (f"INSERT INTO budget_spend(budget_id, period_start, spent) "
+            f"SELECT b.budget_id, {budget_period_start_sql('b.period', prefix + '.date')}, {sign}{prefix}.amount FROM budgets b "
+            f"WHERE {prefix}.type = 'expense' AND (b.category_id IS NULL OR b.category_id = {prefix}.category_id) "
+            f"ON CONFLICT(budget_id, period_start) DO UPDATE SET spent = spent + excluded.spent")
+
+
+def _migrate_budget_spend(conn: sqlite3.Connection) -> None:
+    # 每个预算每个周期的支出计数器；notified_level 记录本周期已经提醒过的最高阈值
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS budget_spend (
+            budget_id TEXT NOT NULL,
+            period_start TEXT NOT NULL,
+            spent REAL NOT NULL DEFAULT 0,
+            notified_level REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (budget_id, period_start)
+        ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_budgets_category ON budgets(category_id)")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS budget_spend_ai AFTER INSERT ON records BEGIN
+            {_budget_spend_upsert('new', '')};
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS budget_spend_ad AFTER DELETE ON records BEGIN
+            {_budget_spend_upsert('old', '-')};
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS budget_spend_au AFTER UPDATE OF amount, type, date, category_id ON records BEGIN
+            {_budget_spend_upsert('old', '-')};
+            {_budget_spend_upsert('new', '')};
+        END""")
+    conn.execute("CREATE TRIGGER IF NOT EXISTS budget_spend_bd AFTER DELETE ON budgets BEGIN "
+                 "DELETE FROM budget_spend WHERE budget_id = old.budget_id; END")
+    recompute_budget_spend(conn)
+
+
+def recompute_budget_spend(conn: sqlite3.Connection, budget_id: Optional[str] = None) -> None:
+    """从 daily_rollup 重新计算预算计数器（新建/修改预算时使用），保留已提醒的阈值。"""
+    where = "AND b.budget_id = ?" if budget_id else ""
+    params: Tuple = (budget_id,) if budget_id else ()
+    conn.execute(f"UPDATE budget_spend SET spent = 0 {'WHERE budget_id = ?' if budget_id else ''}", params)
+    conn.execute(f"""
+        INSERT INTO budget_spend(budget_id, period_start, spent)
+        SELECT b.budget_id, {budget_period_start_sql('b.period', 'r.day')} AS ps, SUM(r.total)
+        FROM budgets b JOIN daily_rollup r
+            ON r.type = 'expense' AND (b.category_id IS NULL OR r.category_id = b.category_id)
+        WHERE true {where}
+        GROUP BY b.budget_id, ps
+        ON CONFLICT(budget_id, period_start) DO UPDATE SET spent = excluded.spent""", params)
+
+
+# 每个连接缓存的预编译语句条数（sqlite3 默认 128）。RecordQuery 按语句形状生成固定的 SQL 文本，
+# 同一形状的查询在这里命中，不必重新解析和规划
+STATEMENT_CACHE_SIZE = 512
+
+# 变更时间戳：UTC，毫秒精度，字符串比较即时间先后
+TS_NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+# 参与同步的表：表名 -> (主键列, 同步的列)。accounts.balance 由触发器派生，不同步
+SYNC_TABLES = {
+    'records': ('record_id', ('record_id', 'amount', 'type', 'date', 'category_id', 'account_id', 'tags', 'note',
+                              'attachments')),
+    'categories': ('category_id', ('category_id', 'name', 'icon', 'color')),
+    'accounts': ('account_id', ('account_id', 'name', 'type', 'currency', 'opening_balance')),
+    'budgets': ('budget_id', ('budget_id', 'category_id', 'limit_value', 'period')),
+}
+
+
+def _change_log_insert(table: str, pk: str, op: str, ts: str, row: str) -> str:
+    # 每个主键只保留最新的一条变更：同步只需要最终状态，日志大小与行数成正比
+    return (f"DELETE FROM change_log WHERE tbl = '{table}' AND pk = {pk}; "
+            f"INSERT INTO change_log(tbl, pk, op, row, updated_at, site_id) "
+            f"VALUES ('{table}', {pk}, '{op}', {row}, {ts}, (SELECT value FROM meta WHERE key = 'site_id'))")
+
+
+def _change_row_json(cols: Tuple[str, ...], prefix: str, ts_expr: str) -> str:
+    fields = ", ".join(f"'{c}', {prefix}.{c}" for c in cols)
+    return f"json_object({fields}, 'updated_at', {ts_expr})"
+
+
+# 插入：服务层写入时带 updated_at，直接写 SQL 的插入用当前时间
+_INSERT_TS = f"COALESCE(new.updated_at, {TS_NOW_SQL})"
+
+
+def _migrate_change_log(conn: sqlite3.Connection) -> None:
+    # meta 保存本库的 site_id（同步时区分来源，也用于最后写入者胜出的平局裁决）
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID")
+    conn.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('site_id', lower(hex(randomblob(8))))")
+    # seq 用 AUTOINCREMENT，删除旧条目后也不会复用，保证单调递增
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            pk TEXT NOT NULL,
+            op TEXT NOT NULL,
+            row TEXT,
+            updated_at TEXT NOT NULL,
+            site_id TEXT NOT NULL
+        )""")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_change_log_key ON change_log(tbl, pk)")
+    ts = conn.execute(f"SELECT {TS_NOW_SQL}").fetchone()[0]
+    for table, (pk, cols) in SYNC_TABLES.items():
+        if 'updated_at' not in [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TEXT")
+        conn.execute(f"UPDATE {table} SET updated_at = ? WHERE updated_at IS NULL", (ts,))
+
+        def row_json(prefix: str, ts_expr: str) -> str:
+            return _change_row_json(cols, prefix, ts_expr)
+
+        ins_ts = _INSERT_TS
+        # 更新：没有改 updated_at 的更新（例如删除分类时批量解除关联）补上当前时间
+        upd_ts = f"(CASE WHEN new.updated_at IS old.updated_at THEN {TS_NOW_SQL} ELSE new.updated_at END)"
+        watched = ", ".join(c for c in cols + ('updated_at',) if c != pk)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_ai AFTER INSERT ON {table} BEGIN
+                {_change_log_insert(table, 'new.' + pk, 'upsert', ins_ts, row_json('new', ins_ts))};
+            END""")
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_au AFTER UPDATE OF {watched} ON {table} BEGIN
+                UPDATE {table} SET updated_at = {TS_NOW_SQL}
+                WHERE {pk} = new.{pk} AND new.updated_at IS old.updated_at;
+                {_change_log_insert(table, 'new.' + pk, 'upsert', upd_ts, row_json('new', upd_ts))};
+            END""")
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_ad AFTER DELETE ON {table} BEGIN
+                {_change_log_insert(table, 'old.' + pk, 'delete', TS_NOW_SQL, 'NULL')};
+            END""")
+        # 已有数据全部记为一次变更，首次同步时完整传给对方
+        conn.execute(f"""
+            INSERT OR REPLACE INTO change_log(tbl, pk, op, row, updated_at, site_id)
+            SELECT '{table}', {pk}, 'upsert', {row_json(table, table + '.updated_at')}, updated_at,
+                   (SELECT value FROM meta WHERE key = 'site_id')
+            FROM {table}""")
+
+
+# 归档（archival.archive_records）把旧记录从 records 移到按年份的归档库时设置 meta.archiving，
+# 期间删除 records 不应改变汇总、余额、预算和同步日志：这些数据仍然包含已归档的记录
+_NOT_ARCHIVING = "NOT EXISTS (SELECT 1 FROM meta WHERE key = 'archiving')"
+
+
+def _migrate_archival(conn: sqlite3.Connection) -> None:
+    # 已归档的年份：归档库文件（相对数据库所在目录）和该年的汇总
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archives (
+            year INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            records INTEGER NOT NULL DEFAULT 0,
+            income REAL NOT NULL DEFAULT 0,
+            expense REAL NOT NULL DEFAULT 0,
+            first_day TEXT,
+            last_day TEXT,
+            archived_at TEXT
+        )""")
+    # 已归档记录的日汇总；daily_rollup = records 的聚合 + archived_rollup，校验和重建时不必读归档库
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archived_rollup (
+            day TEXT NOT NULL,
+            account_id TEXT NOT NULL,
+            category_id TEXT NOT NULL,
+            type TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, account_id, category_id, type)
+        ) WITHOUT ROWID""")
+    guarded = {
+        'daily_rollup_ad': f"{_rollup_upsert('old', '-')};\n{_ROLLUP_PRUNE};",
+        'account_balance_ad': f"{_BALANCE_REVERT_OLD};\n{_CHECKPOINT_DROP_OLD};",
+        'budget_spend_ad': f"{_budget_spend_upsert('old', '-')};",
+        'records_changes_ad': f"{_change_log_insert('records', 'old.record_id', 'delete', TS_NOW_SQL, 'NULL')};",
+    }
+    for name, body in guarded.items():
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"CREATE TRIGGER {name} AFTER DELETE ON records WHEN {_NOT_ARCHIVING} BEGIN\n{body}\nEND")
+
+
+
+def _migrate_exchange_rates(conn: sqlite3.Connection) -> None:
+    # 1 单位 currency 在 day 当天折合多少本位币（currency.BASE_CURRENCY）；主键即按日期取汇率的索引
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            currency TEXT NOT NULL,
+            day TEXT NOT NULL,
+            rate REAL NOT NULL,
+            PRIMARY KEY (currency, day)
+        ) WITHOUT ROWID""")
+
+
+def _migrate_recurring_rules(conn: sqlite3.Connection) -> None:
+    # 周期性规则；materialized_through 为已生成到的日期，生成的记录 id 由 (rule_id, 日期) 确定，重复生成会被忽略
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recurring_rules (
+            rule_id TEXT PRIMARY KEY,
+            amount REAL NOT NULL,
+            type TEXT NOT NULL,
+            frequency TEXT NOT NULL,
+            interval INTEGER NOT NULL DEFAULT 1,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            category_id TEXT,
+            account_id TEXT,
+            tags TEXT,
+            note TEXT,
+            materialized_through TEXT,
+            updated_at TEXT
+        )""")
+
+
+# 批量写入（export_import.bulk_insert_rows）期间设置 meta.bulk_loading：records 的插入触发器全部跳过，
+# 写入完成后由 index_inserted_records / derive_inserted_records 按 rowid 区间一次性集合式补齐，
+# 每张派生表一条 INSERT ... SELECT，而不是每行六个触发器
+BULK_LOADING_FLAG = 'bulk_loading'
+_NOT_BULK_LOADING = f"NOT EXISTS (SELECT 1 FROM meta WHERE key = '{BULK_LOADING_FLAG}')"
+
+
+def _migrate_bulk_loading(conn: sqlite3.Connection) -> None:
+    change_row = _change_row_json(SYNC_TABLES['records'][1], 'new', _INSERT_TS)
+    guarded = {
+        'record_tags_ai': f"{_RECORD_TAGS_INSERT_NEW};",
+        'daily_rollup_ai': f"{_rollup_upsert('new', '')};",
+        'account_balance_ai': f"{_BALANCE_APPLY_NEW};\n{_CHECKPOINT_DROP_NEW};",
+        'budget_spend_ai': f"{_budget_spend_upsert('new', '')};",
+        'records_changes_ai': f"{_change_log_insert('records', 'new.record_id', 'upsert', _INSERT_TS, change_row)};",
+    }
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'records_fts'").fetchone():
+        guarded['records_fts_ai'] = f"{_FTS_INSERT_NEW};"
+    for name, body in guarded.items():
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"CREATE TRIGGER {name} AFTER INSERT ON records WHEN {_NOT_BULK_LOADING} BEGIN\n{body}\nEND")
+
+
+def index_inserted_records(conn: sqlite3.Connection, after_rowid: int) -> None:
+    """为 rowid > after_rowid 的记录补写全文索引和 record_tags（bulk_loading 期间插入的记录）。"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'records_fts'").fetchone():
+        conn.execute(f"INSERT INTO records_fts(rowid, note, tags) SELECT rowid, note, {fts_tags_expr('tags')} "
+                     f"FROM records WHERE rowid > ?", (after_rowid,))
+    conn.execute(f"INSERT OR IGNORE INTO record_tags(tag, record_id) SELECT CAST(j.value AS TEXT), r.record_id "
+                 f"FROM records r, json_each({_valid_tags_json('r.tags')}) j "
+                 f"WHERE r.rowid > ? AND j.value IS NOT NULL AND j.value != ''", (after_rowid,))
+
+
+def derive_inserted_records(conn: sqlite3.Connection, after_rowid: int) -> None:
+    """把 rowid > after_rowid 的记录计入日汇总、账户余额（并使之后的检查点失效）、预算计数器和同步日志，
+    与逐行触发器的结果相同。"""
+    conn.execute("""
+        INSERT INTO daily_rollup(day, account_id, category_id, type, total, cnt)
+        SELECT date, COALESCE(account_id, ''), COALESCE(category_id, ''), type, SUM(amount), COUNT(*)
+        FROM records WHERE rowid > ? GROUP BY 1, 2, 3, 4
+        ON CONFLICT(day, account_id, category_id, type) DO UPDATE SET total = total + excluded.total, cnt = cnt + excluded.cnt""",
+                 (after_rowid,))
+    # 账户只有几个：一次分组扫描，再逐账户更新余额、删除受影响的检查点
+    per_account = conn.execute(
+        f"SELECT account_id, SUM({_signed_amount('records')}), MIN(date) FROM records "
+        f"WHERE rowid > ? AND account_id IS NOT NULL GROUP BY account_id", (after_rowid,)).fetchall()
+    conn.executemany("UPDATE accounts SET balance = balance + ? WHERE account_id = ?",
+                     [(net, account_id) for account_id, net, _ in per_account])
+    conn.executemany("DELETE FROM balance_checkpoints WHERE account_id = ? AND day >= ?",
+                     [(account_id, first) for account_id, _, first in per_account])
+    conn.execute(f"""
+        INSERT INTO budget_spend(budget_id, period_start, spent)
+        SELECT b.budget_id, {budget_period_start_sql('b.period', 'r.date')} AS ps, SUM(r.amount)
+        FROM records r JOIN budgets b
+            ON r.type = 'expense' AND (b.category_id IS NULL OR b.category_id = r.category_id)
+        WHERE r.rowid > ?
+        GROUP BY b.budget_id, ps
+        ON CONFLICT(budget_id, period_start) DO UPDATE SET spent = spent + excluded.spent""", (after_rowid,))
+    ts = f"COALESCE(records.updated_at, {TS_NOW_SQL})"
+    row = _change_row_json(SYNC_TABLES['records'][1], 'records', ts)
+    # 每个主键只保留最新一条：REPLACE 先删掉同主键的旧条目（例如之前删除留下的墓碑）
+    conn.execute(f"""
+        INSERT OR REPLACE INTO change_log(tbl, pk, op, row, updated_at, site_id)
+        SELECT 'records', record_id, 'upsert', {row}, {ts},
+               (SELECT value FROM meta WHERE key = 'site_id')
+        FROM records WHERE rowid > ? ORDER BY rowid""", (after_rowid,))
+
+
+# 版本化迁移：MIGRATIONS[i] 把数据库从 user_version i 升级到 i + 1。
+# 只能在末尾追加新迁移，不要修改已发布的迁移。
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migrate_base_schema,
+    _migrate_record_indexes,
+    _migrate_keyset_index,
+    _migrate_search_index,
+    _migrate_record_tags,
+    _migrate_daily_rollup,
+    _migrate_account_balances,
+    _migrate_budget_spend,
+    _migrate_change_log,
+    _migrate_archival,
+    _migrate_exchange_rates,
+    _migrate_recurring_rules,
+    _migrate_bulk_loading,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+@dataclass
+class BackupStats:
+    """一次备份/恢复的进度与吞吐量。进行中时 pages_done < pages_total。"""
+    path: str
+    page_size: int
+    pages_total: int = 0
+    pages_done: int = 0
+    steps: int = 0
+    seconds: float = 0.0
+
+    @property
+    def bytes_done(self) -> int:
+        return self.pages_done * self.page_size
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_done / self.seconds if self.seconds > 0 else float(self.bytes_done)
+
+
+def archive_backup_path(backup: str, year: int) -> Path:
+    """备份 backup 中 year 年归档库的副本：与备份文件放在一起，随备份一起轮换。"""
+    return Path(f"{backup}.{year}.archive")
+
+
+def _copy_database(src: Path, dest: Path) -> None:
+    """用备份 API 把 src 复制到 dest（先写临时文件再原子替换）。"""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = str(dest) + '.part'
+    if os.path.exists(tmp):
+        os.unlink(tmp)
+    source = sqlite3.connect(f"file:{src.resolve()}?mode=ro", uri=True)
+    try:
+        target = sqlite3.connect(tmp)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+    finally:
+        source.close()
+    os.replace(tmp, dest)
+
+
+def list_backups(directory: str, stem: str) -> List[Path]:
+    """backup_rotating 在 directory 中为名为 stem 的数据库创建的备份，最新的在前。"""
+    return sorted(Path(directory).glob(f"{stem}.*.bak"), reverse=True)
+
+
+_WS_RE = re.compile(r'\s+')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'IN \(\?(?:, ?\?)*\)', re.IGNORECASE)
+_VALUES_RE = re.compile(r'(\(\?(?:, ?\?)*\))(?:, ?\(\?(?:, ?\?)*\))+')
+_EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+
+
+@lru_cache(maxsize=2048)
+def statement_shape(sql: str) -> str:
+    """语句的“形状”：合并空白，字面量替换为 ?，IN 列表和多行 VALUES 折叠，用作统计的键。"""
+    s = _WS_RE.sub(' ', sql).strip()
+    s = _STRING_RE.sub('?', s)
+    s = _NUMBER_RE.sub('?', s)
+    s = _IN_LIST_RE.sub('IN (?...)', s)
+    return _VALUES_RE.sub(r'\1, ...', s)
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """从 EXPLAIN QUERY PLAN 的 detail 中找出全表扫描的表（不含索引扫描、虚拟表和子查询）。"""
+    tables = []
+    for detail in plan:
+        if detail.startswith('SCAN ') and 'USING' not in detail and 'VIRTUAL TABLE' not in detail:
+            name = detail.split()[1]
+            if name != 'CONSTANT' and not name.startswith('('):
+                tables.append(name)
+    return tables
+
+
+@dataclass
+class StatementStats:
+    shape: str
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+
+class QueryProfiler:
+    """Database 的查询统计：按语句形状累计调用次数、耗时和行数，记录慢查询并抓取其执行计划。
+
+    由 Database.enable_profiling() 创建；未启用时 Database 只多一次 `is None` 判断。
+    慢查询（耗时 >= slow_ms）保留最近 max_slow 条，同一形状的执行计划只抓取一次；
+    给定 log_path 时每条慢查询追加一行 JSON。可以在多个线程间共享。
+    """
+    def __init__(self, slow_ms: float = 100.0, log_path: Optional[str] = None, capture_plans: bool = True,
+                 max_slow: int = 200):
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self.capture_plans = capture_plans
+        self._lock = threading.Lock()
+        self._stats: Dict[str, StatementStats] = {}
+        self.plans: Dict[str, List[str]] = {}
+        self.slow_queries: Deque[Dict[str, Any]] = deque(maxlen=max_slow)
+
+    def record(self, conn: sqlite3.Connection, sql: str, params: Any, seconds: float, rows: int) -> None:
+        ms = seconds * 1000
+        shape = statement_shape(sql)
+        with self._lock:
+            st = self._stats.get(shape)
+            if st is None:
+                st = self._stats[shape] = StatementStats(shape)
+            st.calls += 1
+            st.total_ms += ms
+            st.rows += rows
+            if ms > st.max_ms:
+                st.max_ms = ms
+        if ms >= self.slow_ms:
+            self._slow(conn, sql, shape, params, ms, rows)
+
+    def _slow(self, conn: sqlite3.Connection, sql: str, shape: str, params: Any, ms: float, rows: int) -> None:
+        plan = self.plans.get(shape)
+        if plan is None and self.capture_plans and params is not None and sql.lstrip()[:6].upper().startswith(_EXPLAINABLE):
+            try:
+                plan = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+            except sqlite3.Error:
+                plan = []
+            self.plans[shape] = plan
+        entry = {'at': datetime.now().isoformat(timespec='seconds'), 'ms': round(ms, 3), 'rows': rows, 'sql': shape,
+                 'plan': plan or [], 'full_scans': full_scans(plan or [])}
+        with self._lock:
+            self.slow_queries.append(entry)
+            if self.log_path:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def stats(self) -> List[StatementStats]:
+        """各语句形状的统计，按总耗时降序。"""
+        with self._lock:
+            return sorted((StatementStats(s.shape, s.calls, s.total_ms, s.max_ms, s.rows) for s in self._stats.values()),
+                          key=lambda s: s.total_ms, reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self.plans.clear()
+            self.slow_queries.clear()
+
+    def report(self, limit: int = 20) -> str:
+        lines = [f"{'calls':>8} {'total ms':>10} {'avg ms':>8} {'max ms':>8} {'rows':>9}  statement"]
+        for s in self.stats()[:limit]:
+            lines.append(f"{s.calls:8d} {s.total_ms:10.2f} {s.avg_ms:8.3f} {s.max_ms:8.2f} {s.rows:9d}  {s.shape[:100]}")
+        scans = {}
+        for entry in list(self.slow_queries):
+            for table in entry['full_scans']:
+                scans.setdefault(entry['sql'], set()).add(table)
+        if scans:
+            lines.append('full table scans in slow queries:')
+            for shape, tables in scans.items():
+                lines.append(f"  {', '.join(sorted(tables))}: {shape[:100]}")
+        return '\n'.join(lines)
+
+
 class Database:
     def __init__(self, path: Optional[str] = None):
         self.path = Path(path or Path.cwd() / "accounting.db")
-        self.conn = sqlite3.connect(str(self.path))
+        self.conn = sqlite3.connect(str(self.path), cached_statements=STATEMENT_CACHE_SIZE)
         self.conn.row_factory = sqlite3.Row
+        # 当前 transaction() 的嵌套深度；> 0 时 execute 不再逐条提交
+        self._tx_depth = 0
+        # 参考数据（分类/账户）的代数，本连接写入这些表后递增，供缓存判断是否失效
+        self.generation = 0
+        # 查询统计，见 enable_profiling()；None 表示未启用
+        self.profiler: Optional[QueryProfiler] = None
         self._init_schema()
 
     def _init_schema(self):
-        cur = self.conn.cursor()
-        for s in DB_SCHEMA:
-            cur.execute(s)
+        """按 PRAGMA user_version 依次执行尚未应用的迁移。
+
+        已是最新版本的数据库只需读取一次 user_version。
+        """
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        for v in range(version, SCHEMA_VERSION):
+            with self.transaction():
+                MIGRATIONS[v](self.conn)
+                self.conn.execute(f"PRAGMA user_version = {v + 1}")
+            # 每次迁移后刷新统计信息，便于查询规划器选择新索引
+            self.conn.execute("ANALYZE")
+            self.conn.commit()
+
+    def _backup_pages(self, src: sqlite3.Connection, target: sqlite3.Connection, path: str, pages: int,
+                      sleep: float, progress: Optional[Callable[['BackupStats'], None]]) -> 'BackupStats':
+        stats = BackupStats(path=path, page_size=src.execute("PRAGMA page_size").fetchone()[0])
+        started = time.perf_counter()
+
+        def step(status, remaining, total):
+            stats.pages_total = total
+            stats.pages_done = total - remaining
+            stats.steps += 1
+            stats.seconds = time.perf_counter() - started
+            if progress:
+                progress(stats)
+
+        src.backup(target, pages=pages, progress=step, sleep=sleep)
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    def _backup_to(self, target: sqlite3.Connection, path: str, pages: int, sleep: float,
+                   progress: Optional[Callable[['BackupStats'], None]]) -> 'BackupStats':
         self.conn.commit()
-        # Ensure legacy databases get account_id column if missing
-        cur.execute("PRAGMA table_info(records)")
-        cols = [r[1] for r in cur.fetchall()]
-        if 'account_id' not in cols:
+        return self._backup_pages(self.conn, target, path, pages, sleep, progress)
+
+    def backup(self, dest: str, pages: int = 1024, sleep: float = 0.0,
+               progress: Optional[Callable[['BackupStats'], None]] = None) -> 'BackupStats':
+        """用 SQLite 在线备份 API 把数据库复制到 dest。
+
+        每一步只复制 pages 页并短暂持有读锁，步间写入者可以继续工作（其他连接的写入会让备份从头再来，
+        本连接的写入会直接同步到备份中）。先写到 dest 旁的临时文件，完成后原子替换，
+        因此 dest 要么是旧文件要么是完整的新备份。progress 在每一步后收到 BackupStats。
+        archives 表登记的归档库随后逐个复制到 archive_backup_path(dest, 年份)。
+        """
+        if self.in_transaction:
+            raise RuntimeError("cannot back up inside a transaction")
+        tmp = str(dest) + '.part'
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        target = sqlite3.connect(tmp)
+        try:
+            stats = self._backup_to(target, str(dest), pages, sleep, progress)
+            # 备份文件不带 -wal/-shm，独立可用
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+        os.replace(tmp, dest)
+        # 归档库（archival）不在主库文件中，逐个复制到备份旁边
+        for old in Path(dest).parent.glob(Path(dest).name + '.*.archive'):
+            old.unlink()
+        for year, path in self._archive_files():
+            if path.is_file():
+                _copy_database(path, archive_backup_path(dest, year))
+        return stats
+
+    def _archive_files(self) -> List[Tuple[int, Path]]:
+        """archives 表登记的各年份归档库文件（相对路径按数据库所在目录解析）。"""
+        if not self.has_table('archives'):
+            return []
+        out = []
+        for year, path in self.query("SELECT year, path FROM archives ORDER BY year", tuples=True):
+            p = Path(path)
+            out.append((year, p if p.is_absolute() else self.path.parent / p))
+        return out
+
+    def backup_rotating(self, directory: Optional[str] = None, keep: int = 5, **options) -> 'BackupStats':
+        """在 directory（默认为数据库旁的 backups/）中创建带时间戳的备份，只保留最新的 keep 个。"""
+        directory = Path(directory or self.path.parent / 'backups')
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        stats = self.backup(str(directory / f"{self.path.stem}.{stamp}.bak"), **options)
+        for old in list_backups(directory, self.path.stem)[keep:]:
+            for archive in directory.glob(old.name + '.*.archive'):
+                archive.unlink()
+            old.unlink()
+        return stats
+
+    def restore(self, src: str, pages: int = 1024,
+                progress: Optional[Callable[['BackupStats'], None]] = None) -> 'BackupStats':
+        """用备份 API 把 src 的内容写入当前数据库，不替换文件本身。
+
+        目标库在整个复制期间持有写锁，其他连接要么看到恢复前、要么看到恢复后的完整数据；
+        连接保持打开，完成后按需迁移到当前 schema 版本并使缓存失效。
+        备份旁边的归档库副本（archive_backup_path）恢复到恢复后 archives 表登记的位置。
+        """
+        if self.in_transaction:
+            raise RuntimeError("cannot restore inside a transaction")
+        if not Path(src).is_file():
+            raise FileNotFoundError(src)
+        source = sqlite3.connect(f"file:{Path(src).resolve()}?mode=ro", uri=True)
+        try:
+            check = source.execute("PRAGMA quick_check").fetchone()[0]
+            if check != 'ok':
+                raise ValueError(f"backup {src} failed integrity check: {check}")
+            self.conn.commit()
+            # 挂载着的归档库稍后可能被替换，先卸载；ArchiveSet 下次使用时重新挂载
+            for name in [r[1] for r in self.conn.execute("PRAGMA database_list")]:
+                if name.startswith('arc_'):
+                    self.conn.execute("DETACH DATABASE " + name)
+            stats = self._backup_pages(source, self.conn, str(src), pages, 0.0, progress)
+        finally:
+            source.close()
+        # 旧备份可能来自较早的 schema 版本
+        self._init_schema()
+        for year, path in self._archive_files():
+            copy = archive_backup_path(src, year)
+            if copy.is_file():
+                _copy_database(copy, path)
+        self.bump_generation()
+        return stats
+
+    def bump_generation(self) -> None:
+        self.generation += 1
+
+    def data_version(self) -> int:
+        """PRAGMA data_version：其他连接（含其他进程）提交修改后会变化，本连接自己的写入不会。"""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def has_table(self, name: str) -> bool:
+        rows = self.query("SELECT 1 FROM sqlite_master WHERE name = ?", (name,))
+        return bool(rows)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._tx_depth > 0
+
+    @contextmanager
+    def transaction(self) -> Iterator['Database']:
+        """在一个事务中执行一批写操作，退出时统一提交（异常时回滚）。
+
+        可以嵌套使用：内层通过 SAVEPOINT 实现，只回滚自己的部分。
+        在事务内调用 execute/executemany 不会单独提交，而是加入当前事务。
+        """
+        if self._tx_depth == 0:
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            self._tx_depth += 1
             try:
-                cur.execute('ALTER TABLE records ADD COLUMN account_id TEXT')
-                self.conn.commit()
-            except Exception:
-                # ignore if cannot alter (very old sqlite), but proceed
-                pass
-
-    def backup(self, dest: str) -> None:
-        # simple file copy of the sqlite file
-        import shutil
-        self.conn.commit()
-        shutil.copy2(str(self.path), dest)
+                yield self
+            except BaseException:
+                self._tx_depth -= 1
+                self.conn.rollback()
+                raise
+            self._tx_depth -= 1
+            self.conn.commit()
+        else:
+            name = f"sp_{self._tx_depth}"
+            self.conn.execute(f"SAVEPOINT {name}")
+            self._tx_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.conn.execute(f"ROLLBACK TO {name}")
+                self.conn.execute(f"RELEASE {name}")
+                raise
+            else:
+                self.conn.execute(f"RELEASE {name}")
+            finally:
+                self._tx_depth -= 1
 
-    def restore(self, src: str) -> None:
-        import shutil
-        self.conn.close()
-        shutil.copy2(src, str(self.path))
-        self.conn = sqlite3.connect(str(self.path))
-        self.conn.row_factory = sqlite3.Row
+    def enable_profiling(self, slow_ms: float = 100.0, log_path: Optional[str] = None,
+                         capture_plans: bool = True) -> QueryProfiler:
+        """开始统计经过 execute/executemany/query/iter_query 的语句，返回 QueryProfiler。"""
+        self.profiler = QueryProfiler(slow_ms, log_path, capture_plans)
+        return self.profiler
+
+    def disable_profiling(self) -> Optional[QueryProfiler]:
+        profiler, self.profiler = self.profiler, None
+        return profiler
 
     def execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        profiler = self.profiler
+        if profiler is not None:
+            t0 = time.perf_counter()
         cur = self.conn.cursor()
         cur.execute(sql, params)
-        self.conn.commit()
+        if not self._tx_depth:
+            self.conn.commit()
+        if profiler is not None:
+            profiler.record(self.conn, sql, params, time.perf_counter() - t0, max(cur.rowcount, 0))
         return cur
 
-    def query(self, sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
+    def executemany(self, sql: str, seq_of_params: Iterable[Tuple]) -> sqlite3.Cursor:
+        """批量执行同一条语句；不在事务中时整批只提交一次。"""
+        profiler = self.profiler
+        if profiler is not None:
+            t0 = time.perf_counter()
         cur = self.conn.cursor()
+        cur.executemany(sql, seq_of_params)
+        if not self._tx_depth:
+            self.conn.commit()
+        if profiler is not None:
+            # 批量语句不抓取执行计划（params 传 None）
+            profiler.record(self.conn, sql, None, time.perf_counter() - t0, max(cur.rowcount, 0))
+        return cur
+
+    def query(self, sql: str, params: Tuple = (), tuples: bool = False) -> List[sqlite3.Row]:
+        """执行查询并返回全部行。tuples=True 时返回普通 tuple，省去 sqlite3.Row 的开销。"""
+        profiler = self.profiler
+        if profiler is not None:
+            t0 = time.perf_counter()
+        cur = self.conn.cursor()
+        if tuples:
+            cur.row_factory = None
         cur.execute(sql, params)
-        return cur.fetchall()
+        rows = cur.fetchall()
+        if profiler is not None:
+            profiler.record(self.conn, sql, params, time.perf_counter() - t0, len(rows))
+        return rows
+
+    def iter_query(self, sql: str, params: Tuple = (), batch_size: int = 500,
+                   tuples: bool = False) -> Iterator[sqlite3.Row]:
+        """逐批 fetchmany 读取结果，调用方无需一次性持有全部行。tuples 含义同 query。
+
+        启用统计时只计入执行和取数的时间，不含调用方处理每批数据的时间。
+        """
+        profiler = self.profiler
+        conn = self.conn
+        elapsed = 0.0
+        count = 0
+        t0 = time.perf_counter()
+        cur = conn.cursor()
+        if tuples:
+            cur.row_factory = None
+        cur.execute(sql, params)
+        try:
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if profiler is not None:
+                    elapsed += time.perf_counter() - t0
+                    count += len(rows)
+                if not rows:
+                    break
+                yield from rows
+                t0 = time.perf_counter()
+        finally:
+            cur.close()
+            if profiler is not None:
+                profiler.record(conn, sql, params, elapsed, count)
 
     def close(self):
         self.conn.close()
+
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def _is_busy_error(e: sqlite3.OperationalError) -> bool:
+    msg = str(e).lower()
+    return 'locked' in msg or 'busy' in msg
+
+
+class PooledDatabase(Database):
+    """可在多线程间共享的 Database：WAL 日志、每线程一个读连接、一个串行化的写连接。
+
+    - 写操作（execute/executemany/transaction）全部经过同一个写连接，由可重入锁串行化；
+      事务以 BEGIN IMMEDIATE 开始，遇到其他进程持有写锁时按指数退避重试。
+    - 查询在当前线程自己的读连接上执行；WAL 模式下读者不会被写者阻塞，看到的是最近一次提交的快照。
+      在本线程的 transaction() 内部，查询改走写连接，以便读到事务中尚未提交的修改。
+    - 对外接口与 Database 相同，现有服务无需修改即可使用。
+    """
+    def __init__(self, path: Optional[str] = None, synchronous: str = 'NORMAL', busy_timeout: float = 5.0,
+                 retries: int = 5, retry_backoff: float = 0.01):
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {SYNCHRONOUS_MODES}, got {synchronous!r}")
+        self.path = Path(path or Path.cwd() / "accounting.db")
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+        # 所有读连接，按线程 id 登记，close()/restore() 时统一关闭
+        self._readers: Dict[int, sqlite3.Connection] = {}
+        self._readers_lock = threading.Lock()
+        # restore() 后递增，各线程据此发现自己的读连接已失效
+        self._epoch = 0
+        # 写连接每次提交后递增；与外部连接的 data_version 一起作为 data_version() 的返回值
+        self._commits = 0
+        self._external_version = 0
+        self._tx_depth = 0
+        self.generation = 0
+        self.profiler = None
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        with self._writing():
+            self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        # timeout 即 SQLite 的 busy timeout；check_same_thread=False 以便 close() 在任意线程关闭连接
+        conn = sqlite3.connect(str(self.path), timeout=self.busy_timeout, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        return conn
+
+    def _retry(self, fn: Callable[[], Any]) -> Any:
+        """busy timeout 用尽后仍报 locked/busy 时按指数退避重试 retries 次。"""
+        for attempt in range(self.retries + 1):
+            try:
+                return fn()
+            except sqlite3.OperationalError as e:
+                if attempt == self.retries or not _is_busy_error(e):
+                    raise
+                time.sleep(min(self.retry_backoff * (2 ** attempt), 1.0))
+
+    @contextmanager
+    def _writing(self) -> Iterator[sqlite3.Connection]:
+        """持有写锁期间，本线程的 self.conn 指向写连接。"""
+        with self._write_lock:
+            self._local.writing = getattr(self._local, 'writing', 0) + 1
+            try:
+                yield self._writer
+            finally:
+                self._local.writing -= 1
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'reader', None)
+        if conn is not None and self._local.epoch == self._epoch:
+            return conn
+        conn = self._connect()
+        ident = threading.get_ident()
+        with self._readers_lock:
+            old = self._readers.get(ident)
+            self._readers[ident] = conn
+        if old is not None and old is not getattr(self._local, 'reader', None):
+            # 线程 id 被新线程复用，旧线程留下的连接已无人使用
+            old.close()
+        self._local.reader = conn
+        self._local.epoch = self._epoch
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if getattr(self._local, 'writing', 0):
+            return self._writer
+        return self._reader()
+
+    @property
+    def in_transaction(self) -> bool:
+        return bool(getattr(self._local, 'writing', 0)) and self._tx_depth > 0
+
+    @contextmanager
+    def transaction(self) -> Iterator['Database']:
+        with self._writing() as conn:
+            outer = self._tx_depth == 0
+            if outer and not conn.in_transaction:
+                self._retry(lambda: conn.execute("BEGIN IMMEDIATE"))
+            with super().transaction() as db:
+                yield db
+            if outer:
+                self._commits += 1
+
+    def execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        with self._writing():
+            if self._tx_depth:
+                return super().execute(sql, params)
+            cur = self._retry(lambda: super(PooledDatabase, self).execute(sql, params))
+            self._commits += 1
+            return cur
+
+    def executemany(self, sql: str, seq_of_params: Iterable[Tuple]) -> sqlite3.Cursor:
+        with self._writing():
+            if self._tx_depth:
+                return super().executemany(sql, seq_of_params)
+            # 参数可能是生成器，重试前先固定下来
+            seq_of_params = list(seq_of_params)
+            cur = self._retry(lambda: super(PooledDatabase, self).executemany(sql, seq_of_params))
+            self._commits += 1
+            return cur
+
+    def query(self, sql: str, params: Tuple = (), tuples: bool = False) -> List[sqlite3.Row]:
+        return self._retry(lambda: super(PooledDatabase, self).query(sql, params, tuples))
+
+    def data_version(self) -> Tuple[int, int]:
+        """(本进程写连接的提交次数, 写连接上的 PRAGMA data_version)。
+
+        各线程读连接的 data_version 互不可比，所以不用它们；外部进程的提交由写连接的 data_version 发现。
+        写连接正被其他线程占用时不等待，沿用上次读到的值（那个线程提交时 _commits 会变化）。
+        """
+        if self._write_lock.acquire(blocking=False):
+            try:
+                self._external_version = self._writer.execute("PRAGMA data_version").fetchone()[0]
+            finally:
+                self._write_lock.release()
+        return (self._commits, self._external_version)
+
+    def _close_readers(self) -> None:
+        with self._readers_lock:
+            readers = list(self._readers.values())
+            self._readers.clear()
+            self._epoch += 1
+        for conn in readers:
+            conn.close()
+
+    def _backup_to(self, target: sqlite3.Connection, path: str, pages: int, sleep: float,
+                   progress: Optional[Callable[[BackupStats], None]]) -> BackupStats:
+        # 在本线程的读连接上开一个读事务再分步复制：WAL 下读事务固定了快照且不阻塞写连接，
+        # 写入者全程不停，备份也不会因为步间的提交而从头再来
+        conn = self._reader()
+        conn.commit()
+        conn.execute("BEGIN")
+        try:
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            return self._backup_pages(conn, target, path, pages, sleep, progress)
+        finally:
+            conn.rollback()
+
+    def restore(self, src: str, pages: int = 1024,
+                progress: Optional[Callable[[BackupStats], None]] = None) -> BackupStats:
+        with self._writing():
+            stats = super().restore(src, pages, progress)
+            self._writer.execute("PRAGMA journal_mode = WAL")
+            self._commits += 1
+            # 读连接重新打开，丢弃它们的 schema 缓存和临时表
+            self._close_readers()
+        return stats
+
+    def close(self):
+        with self._writing():
+            self._close_readers()
+            self._writer.close()
@@ -7,42 +7,206 @@
 设计要点：
 - 导入时不会覆盖已有记录（使用 record_id 判断）
 - 导入/导出使用 UTF-8，支持中文备注
+- 导出经 Database.iter_query 分块读取并写出（计入查询统计），内存占用与记录总数无关；路径以 .gz 结尾时输出 gzip
+- 导入先分块写入临时表，再用一条 INSERT ... SELECT（反连接去重）在同一事务内落库
 """
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Optional, Callable, Union, List, Tuple, Iterable
 import csv
+import gzip
+import time
 from datetime import date
-from .db import Database
-from .models import Record, RecordType
+from itertools import islice
+try:
+    from .db import Database, TS_NOW_SQL, BULK_LOADING_FLAG, index_inserted_records, derive_inserted_records
+    from .models import Record, RecordType
+    from .query import RecordQuery
+    from .services import AccountService, budget_check_key, check_budgets
+except Exception:
+    # fallback for running module as script from code/ folder
+    from db import Database, TS_NOW_SQL, BULK_LOADING_FLAG, index_inserted_records, derive_inserted_records
+    from models import Record, RecordType
+    from query import RecordQuery
+    from services import AccountService, budget_check_key, check_budgets
 import json
 
 
+EXPORT_COLUMNS = ['record_id', 'amount', 'type', 'date', 'category_id', 'tags', 'note', 'attachments', 'account_id']
+
+
+@dataclass
+class ExportStats:
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else float(self.rows)
+
+
+def export_records(db: Database, path: str, start: Optional[date] = None, end: Optional[date] = None,
+                   account_id: Optional[str] = None, category_id: Optional[str] = None,
+                   rtype: Optional[Union[RecordType, str]] = None, compress: Optional[bool] = None,
+                   chunk_size: int = 5000,
+                   progress: Optional[Callable[[ExportStats], None]] = None,
+                   query: Optional[RecordQuery] = None) -> ExportStats:
+    """流式导出记录到 CSV，是所有 CSV 导出的统一入口。
+
+    - start/end 可以只给一端；account_id、category_id、rtype 为可选筛选条件
+    - compress 为 None 时根据 path 是否以 .gz 结尾决定是否 gzip 压缩
+    - 每写完一块 (chunk_size 行) 调用一次 progress(ExportStats)，可据此显示行/秒
+    - 给出 query（RecordQuery）时在其上叠加以上筛选条件，可使用金额区间、标签、全文等条件和排序
+    """
+    query = RecordQuery.from_filters(query or RecordQuery(order=None),
+                                     **{k: v for k, v in (('start', start), ('end', end), ('account_id', account_id),
+                                                          ('category_id', category_id), ('type', rtype)) if v})
+    sql, params = query.select(', '.join(f'records.{c}' for c in EXPORT_COLUMNS), db.has_table('records_fts'))
+    if compress is None:
+        compress = str(path).endswith('.gz')
+    opener = gzip.open if compress else open
+    t0 = time.perf_counter()
+    written = 0
+    rows = db.iter_query(sql, params, chunk_size, tuples=True)
+    try:
+        with opener(path, 'wt', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_COLUMNS)
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                writer.writerows(chunk)
+                written += len(chunk)
+                if progress:
+                    progress(ExportStats(written, time.perf_counter() - t0))
+    finally:
+        rows.close()
+    return ExportStats(written, time.perf_counter() - t0)
+
+
 def export_to_csv(db: Database, csv_path: str, start: Optional[date] = None, end: Optional[date] = None) -> None:
     """导出记录到 csv_path。"""
-    sql = "SELECT * FROM records"
-    params = ()
-    if start and end:
-        sql += " WHERE date BETWEEN ? AND ?"
-        params = (start.isoformat(), end.isoformat())
-    rows = db.query(sql, params)
-    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['record_id', 'amount', 'type', 'date', 'category_id', 'tags', 'note', 'attachments'])
-        for r in rows:
-            writer.writerow([r['record_id'], r['amount'], r['type'], r['date'], r['category_id'], r['tags'], r['note'], r['attachments']])
+    export_records(db, csv_path, start, end)
+
+
+@dataclass
+class ImportResult:
+    added: int = 0
+    skipped: int = 0  # record_id 已存在（或文件内重复）的行
+    malformed: List[Tuple[int, str]] = field(default_factory=list)  # (行号, 原因)
+
+
+# 导入期间使用的页缓存大小（负数表示 KiB），约 128MB
+IMPORT_CACHE_SIZE = -131072
+
+_STAGE_COLUMNS = 'record_id, amount, type, date, category_id, account_id, tags, note, attachments'
+
+
+_VALID_TYPES = frozenset(t.value for t in RecordType)
+
+
+def _make_row_parser(header: List[str]) -> Callable[[List[str]], Tuple]:
+    """根据表头生成按列位置取值的解析函数（比 DictReader 逐行建 dict 快得多）。"""
+    pos = {name: i for i, name in enumerate(header)}
+    for required in ('record_id', 'amount', 'type', 'date'):
+        if required not in pos:
+            raise ValueError(f'csv header is missing column {required!r}')
+    i_id, i_amount, i_type, i_date = pos['record_id'], pos['amount'], pos['type'], pos['date']
+    optional = [pos.get(name) for name in ('category_id', 'account_id', 'tags', 'note', 'attachments')]
+    defaults = (None, None, '[]', None, '[]')
+
+    def parse(row: List[str]) -> Tuple:
+        record_id = row[i_id].strip()
+        if not record_id:
+            raise ValueError('missing record_id')
+        amount = float(row[i_amount])
+        rtype = row[i_type]
+        if rtype not in _VALID_TYPES:
+            raise ValueError(f'invalid type {rtype!r}')
+        date_str = row[i_date]
+        date.fromisoformat(date_str)  # 只做校验
+        extra = tuple((row[i] if i is not None and i < len(row) else None) or d for i, d in zip(optional, defaults))
+        return (record_id, amount, rtype, date_str) + extra
+
+    return parse
+
+
+def bulk_insert_rows(db: Database, chunks: Iterable[List[Tuple]]) -> Tuple[int, int]:
+    """把按 _STAGE_COLUMNS 顺序的行块批量写入 records，返回 (读入行数, 新增行数)。
+
+    行块先写入临时表，最后用一条反连接 INSERT 跳过已存在的 record_id，全部在一个事务中完成；
+    插入期间关闭逐行触发器，全文索引、标签、日汇总、余额、预算和同步日志随后各用一条集合式语句补齐，
+    再对新支出检查预算阈值；
+    期间临时放大页缓存，大批量写入时索引维护能少很多磁盘往返。CSV 导入和归档载入共用这条路径。
+    """
+    staged = 0
+    old_cache = db.query("PRAGMA cache_size")[0][0]
+    db.execute(f"PRAGMA cache_size = {IMPORT_CACHE_SIZE}")
+    try:
+        with db.transaction():
+            db.execute("DROP TABLE IF EXISTS temp.import_stage")
+            db.execute("CREATE TEMP TABLE import_stage (record_id TEXT PRIMARY KEY, amount REAL NOT NULL, type TEXT NOT NULL, "
+                       "date TEXT NOT NULL, category_id TEXT, account_id TEXT, tags TEXT, note TEXT, attachments TEXT)")
+            insert_stage = f"INSERT OR IGNORE INTO temp.import_stage({_STAGE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            for chunk in chunks:
+                db.executemany(insert_stage, chunk)
+                staged += len(chunk)
+            # 插入触发器在 bulk_loading 期间跳过；新记录的 rowid 都大于插入前的最大 rowid，
+            # 之后按这个区间每张派生表一条集合式语句补齐
+            last_rowid = db.query("SELECT COALESCE(MAX(rowid), 0) FROM records")[0][0]
+            db.execute("INSERT INTO meta(key, value) VALUES (?, '1')", (BULK_LOADING_FLAG,))
+            cur = db.execute(f"INSERT INTO records({_STAGE_COLUMNS}, updated_at) SELECT {_STAGE_COLUMNS}, {TS_NOW_SQL} "
+                             f"FROM temp.import_stage s "
+                             f"WHERE NOT EXISTS (SELECT 1 FROM records r WHERE r.record_id = s.record_id)")
+            added = cur.rowcount
+            if added > 0:
+                index_inserted_records(db.conn, last_rowid)
+                derive_inserted_records(db.conn, last_rowid)
+            db.execute("DELETE FROM meta WHERE key = ?", (BULK_LOADING_FLAG,))
+            db.execute("DROP TABLE temp.import_stage")
+            if added > 0:
+                AccountService(db).refresh_stale_checkpoints()
+                # 逐条写入时 RecordService 会检查预算阈值；这里对新支出涉及的 (周, 月, 分类) 一次性补上
+                check_budgets(db, (budget_check_key(date.fromisoformat(d), c) for d, c in db.query(
+                    "SELECT DISTINCT date, category_id FROM records WHERE rowid > ? AND type = 'expense'",
+                    (last_rowid,), tuples=True)))
+    finally:
+        db.execute(f"PRAGMA cache_size = {old_cache}")
+    return staged, added
+
+
+def bulk_import_csv(db: Database, csv_path: str, chunk_size: int = 10000) -> ImportResult:
+    """高吞吐导入 CSV（支持 .gz），返回 ImportResult。
+
+    按 chunk_size 分块解析后交给 bulk_insert_rows。格式错误的行不会中断导入，而是连同行号记录在 malformed 中。
+    """
+    result = ImportResult()
+    opener = gzip.open if str(csv_path).endswith('.gz') else open
+
+    def chunks():
+        with opener(csv_path, 'rt', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            parse = _make_row_parser(next(reader, []))
+            chunk: List[Tuple] = []
+            for row in reader:
+                if not row:
+                    continue
+                try:
+                    chunk.append(parse(row))
+                except (IndexError, ValueError) as e:
+                    result.malformed.append((reader.line_num, str(e) or type(e).__name__))
+                    continue
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    staged, result.added = bulk_insert_rows(db, chunks())
+    result.skipped = staged - result.added
+    return result
 
 
 def import_from_csv(db: Database, csv_path: str) -> int:
-    """从 csv 导入记录，返回导入的记录数。"""
-    added = 0
-    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # 简单重复检查：如果 record_id 存在则跳过
-            exist = db.query('SELECT 1 FROM records WHERE record_id = ?', (row['record_id'],))
-            if exist:
-                continue
-            # 插入
-            db.execute('INSERT INTO records(record_id, amount, type, date, category_id, tags, note, attachments) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                       (row['record_id'], float(row['amount']), row['type'], row['date'], row.get('category_id'), row.get('tags'), row.get('note'), row.get('attachments')))
-            added += 1
-    return added
+    """从 csv 导入记录，返回导入的记录数。详细结果见 bulk_import_csv。"""
+    return bulk_import_csv(db, csv_path).added
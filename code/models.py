@@ -1,16 +1,21 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from enum import Enum
 from typing import List, Optional
+import json
+import sys
 import uuid
 from datetime import date, datetime
 
+# Python 3.10+ 上模型使用 __slots__，每个实例省去 __dict__，大批量读取时内存和分配明显减少
+_DC_OPTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
 
 class RecordType(Enum):
     INCOME = "income"
     EXPENSE = "expense"
 
 
-@dataclass
+@dataclass(**_DC_OPTS)
 class Category:
     category_id: str
     name: str
@@ -18,7 +23,7 @@ class Category:
     color: Optional[str] = None
 
 
-@dataclass
+@dataclass(**_DC_OPTS)
 class Account:
     account_id: str
     name: str
@@ -27,7 +32,7 @@ class Account:
     currency: str = 'CNY'
 
 
-@dataclass
+@dataclass(**_DC_OPTS)
 class Budget:
     budget_id: str
     category_id: Optional[str]
@@ -35,7 +40,7 @@ class Budget:
     period: str  # e.g., 'monthly', 'weekly'
 
 
-@dataclass
+@dataclass(**_DC_OPTS)
 class Notification:
     notif_id: str
     type: str
@@ -43,7 +48,7 @@ class Notification:
     timestamp: datetime = field(default_factory=datetime.utcnow)
 
 
-@dataclass
+@dataclass(**_DC_OPTS)
 class Record:
     """表示一条收支记录。
 
@@ -87,3 +92,75 @@ class Record:
             account_id=account_id,
         )
 
+
+
+@dataclass(**_DC_OPTS)
+class RecurringRule:
+    """周期性收支规则（工资、房租、订阅等），由 recurring.RecurringService 按期生成记录。
+
+    - frequency: 'daily' / 'weekly' / 'monthly' / 'yearly'，每 interval 个周期发生一次（如每 2 周）
+    - start: 第一次发生的日期，也是之后各次的锚点；每月 31 日的规则在小月落在月末
+    - end: 最后可能发生的日期（含），None 表示一直重复
+    - materialized_through: 已生成到哪一天（含），在此之前的各次不会再生成
+    """
+    rule_id: str
+    amount: float
+    type: RecordType
+    frequency: str
+    start: date
+    interval: int = 1
+    end: Optional[date] = None
+    category_id: Optional[str] = None
+    account_id: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+    note: Optional[str] = None
+    materialized_through: Optional[date] = None
+
+
+def _lazy_json_list(name: str) -> property:
+    """StoredRecord 的 tags/attachments：保存原始 JSON 文本，首次访问时才解码并缓存。"""
+    raw_attr = f'_{name}_json'
+    slot = Record.__dict__.get(name)  # slots 模式下是父类的成员描述符
+    if slot is not None:
+        get_value, set_value = slot.__get__, slot.__set__
+    else:
+        def get_value(obj, owner=None):
+            return obj.__dict__[name]
+
+        def set_value(obj, value):
+            obj.__dict__[name] = value
+
+    def fget(self):
+        raw = getattr(self, raw_attr, None)
+        if raw is not None:
+            set_value(self, json.loads(raw) if raw else [])
+            setattr(self, raw_attr, None)
+        return get_value(self, type(self))
+
+    def fset(self, value):
+        setattr(self, raw_attr, None)
+        set_value(self, value)
+
+    return property(fget, fset)
+
+
+_RECORD_FIELDS = tuple(f.name for f in fields(Record))
+
+
+class StoredRecord(Record):
+    """从数据库读出的 Record。
+
+    与 Record 用法完全相同，只是 tags/attachments 延迟到第一次访问时才做 JSON 解码；
+    只展示金额、日期的批量列表因此不必为每行解析两段 JSON。
+    """
+    __slots__ = ('_tags_json', '_attachments_json')
+
+    tags = _lazy_json_list('tags')
+    attachments = _lazy_json_list('attachments')
+
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return NotImplemented
+        return all(getattr(self, n) == getattr(other, n) for n in _RECORD_FIELDS)
+
+    __hash__ = None
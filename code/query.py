@@ -0,0 +1,235 @@
+"""记录查询构造器：搜索、列表、导出和统计共用的一套筛选条件。
+
+RecordQuery 是不可变的筛选描述：日期区间（可以只给一端）、账户、分类、收支类型、金额区间、全文、标签、排序和分页。
+它生成带 ? 占位符的 SQL，SQL 文本只取决于设置了哪些条件（语句形状），与具体取值无关：
+- 形状到 SQL 的编译结果缓存在有界 LRU 中，重复查询不必重新拼接；
+- 相同的 SQL 文本会命中 sqlite3 连接的预编译语句缓存（Database 的 cached_statements），SQLite 不必重新解析和规划。
+标签列表作为一个 JSON 参数交给 json_each，标签个数也不会改变语句形状。
+所有条件都写成对索引列的等值/范围比较（records 上的 account_id/category_id/date 复合索引、record_tags、FTS），
+不在列上套函数。
+"""
+from dataclasses import dataclass, replace
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
+import json
+try:
+    from .models import RecordType
+except Exception:
+    from models import RecordType
+
+
+# 不同语句形状的编译缓存条数；小于 db.STATEMENT_CACHE_SIZE，使缓存中的 SQL 文本对应的预编译语句一般也还在连接的缓存里
+STATEMENT_SHAPE_CACHE = 256
+
+# 排序方式 -> ORDER BY 子句。date_* 以 record_id 作为次序键，保证顺序稳定并可用于游标分页
+ORDERS = {
+    'date_desc': 'records.date DESC, records.record_id DESC',
+    'date_asc': 'records.date ASC, records.record_id ASC',
+    'amount_desc': 'records.amount DESC, records.record_id DESC',
+    'amount_asc': 'records.amount ASC, records.record_id ASC',
+    'rank': 'records_fts.rank',  # 仅在全文条件走 FTS 索引时有效，否则退回 date_desc
+}
+
+
+def _fts_match_expr(text: str) -> Optional[str]:
+    """把用户输入转换为 FTS5 MATCH 表达式：空白分隔的词按 AND 组合，词尾 * 表示前缀。
+
+    trigram 分词要求每个词至少 3 个字符，否则返回 None，由调用方退回 LIKE。
+    """
+    terms = []
+    for raw in text.split():
+        prefix = raw.endswith('*')
+        term = raw.rstrip('*')
+        if len(term) < 3:
+            return None
+        terms.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return " ".join(terms) if terms else None
+
+
+@lru_cache(maxsize=STATEMENT_SHAPE_CACHE)
+def _compile(source: str, columns: str, join: str, shape: Tuple, group_by: Optional[str], order: Optional[str],
+             schema: str = "") -> str:
+    """按语句形状生成 SQL。shape 见 RecordQuery._shape；参数顺序与 RecordQuery._params 一致。
+
+    schema 非空时查询 ATTACH 进来的同结构数据库（归档库）中的表；列引用仍写作 records.xxx。
+    """
+    start, end, account, category, rtype, lo, hi, match, like_table, like_terms, tags_any, tags_all, after, limit, offset = shape
+    table, day = ('daily_rollup', 'day') if source == 'rollup' else ('records', 'date')
+    prefix = schema + "." if schema else ""
+    sql = f"SELECT {columns} FROM {prefix}{table}"
+    if join:
+        sql += " " + join
+    where = []
+    if match:
+        sql += f" JOIN {prefix}records_fts ON records_fts.rowid = records.rowid"
+        where.append("records_fts MATCH ?")
+    if start:
+        where.append(f"{table}.{day} >= ?")
+    if end:
+        where.append(f"{table}.{day} <= ?")
+    if account:
+        where.append(f"{table}.account_id = ?")
+    if category:
+        where.append(f"{table}.category_id = ?")
+    if rtype:
+        where.append(f"{table}.type = ?")
+    if lo:
+        where.append("records.amount >= ?")
+    if hi:
+        where.append("records.amount <= ?")
+    if tags_any:
+        where.append(f"records.record_id IN (SELECT record_id FROM {prefix}record_tags WHERE tag IN (SELECT value FROM json_each(?)))")
+    if tags_all:
+        where.append(f"records.record_id IN (SELECT record_id FROM {prefix}record_tags WHERE tag IN (SELECT value FROM json_each(?)) "
+                     "GROUP BY record_id HAVING COUNT(*) = ?)")
+    # 词太短无法走 trigram 索引：在展开后的全文表上 LIKE，不会匹配到 tags 的 JSON 编码
+    where.extend([f"records.rowid IN (SELECT rowid FROM {prefix}{like_table} WHERE note LIKE ? OR tags LIKE ?)"] * like_terms)
+    if after:
+        where.append(f"(records.date, records.record_id) {'>' if order == 'date_asc' else '<'} (?, ?)")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if group_by:
+        sql += f" GROUP BY {group_by}"
+    if order:
+        sql += f" ORDER BY {ORDERS[order]}"
+    if limit or offset:
+        sql += " LIMIT ?"
+    if offset:
+        sql += " OFFSET ?"
+    return sql
+
+
+@dataclass(frozen=True)
+class RecordQuery:
+    """记录的筛选、排序和分页条件。所有字段都可选；用 replace() 派生新的查询。
+
+    - start/end：日期闭区间，可以只给一端
+    - min_amount/max_amount：金额闭区间
+    - text：全文条件，规则同 SearchService.search
+    - tags_any：至少带有其中一个标签；tags_all：同时带有全部标签
+    - order：ORDERS 中的键，None 表示不排序；after=(date, record_id) 为 date_* 排序下的游标位置（不含）
+    """
+    start: Optional[date] = None
+    end: Optional[date] = None
+    account_id: Optional[str] = None
+    category_id: Optional[str] = None
+    type: Optional[RecordType] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    text: str = ""
+    tags_any: Tuple[str, ...] = ()
+    tags_all: Tuple[str, ...] = ()
+    order: Optional[str] = 'date_desc'
+    limit: Optional[int] = None
+    offset: int = 0
+    after: Optional[Tuple[str, str]] = None
+
+    def __post_init__(self):
+        if isinstance(self.type, str):
+            object.__setattr__(self, 'type', RecordType(self.type))
+        object.__setattr__(self, 'tags_any', tuple(sorted(set(self.tags_any or ()))))
+        object.__setattr__(self, 'tags_all', tuple(sorted(set(self.tags_all or ()))))
+        if self.order is not None and self.order not in ORDERS:
+            raise ValueError(f'unknown order {self.order!r}; expected one of {", ".join(ORDERS)}')
+        if self.after is not None and self.order not in ('date_desc', 'date_asc'):
+            raise ValueError('after (cursor) requires order date_desc or date_asc')
+
+    @classmethod
+    def from_filters(cls, filters: Optional[Union['RecordQuery', Dict[str, Any]]], **changes) -> 'RecordQuery':
+        """从旧式的 filters 字典（start, end, account_id, category_id, type, min_amount, max_amount ...）构造。
+
+        filters 已经是 RecordQuery 时直接在其上应用 changes；值为 None 的键忽略。
+        """
+        if isinstance(filters, RecordQuery):
+            return filters.replace(**changes) if changes else filters
+        values = {k: v for k, v in (filters or {}).items() if v is not None}
+        values.update(changes)
+        return cls(**values)
+
+    def replace(self, **changes) -> 'RecordQuery':
+        return replace(self, **changes)
+
+    @property
+    def rollup_compatible(self) -> bool:
+        """只含日期/账户/分类/类型条件时，可以直接在 daily_rollup 日汇总表上统计。"""
+        return (self.min_amount is None and self.max_amount is None and not self.text
+                and not self.tags_any and not self.tags_all and self.after is None)
+
+    def effective_order(self, fts: bool = True) -> Optional[str]:
+        """select() 实际使用的排序：没有可走 FTS 索引的全文条件时 rank 退回 date_desc。"""
+        if self.order == 'rank' and not self._text(fts)[0]:
+            return 'date_desc'
+        return self.order
+
+    def _text(self, fts: bool) -> Tuple[Optional[str], List[str]]:
+        if not self.text:
+            return None, []
+        match = _fts_match_expr(self.text) if fts else None
+        if match:
+            return match, []
+        return None, [f"%{term.rstrip('*')}%" for term in self.text.split()]
+
+    def _shape(self, match: Optional[str], like_terms: int, fts: bool) -> Tuple:
+        return (self.start is not None, self.end is not None, bool(self.account_id), bool(self.category_id),
+                self.type is not None, self.min_amount is not None, self.max_amount is not None, match is not None,
+                'records_fts' if fts else 'records', like_terms, bool(self.tags_any), bool(self.tags_all),
+                self.after is not None, self.limit is not None, bool(self.offset))
+
+    def _params(self, match: Optional[str], likes: List[str]) -> Tuple:
+        params: List[Any] = []
+        if match:
+            params.append(match)
+        if self.start is not None:
+            params.append(self.start.isoformat())
+        if self.end is not None:
+            params.append(self.end.isoformat())
+        if self.account_id:
+            params.append(self.account_id)
+        if self.category_id:
+            params.append(self.category_id)
+        if self.type is not None:
+            params.append(self.type.value)
+        if self.min_amount is not None:
+            params.append(self.min_amount)
+        if self.max_amount is not None:
+            params.append(self.max_amount)
+        if self.tags_any:
+            params.append(json.dumps(self.tags_any))
+        if self.tags_all:
+            params.extend([json.dumps(self.tags_all), len(self.tags_all)])
+        for like in likes:
+            params.extend([like, like])
+        if self.after is not None:
+            params.extend(self.after)
+        if self.limit is not None or self.offset:
+            params.append(self.limit if self.limit is not None else -1)
+        if self.offset:
+            params.append(self.offset)
+        return tuple(params)
+
+    def select(self, columns: str, fts: bool = True, join: str = "", group_by: Optional[str] = None,
+               ordered: bool = True, schema: str = "") -> Tuple[str, Tuple]:
+        """生成 records 上的 SELECT，返回 (sql, params)。
+
+        columns/join/group_by 中引用 records 的列时需写成 records.xxx（全文条件会 JOIN records_fts，列名有重名）。
+        fts=False 表示数据库没有 records_fts，全文条件退回 records 上的 LIKE。ordered=False 时忽略 order（聚合查询）。
+        schema 为 ATTACH 的数据库名时查询该库中的表（见 archival）。
+        """
+        match, likes = self._text(fts)
+        order = self.effective_order(fts) if ordered else None
+        sql = _compile('records', columns, join, self._shape(match, len(likes), fts), group_by, order, schema)
+        return sql, self._params(match, likes)
+
+    def rollup(self, columns: str, group_by: Optional[str] = None, join: str = "") -> Tuple[str, Tuple]:
+        """生成 daily_rollup 上的聚合 SELECT；只适用于 rollup_compatible 的查询，分页和排序被忽略。"""
+        if not self.rollup_compatible:
+            raise ValueError('query has conditions daily_rollup cannot answer; aggregate over records instead')
+        q = self.replace(limit=None, offset=0)
+        sql = _compile('rollup', columns, join, q._shape(None, 0, False), group_by, None)
+        return sql, q._params(None, [])
+
+
+def statement_cache_info():
+    """语句形状编译缓存的命中情况（functools 的 CacheInfo）。"""
+    return _compile.cache_info()
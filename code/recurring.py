@@ -0,0 +1,210 @@
+"""周期性收支：规则存放在 recurring_rules 表中，按需把到期的各次发生批量写入 records。
+
+- 每次发生的记录 id 由 (rule_id, 日期) 经 uuid5 确定（occurrence_id），写入用 INSERT OR IGNORE，
+  重复执行、中途失败后重试或多个进程同时补写都不会产生重复记录；
+- materialize() 在一个事务中补齐所有规则到某一天为止的发生（停机一年后也只是一次批量写入），
+  并推进各规则的 materialized_through；之后用户删除的生成记录不会被再次生成；
+- upcoming()/projected_summary() 读取尚未生成的未来发生（虚拟记录），不写数据库。
+
+用法：
+    rs = RecurringService(db)
+    rs.add_rule(RecurringRule(rule_id='rent', amount=3000, type=RecordType.EXPENSE, frequency='monthly',
+                              start=date(2024, 1, 5), account_id='bank'))
+    rs.materialize()                                   # 生成截至今天的各次发生
+    rs.upcoming(date.today(), date.today() + timedelta(days=30))
+"""
+import calendar
+import json
+import uuid
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+try:
+    from .db import Database, TS_NOW_SQL
+    from .models import Record, RecordType, RecurringRule
+    from .services import RecordService, ReferenceCache, StatisticsService
+    from .currency import BASE_CURRENCY, RateResolver
+except Exception:
+    from db import Database, TS_NOW_SQL
+    from models import Record, RecordType, RecurringRule
+    from services import RecordService, ReferenceCache, StatisticsService
+    from currency import BASE_CURRENCY, RateResolver
+
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+
+# 生成记录 id 的命名空间；改变它会让已生成的记录与之后生成的对不上
+OCCURRENCE_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'accounting:recurring-occurrence')
+
+_RULE_COLUMNS = ('rule_id, amount, type, frequency, interval, start_date, end_date, category_id, account_id, '
+                 'tags, note, materialized_through')
+
+
+def occurrence_id(rule_id: str, day: date) -> str:
+    """规则在 day 那次发生对应的记录 id。"""
+    return str(uuid.uuid5(OCCURRENCE_NAMESPACE, f"{rule_id}/{day.isoformat()}"))
+
+
+def _add_months(day: date, months: int) -> date:
+    y, m = divmod(day.month - 1 + months, 12)
+    year, month = day.year + y, m + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _nth(rule: RecurringRule, n: int) -> date:
+    """第 n 次（从 0 开始）发生的日期。按月/年的规则总是从 start 推算，不会因为经过小月而漂移到 28 日。"""
+    step = n * rule.interval
+    if rule.frequency == 'daily':
+        return rule.start + timedelta(days=step)
+    if rule.frequency == 'weekly':
+        return rule.start + timedelta(weeks=step)
+    return _add_months(rule.start, step * (12 if rule.frequency == 'yearly' else 1))
+
+
+def occurrences(rule: RecurringRule, start: date, end: date) -> Iterator[date]:
+    """rule 在 [start, end] 内的发生日期，升序；不超过 rule.end。"""
+    if rule.end is not None and rule.end < end:
+        end = rule.end
+    if end < rule.start or end < start:
+        return
+    # 直接跳到 start 附近，不从第一次开始逐个推算
+    if rule.frequency in ('daily', 'weekly'):
+        days = 1 if rule.frequency == 'daily' else 7
+        n = max(0, (start - rule.start).days // (days * rule.interval))
+    else:
+        months = (start.year - rule.start.year) * 12 + start.month - rule.start.month
+        n = max(0, months // (rule.interval * (12 if rule.frequency == 'yearly' else 1)) - 1)
+    while True:
+        day = _nth(rule, n)
+        if day > end:
+            return
+        if day >= start:
+            yield day
+        n += 1
+
+
+def occurrence_record(rule: RecurringRule, day: date) -> Record:
+    return Record(record_id=occurrence_id(rule.rule_id, day), amount=rule.amount, type=rule.type, date=day,
+                  category_id=rule.category_id, tags=list(rule.tags), note=rule.note, account_id=rule.account_id)
+
+
+def _pending_from(rule: RecurringRule) -> date:
+    """尚未生成的第一天。"""
+    if rule.materialized_through is None:
+        return rule.start
+    return max(rule.start, rule.materialized_through + timedelta(days=1))
+
+
+def _rule_from_row(r) -> RecurringRule:
+    return RecurringRule(rule_id=r[0], amount=r[1], type=RecordType(r[2]), frequency=r[3], interval=r[4],
+                         start=date.fromisoformat(r[5]), end=date.fromisoformat(r[6]) if r[6] else None,
+                         category_id=r[7], account_id=r[8], tags=json.loads(r[9]) if r[9] else [], note=r[10],
+                         materialized_through=date.fromisoformat(r[11]) if r[11] else None)
+
+
+class RecurringService:
+    """周期性规则的管理、批量生成和未来发生的预览。"""
+    def __init__(self, db: Database):
+        self.db = db
+
+    @staticmethod
+    def _validate(rule: RecurringRule) -> None:
+        if rule.frequency not in FREQUENCIES:
+            raise ValueError(f'unknown frequency {rule.frequency!r}; expected one of {", ".join(FREQUENCIES)}')
+        if rule.interval < 1:
+            raise ValueError('interval must be a positive integer')
+        if rule.end is not None and rule.end < rule.start:
+            raise ValueError('end date is before start date')
+
+    def add_rule(self, rule: RecurringRule) -> None:
+        self._validate(rule)
+        self.db.execute(
+            f"INSERT INTO recurring_rules({_RULE_COLUMNS}, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {TS_NOW_SQL})",
+            (rule.rule_id, rule.amount, rule.type.value, rule.frequency, rule.interval, rule.start.isoformat(),
+             rule.end.isoformat() if rule.end else None, rule.category_id, rule.account_id, json.dumps(rule.tags),
+             rule.note, rule.materialized_through.isoformat() if rule.materialized_through else None))
+
+    def update_rule(self, rule: RecurringRule) -> bool:
+        """修改规则；已生成的记录不变，materialized_through 保持数据库中的值。"""
+        self._validate(rule)
+        cur = self.db.execute(
+            "UPDATE recurring_rules SET amount=?, type=?, frequency=?, interval=?, start_date=?, end_date=?, category_id=?, "
+            f"account_id=?, tags=?, note=?, updated_at={TS_NOW_SQL} WHERE rule_id=?",
+            (rule.amount, rule.type.value, rule.frequency, rule.interval, rule.start.isoformat(),
+             rule.end.isoformat() if rule.end else None, rule.category_id, rule.account_id, json.dumps(rule.tags),
+             rule.note, rule.rule_id))
+        return cur.rowcount > 0
+
+    def delete_rule(self, rule_id: str) -> bool:
+        """删除规则；已生成的记录保留。"""
+        return self.db.execute("DELETE FROM recurring_rules WHERE rule_id = ?", (rule_id,)).rowcount > 0
+
+    def get_rule(self, rule_id: str) -> Optional[RecurringRule]:
+        rows = self.db.query(f"SELECT {_RULE_COLUMNS} FROM recurring_rules WHERE rule_id = ?", (rule_id,), tuples=True)
+        return _rule_from_row(rows[0]) if rows else None
+
+    def list_rules(self, due_by: Optional[date] = None) -> List[RecurringRule]:
+        """所有规则；给出 due_by 时只返回在 due_by 及以前还有未生成发生的规则（按 start/end/水位线粗筛）。"""
+        if due_by is None:
+            rows = self.db.query(f"SELECT {_RULE_COLUMNS} FROM recurring_rules ORDER BY rule_id", tuples=True)
+        else:
+            day = due_by.isoformat()
+            rows = self.db.query(
+                f"SELECT {_RULE_COLUMNS} FROM recurring_rules WHERE start_date <= ? "
+                "AND (materialized_through IS NULL OR materialized_through < ?) "
+                "AND (end_date IS NULL OR materialized_through IS NULL OR materialized_through < end_date) ORDER BY rule_id",
+                (day, day), tuples=True)
+        return [_rule_from_row(r) for r in rows]
+
+    def materialize(self, through: Optional[date] = None) -> int:
+        """把所有规则截至 through（默认今天，含）尚未生成的发生批量写入 records，返回新写入的记录数。
+
+        整批在一个事务中完成：一次 executemany 写入所有规则的所有发生，再一次推进各规则的 materialized_through。
+        已存在的同 id 记录被跳过，因此可以安全地重复执行。
+        """
+        through = through or date.today()
+        rules = self.list_rules(due_by=through)
+        if not rules:
+            return 0
+
+        def records() -> Iterator[Record]:
+            for rule in rules:
+                for day in occurrences(rule, _pending_from(rule), through):
+                    yield occurrence_record(rule, day)
+
+        with self.db.transaction():
+            added = RecordService(self.db).add_records(records(), ignore_existing=True)
+            self.db.executemany(
+                f"UPDATE recurring_rules SET materialized_through = ?, updated_at = {TS_NOW_SQL} WHERE rule_id = ?",
+                [((min(through, r.end) if r.end else through).isoformat(), r.rule_id) for r in rules])
+        return max(added, 0)
+
+    def upcoming(self, start: date, end: date, account_id: Optional[str] = None) -> List[Record]:
+        """[start, end] 内尚未生成的发生（虚拟记录，不写数据库），按日期升序；id 与将来生成的记录相同。"""
+        out = []
+        for rule in self.list_rules():
+            if account_id and rule.account_id != account_id:
+                continue
+            for day in occurrences(rule, max(start, _pending_from(rule)), end):
+                out.append(occurrence_record(rule, day))
+        out.sort(key=lambda r: (r.date, r.record_id))
+        return out
+
+    def projected_summary(self, start: date, end: date, account_id: Optional[str] = None,
+                          currency: Optional[str] = None) -> Dict[str, Any]:
+        """StatisticsService.summary 加上区间内尚未生成的发生，用于预估月底/年底的收支。
+
+        虚拟记录按账户币种用 RateResolver 换算成报告币种（最新汇率之后的日期用最新汇率）。
+        """
+        stats = StatisticsService(self.db)
+        res = stats.summary(start, end, account_id, currency)
+        target = stats.report_currency(currency)
+        ref = ReferenceCache.for_db(self.db)
+        fx = RateResolver.for_db(self.db)
+        for r in self.upcoming(start, end, account_id):
+            amount = r.amount
+            if target is not None:
+                acc = ref.account(r.account_id)
+                amount = fx.convert(amount, (acc.currency if acc else None) or BASE_CURRENCY, target, r.date)
+            res['income' if r.type == RecordType.INCOME else 'expense'] += amount
+        res['balance'] = res['income'] - res['expense']
+        return res
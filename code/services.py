@@ -7,84 +7,361 @@
 
 try:
     # package-relative import (when used as a package)
-    from .db import Database
-    from .models import Record, RecordType, Category, Budget, Notification
+    from .db import Database, rebuild_search_index, rebuild_daily_rollup, rollup_source_sql, recompute_budget_spend, TS_NOW_SQL
+    from .models import Record, StoredRecord, RecordType, Category, Budget, Notification, Account
+    from .query import RecordQuery
+    from .archival import ArchiveSet, restore_records
+    from .currency import BASE_CURRENCY, currencies_in_use, fx_params, missing_rates, rate_factor_sql
 except Exception:
     # fallback for running module as script from code/ folder
-    from db import Database
-    from models import Record, RecordType, Category, Budget, Notification
+    from db import Database, rebuild_search_index, rebuild_daily_rollup, rollup_source_sql, recompute_budget_spend, TS_NOW_SQL
+    from models import Record, StoredRecord, RecordType, Category, Budget, Notification
+    from query import RecordQuery
+    from archival import ArchiveSet, restore_records
+    from currency import BASE_CURRENCY, currencies_in_use, fx_params, missing_rates, rate_factor_sql
     # Import Account model for AccountService
     try:
         from models import Account
     except Exception:
         pass
-from datetime import date, datetime
-from typing import List, Optional, Dict, Any
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Tuple, Union
+from functools import lru_cache
+import base64
 import json
+import uuid
+import weakref
+
+
+_INSERT_RECORD_SQL = ("INSERT INTO records(record_id, amount, type, date, category_id, account_id, tags, note, attachments, "
+                      f"updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, {TS_NOW_SQL})")
+
+
+def _record_params(record: Record) -> Tuple:
+    # ensure date is stored; if missing use today's date
+    date_str = (record.date or date.today()).isoformat()
+    return (record.record_id, record.amount, record.type.value, date_str, record.category_id, record.account_id,
+            json.dumps(record.tags), record.note, json.dumps(record.attachments))
+
+
+# 读取记录时固定的列顺序，配合 tuple 行（Database.query(..., tuples=True)）按位置取值
+RECORD_COLUMNS = ('record_id', 'amount', 'type', 'date', 'category_id', 'account_id', 'tags', 'note', 'attachments')
+RECORD_SELECT = ", ".join(f"records.{c}" for c in RECORD_COLUMNS)
+
+_RECORD_TYPES = {t.value: t for t in RecordType}
+_new_stored_record = StoredRecord.__new__
+
+
+@lru_cache(maxsize=4096)
+def _parse_day(s: str) -> date:
+    # 同一天的记录很多，缓存解析结果，同时复用同一个 date 对象
+    return date.fromisoformat(s)
+
+
+def record_from_row(row: Tuple) -> Record:
+    """把按 RECORD_COLUMNS 顺序选出的一行转换为 Record（StoredRecord）。
+
+    所有读取记录的地方都用这一个映射函数；tags/attachments 延迟到访问时才解码。
+    """
+    record_id, amount, rtype, dstr, category_id, account_id, tags, note, attachments = row
+    rec = _new_stored_record(StoredRecord)
+    rec.record_id = record_id
+    rec.amount = amount
+    rec.type = _RECORD_TYPES[rtype]
+    # if stored date is empty/NULL, treat it as today
+    rec.date = _parse_day(dstr) if dstr else date.today()
+    rec.category_id = category_id or None
+    rec.account_id = account_id or None
+    rec.note = note
+    rec._tags_json = tags or ''
+    rec._attachments_json = attachments or ''
+    return rec
+
+
+def _schemas(db: Database, query: RecordQuery) -> Iterator[str]:
+    """依次给出要查询的库：主库（''），然后是与 query 日期范围有交集的归档库（逐个按需 ATTACH）。"""
+    yield ""
+    archives = ArchiveSet.for_db(db)
+    for year in archives.years(query.start, query.end):
+        yield archives.attach(year)
+
+
+# 合并主库和归档库的结果时，各排序方式在 RECORD_COLUMNS 行上的排序键；不排序时按库的顺序拼接，rank 见 _find_rows
+_ROW_ORDER = {
+    'date_desc': (lambda r: (r[3], r[0]), True),
+    'date_asc': (lambda r: (r[3], r[0]), False),
+    'amount_desc': (lambda r: (r[1], r[0]), True),
+    'amount_asc': (lambda r: (r[1], r[0]), False),
+}
+
+
+def _find_rows(db: Database, query: RecordQuery, fts: bool) -> List[Tuple]:
+    """在主库和相关归档库中执行 query，按 query 的排序合并后再分页。
+
+    bm25 相关度只在同一个库的全文索引内可比，所以 rank 排序只作用于主库：主库结果按相关度排在前面，
+    归档库的结果随后统一按日期倒序排列。
+    """
+    archives = ArchiveSet.for_db(db)
+    years = archives.years(query.start, query.end)
+    if not years:
+        sql, params = query.select(RECORD_SELECT, fts)
+        return db.query(sql, params, tuples=True)
+    # 每个库各取前 offset + limit 行，合并排序后再统一分页
+    part = query.replace(limit=None if query.limit is None else query.limit + query.offset, offset=0)
+    sql, params = part.select(RECORD_SELECT, fts)
+    main = db.query(sql, params, tuples=True)
+    order = query.effective_order(fts)
+    ranked = order == 'rank'
+    if ranked:
+        order = 'date_desc'
+        part = part.replace(order=order)
+    rows = [] if ranked else main
+    for year in years:
+        sql, params = part.select(RECORD_SELECT, fts, schema=archives.attach(year))
+        rows.extend(db.query(sql, params, tuples=True))
+    if order in _ROW_ORDER:
+        key, reverse = _ROW_ORDER[order]
+        rows.sort(key=key, reverse=reverse)
+    if ranked:
+        rows = main + rows
+    end = None if query.limit is None else query.offset + query.limit
+    return rows[query.offset:end]
+
+
+def _encode_cursor(date_str: str, record_id: str) -> str:
+    raw = json.dumps([date_str, record_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(token: str) -> Tuple[str, str]:
+    try:
+        date_str, record_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except Exception:
+        raise ValueError(f"invalid page cursor: {token!r}")
+    return date_str, record_id
+
+
+def budget_check_key(day: date, category_id: Optional[str]) -> Tuple[date, date, Optional[str]]:
+    """day 当天 category_id 分类的支出需要检查的 (周一, 月初, 分类)；同一周且同一月的同分类支出只需检查一次。"""
+    return (budget_period_start('weekly', day), budget_period_start('monthly', day), category_id)
+
+
+def _budget_key(record: Record):
+    # 只有支出影响预算
+    if record.type != RecordType.EXPENSE:
+        return None
+    return budget_check_key(record.date or date.today(), record.category_id)
+
+
+def check_budgets(db: Database, touched: Iterable) -> None:
+    """对 touched 中的每个 budget_check_key 做一次阈值检查，新越过的阈值发送通知。
+
+    计数器已由触发器（或批量写入后的集合式维护）更新；RecordService 的写入、批量导入和同步应用变更后都调用这里。
+    """
+    touched = set(touched)
+    touched.discard(None)
+    if not touched or not db.query("SELECT 1 FROM budgets LIMIT 1"):
+        return
+    bs = BudgetService(db)
+    for week, month, category_id in touched:
+        # max(周一, 月初) 同时落在这条记录所在的周和月内
+        bs.evaluate(max(week, month), category_id, only_category=True)
 
 
 class RecordService:
     def __init__(self, db: Database):
         self.db = db
+        # 全文条件是否可以走 records_fts（RecordQuery.select 的 fts 参数）
+        self._fts = db.has_table('records_fts')
 
     def add_record(self, record: Record) -> None:
-        # ensure date is stored; if missing use today's date
-        date_str = (record.date or date.today()).isoformat()
-        self.db.execute(
-            "INSERT INTO records(record_id, amount, type, date, category_id, account_id, tags, note, attachments) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (record.record_id, record.amount, record.type.value, date_str, record.category_id, record.account_id,
-             json.dumps(record.tags), record.note, json.dumps(record.attachments)),
-        )
+        with self.db.transaction():
+            self.db.execute(_INSERT_RECORD_SQL, _record_params(record))
+            check_budgets(self.db, {_budget_key(record)})
+            AccountService(self.db).refresh_stale_checkpoints()
+
+    def add_records(self, records: Iterable[Record], ignore_existing: bool = False) -> int:
+        """批量添加记录，整批在一个事务中写入，返回写入条数。
+
+        ignore_existing=True 时跳过 record_id 已存在的记录（不报错、不覆盖），用于可重复执行的写入。
+        """
+        touched = set()
+
+        def params():
+            for r in records:
+                touched.add(_budget_key(r))
+                yield _record_params(r)
+
+        sql = _INSERT_RECORD_SQL.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1) if ignore_existing else _INSERT_RECORD_SQL
+        with self.db.transaction():
+            cur = self.db.executemany(sql, params())
+            check_budgets(self.db, touched)
+            AccountService(self.db).refresh_stale_checkpoints()
+        return cur.rowcount
 
     def update_record(self, record: Record) -> bool:
-        cur = self.db.execute(
-            "UPDATE records SET amount=?, type=?, date=?, category_id=?, tags=?, note=?, attachments=? WHERE record_id=?",
-            (record.amount, record.type.value, (record.date or date.today()).isoformat(), record.category_id, json.dumps(record.tags), record.note,
-             json.dumps(record.attachments), record.record_id),
-        )
+        """修改记录；已归档的记录先移回主库再修改。记录不存在时返回 False。"""
+        sql = ("UPDATE records SET amount=?, type=?, date=?, category_id=?, account_id=?, tags=?, note=?, attachments=?, "
+               f"updated_at={TS_NOW_SQL} WHERE record_id=?")
+        params = (record.amount, record.type.value, (record.date or date.today()).isoformat(), record.category_id,
+                  record.account_id, json.dumps(record.tags), record.note, json.dumps(record.attachments), record.record_id)
+        with self.db.transaction():
+            cur = self.db.execute(sql, params)
+            if not cur.rowcount and restore_records(self.db, [record.record_id]):
+                cur = self.db.execute(sql, params)
+            if cur.rowcount:
+                check_budgets(self.db, {_budget_key(record)})
+                AccountService(self.db).refresh_stale_checkpoints()
         return cur.rowcount > 0
 
     def delete_record(self, record_id: str) -> bool:
-        cur = self.db.execute("DELETE FROM records WHERE record_id=?", (record_id,))
+        """删除记录（包括已归档的记录）。记录不存在时返回 False。"""
+        with self.db.transaction():
+            cur = self.db.execute("DELETE FROM records WHERE record_id=?", (record_id,))
+            if not cur.rowcount and restore_records(self.db, [record_id]):
+                cur = self.db.execute("DELETE FROM records WHERE record_id=?", (record_id,))
+            if cur.rowcount:
+                AccountService(self.db).refresh_stale_checkpoints()
         return cur.rowcount > 0
 
+    def delete_records(self, record_ids: Iterable[str]) -> int:
+        """批量删除记录（包括已归档的记录），返回实际删除的条数。"""
+        ids = list(record_ids)
+        with self.db.transaction():
+            restore_records(self.db, ids)
+            cur = self.db.executemany("DELETE FROM records WHERE record_id=?", ((rid,) for rid in ids))
+            if cur.rowcount:
+                AccountService(self.db).refresh_stale_checkpoints()
+        return cur.rowcount
+
     def get_record(self, record_id: str) -> Optional[Record]:
-        rows = self.db.query("SELECT * FROM records WHERE record_id=?", (record_id,))
+        """按 id 取记录；主库中没有时依次查找各归档库。"""
+        rows = self.db.query(f"SELECT {RECORD_SELECT} FROM records WHERE record_id=?", (record_id,), tuples=True)
         if not rows:
-            return None
-        r = rows[0]
-        # if stored date is empty/NULL, treat it as today
-        dstr = (r["date"] if ("date" in r.keys() and r["date"]) else date.today().isoformat())
-        return Record(
-            record_id=r["record_id"],
-            amount=r["amount"],
-            type=RecordType(r["type"]),
-            date=date.fromisoformat(dstr),
-            category_id=r["category_id"],
-            tags=json.loads(r["tags"] or "[]"),
-            note=r["note"],
-            attachments=json.loads(r["attachments"] or "[]"),
-            account_id=r.get("account_id"),
-        )
+            archives = ArchiveSet.for_db(self.db)
+            for year in archives.years():
+                rows = self.db.query(f"SELECT {RECORD_SELECT} FROM {archives.attach(year)}.records WHERE record_id=?",
+                                     (record_id,), tuples=True)
+                if rows:
+                    break
+        return record_from_row(rows[0]) if rows else None
 
     def list_records(self, limit: int = 100, offset: int = 0) -> List[Record]:
-        rows = self.db.query("SELECT * FROM records ORDER BY date DESC LIMIT ? OFFSET ?", (limit, offset))
-        out: List[Record] = []
-        for r in rows:
-            dstr = (r["date"] if ("date" in r.keys() and r["date"]) else date.today().isoformat())
-            account_id = (r["account_id"] if ("account_id" in r.keys() and r["account_id"]) else None)
-            out.append(Record(
-                record_id=r["record_id"],
-                amount=r["amount"],
-                type=RecordType(r["type"]),
-                date=date.fromisoformat(dstr),
-                category_id=(r["category_id"] if ("category_id" in r.keys() and r["category_id"]) else None),
-                tags=json.loads(r["tags"] or "[]"),
-                note=r["note"],
-                attachments=json.loads(r["attachments"] or "[]"),
-                account_id=account_id,
-            ))
-        return out
+        return self.find(RecordQuery(limit=limit, offset=offset))
+
+    def find(self, query: RecordQuery) -> List[Record]:
+        """返回符合 query（筛选、排序、分页）的全部记录。"""
+        sql, params = query.select(RECORD_SELECT, self._fts)
+        return [record_from_row(r) for r in self.db.query(sql, params, tuples=True)]
+
+    def list_records_page(self, limit: int = 100, cursor: Optional[str] = None,
+                          filters: Optional[Union[RecordQuery, Dict[str, Any]]] = None) -> Tuple[List[Record], Optional[str]]:
+        """按 (date, record_id) 倒序的游标分页。filters 可以是 RecordQuery 或 filters 字典。
+
+        返回 (records, next_cursor)；把 next_cursor 传回即可继续翻页，为 None 表示没有更多数据。
+        与 OFFSET 不同，翻到多深的页都只需一次索引定位。
+        """
+        # 多取一行用来判断是否还有下一页
+        query = RecordQuery.from_filters(filters, order='date_desc', limit=limit + 1, offset=0,
+                                         after=_decode_cursor(cursor) if cursor else None)
+        sql, params = query.select(RECORD_SELECT, self._fts)
+        rows = self.db.query(sql, params, tuples=True)
+        out = [record_from_row(r) for r in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = _encode_cursor(last[3], last[0])
+        return out, next_cursor
+
+    def iter_records(self, filters: Optional[Union[RecordQuery, Dict[str, Any]]] = None,
+                     batch_size: int = 500) -> Iterator[Record]:
+        """以生成器方式流式返回符合 filters 的记录（默认按日期倒序），内存占用与总行数无关。"""
+        sql, params = RecordQuery.from_filters(filters).select(RECORD_SELECT, self._fts)
+        for r in self.db.iter_query(sql, params, batch_size, tuples=True):
+            yield record_from_row(r)
+
+
+class ReferenceCache:
+    """分类和账户的进程内缓存（按 id 和按名称）。
+
+    本连接通过 CategoryService/AccountService 写入时递增 db.generation 使缓存失效；
+    其他连接或进程的修改通过 PRAGMA data_version 发现。每次访问只需读一次 data_version。
+    缓存的 Account.balance 是加载时的值，需要实时余额请用 AccountService.list_accounts。
+    """
+    _instances: 'weakref.WeakKeyDictionary[Database, ReferenceCache]' = weakref.WeakKeyDictionary()
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._key = None
+        self._categories: List[Category] = []
+        self._accounts: List['Account'] = []
+        self._cat_by_id: Dict[str, Category] = {}
+        self._cat_by_name: Dict[str, Category] = {}
+        self._acc_by_id: Dict[str, 'Account'] = {}
+        self._acc_by_name: Dict[str, 'Account'] = {}
+
+    @classmethod
+    def for_db(cls, db: Database) -> 'ReferenceCache':
+        """同一个 Database 共享同一个缓存实例。"""
+        cache = cls._instances.get(db)
+        if cache is None:
+            cache = cls._instances[db] = cls(db)
+        return cache
+
+    def invalidate(self) -> None:
+        self._key = None
+
+    def _ensure(self) -> None:
+        key = (self.db.generation, self.db.data_version())
+        if key == self._key:
+            return
+        rows = self.db.query("SELECT * FROM categories ORDER BY name")
+        self._categories = [Category(category_id=r["category_id"], name=r["name"], icon=r["icon"], color=r["color"]) for r in rows]
+        rows = self.db.query("SELECT * FROM accounts ORDER BY name")
+        self._accounts = [Account(account_id=r['account_id'], name=r['name'], type=r['type'], balance=r['balance'], currency=r['currency'])
+                          for r in rows]
+        self._cat_by_id = {c.category_id: c for c in self._categories}
+        self._acc_by_id = {a.account_id: a for a in self._accounts}
+        # 重名时保留排序靠前的一个
+        self._cat_by_name = {}
+        for c in self._categories:
+            self._cat_by_name.setdefault(c.name, c)
+        self._acc_by_name = {}
+        for a in self._accounts:
+            self._acc_by_name.setdefault(a.name, a)
+        self._key = key
+
+    def categories(self) -> List[Category]:
+        self._ensure()
+        return list(self._categories)
+
+    def accounts(self) -> List['Account']:
+        self._ensure()
+        return list(self._accounts)
+
+    def category(self, category_id: Optional[str]) -> Optional[Category]:
+        self._ensure()
+        return self._cat_by_id.get(category_id)
+
+    def account(self, account_id: Optional[str]) -> Optional['Account']:
+        self._ensure()
+        return self._acc_by_id.get(account_id)
+
+    def category_by_name(self, name: str) -> Optional[Category]:
+        self._ensure()
+        return self._cat_by_name.get(name)
+
+    def account_by_name(self, name: str) -> Optional['Account']:
+        self._ensure()
+        return self._acc_by_name.get(name)
+
+    def category_names(self) -> Dict[str, str]:
+        self._ensure()
+        return {cid: c.name for cid, c in self._cat_by_id.items()}
+
+    def account_names(self) -> Dict[str, str]:
+        self._ensure()
+        return {aid: a.name for aid, a in self._acc_by_id.items()}
 
 
 class CategoryService:
@@ -92,12 +369,12 @@ class CategoryService:
         self.db = db
 
     def add_category(self, c: Category) -> None:
-        self.db.execute("INSERT INTO categories(category_id, name, icon, color) VALUES (?, ?, ?, ?)",
+        self.db.execute(f"INSERT INTO categories(category_id, name, icon, color, updated_at) VALUES (?, ?, ?, ?, {TS_NOW_SQL})",
                         (c.category_id, c.name, c.icon, c.color))
+        self.db.bump_generation()
 
     def list_categories(self) -> List[Category]:
-        rows = self.db.query("SELECT * FROM categories ORDER BY name")
-        return [Category(category_id=r["category_id"], name=r["name"], icon=r["icon"], color=r["color"]) for r in rows]
+        return ReferenceCache.for_db(self.db).categories()
 
     def delete_category(self, category_id: str, force: bool = False) -> bool:
         """Delete a category. If there are records referencing it and force=False, refuse and return False.
@@ -109,16 +386,28 @@ class CategoryService:
         if force:
             self.db.execute("UPDATE records SET category_id = NULL WHERE category_id = ?", (category_id,))
         cur = self.db.execute("DELETE FROM categories WHERE category_id=?", (category_id,))
+        self.db.bump_generation()
         return cur.rowcount > 0
 
 
+# 检查点落后本月初超过这么多天时，写入记录后自动刷新（见 AccountService.refresh_stale_checkpoints）
+CHECKPOINT_STALE_DAYS = 31
+
+
 class AccountService:
+    """账户管理。accounts.balance 是由 records 触发器实时维护的当前余额，
+    opening_balance 是开户余额；历史余额通过 balance_checkpoints 检查点加日汇总计算。"""
     def __init__(self, db: Database):
         self.db = db
 
     def add_account(self, account: 'Account') -> None:
-        self.db.execute("INSERT INTO accounts(account_id, name, type, balance, currency) VALUES (?, ?, ?, ?, ?)",
-                        (account.account_id, account.name, account.type, account.balance, account.currency))
+        # account.balance 作为开户余额；如果已有记录引用该账户（例如先导入了记录），一并计入当前余额
+        self.db.execute(
+            "INSERT INTO accounts(account_id, name, type, balance, opening_balance, currency, updated_at) VALUES (?, ?, ?, ? + COALESCE(("
+            "SELECT SUM(CASE type WHEN 'income' THEN total ELSE -total END) FROM daily_rollup WHERE account_id = ?), 0.0), ?, ?, "
+            f"{TS_NOW_SQL})",
+            (account.account_id, account.name, account.type, account.balance, account.account_id, account.balance, account.currency))
+        self.db.bump_generation()
 
     def list_accounts(self) -> List['Account']:
         rows = self.db.query("SELECT * FROM accounts ORDER BY name")
@@ -127,6 +416,68 @@ class AccountService:
             out.append(Account(account_id=r['account_id'], name=r['name'], type=r['type'], balance=r['balance'], currency=r['currency']))
         return out
 
+    def get_balance(self, account_id: str) -> Optional[float]:
+        rows = self.db.query("SELECT balance FROM accounts WHERE account_id = ?", (account_id,))
+        return rows[0][0] if rows else None
+
+    def balance_as_of(self, account_id: str, as_of: date) -> Optional[float]:
+        """账户在 as_of 当天结束时的余额。
+
+        从不晚于 as_of 的最近检查点出发，只累加检查点之后的日汇总；没有检查点时从开户余额开始。
+        """
+        acc = self.db.query("SELECT opening_balance FROM accounts WHERE account_id = ?", (account_id,))
+        if not acc:
+            return None
+        day = as_of.isoformat()
+        cp = self.db.query("SELECT day, balance FROM balance_checkpoints WHERE account_id = ? AND day <= ? "
+                           "ORDER BY day DESC LIMIT 1", (account_id, day))
+        if cp:
+            base, since = cp[0]["balance"], cp[0]["day"]
+        else:
+            base, since = acc[0]["opening_balance"] or 0.0, ""
+        rows = self.db.query("SELECT SUM(CASE type WHEN 'income' THEN total ELSE -total END) FROM daily_rollup "
+                             "WHERE account_id = ? AND day > ? AND day <= ?", (account_id, since, day))
+        return base + (rows[0][0] or 0.0)
+
+    def refresh_checkpoints(self, account_id: Optional[str] = None) -> int:
+        """为每个账户在每个已结束且有记录的月份末尾写入余额检查点，返回写入的检查点数。
+
+        记录写入后由 refresh_stale_checkpoints 按需调用；写入更早日期的记录会自动删除受影响的检查点。
+        """
+        month_start = date.today().replace(day=1).isoformat()
+        sql = """
+            INSERT OR REPLACE INTO balance_checkpoints(account_id, day, balance)
+            SELECT m.account_id, date(m.month || '-01', '+1 month', '-1 day'),
+                   a.opening_balance + SUM(m.net) OVER (PARTITION BY m.account_id ORDER BY m.month)
+            FROM (
+                SELECT account_id, substr(day, 1, 7) AS month,
+                       SUM(CASE type WHEN 'income' THEN total ELSE -total END) AS net
+                FROM daily_rollup WHERE day < ? {account_filter}
+                GROUP BY account_id, month
+            ) m JOIN accounts a ON a.account_id = m.account_id
+        """
+        params: List[Any] = [month_start]
+        account_filter = ""
+        if account_id:
+            account_filter = "AND account_id = ?"
+            params.append(account_id)
+        with self.db.transaction():
+            cur = self.db.execute(sql.format(account_filter=account_filter), tuple(params))
+        return cur.rowcount
+
+    def refresh_stale_checkpoints(self) -> int:
+        """只刷新检查点落后的账户：在本月初往前 CHECKPOINT_STALE_DAYS 天之前还有未被检查点覆盖的记录。
+
+        记录写入后自动调用；检查只是每个账户一次索引查找，检查点新鲜时不做任何写入。返回写入的检查点数。
+        """
+        horizon = (date.today().replace(day=1) - timedelta(days=CHECKPOINT_STALE_DAYS)).isoformat()
+        stale = self.db.query("""
+            SELECT a.account_id FROM accounts a WHERE EXISTS (
+                SELECT 1 FROM daily_rollup r WHERE r.account_id = a.account_id AND r.day < ?
+                AND r.day > COALESCE((SELECT MAX(day) FROM balance_checkpoints c WHERE c.account_id = a.account_id), ''))""",
+                              (horizon,), tuples=True)
+        return sum(self.refresh_checkpoints(account_id) for (account_id,) in stale)
+
     def delete_account(self, account_id: str, force: bool = False) -> bool:
         """Delete an account. If records reference it and force=False, refuse and return False.
         If force=True, delete related records then delete the account.
@@ -134,25 +485,99 @@ class AccountService:
         rows = self.db.query("SELECT 1 FROM records WHERE account_id=? LIMIT 1", (account_id,))
         if rows and not force:
             return False
-        if force:
-            self.db.execute("DELETE FROM records WHERE account_id=?", (account_id,))
-        cur = self.db.execute("DELETE FROM accounts WHERE account_id=?", (account_id,))
+        with self.db.transaction():
+            if force:
+                self.db.execute("DELETE FROM records WHERE account_id=?", (account_id,))
+            self.db.execute("DELETE FROM balance_checkpoints WHERE account_id=?", (account_id,))
+            cur = self.db.execute("DELETE FROM accounts WHERE account_id=?", (account_id,))
+        self.db.bump_generation()
         return cur.rowcount > 0
 
 
+# 预算使用比例达到这些阈值时各提醒一次（每个周期）
+BUDGET_THRESHOLDS = (0.8, 1.0)
+
+# 支持的预算周期，与 budget_period_start / db.budget_period_start_sql 一致
+BUDGET_PERIODS = ('weekly', 'monthly')
+
+
+def budget_period_start(period: str, day: date) -> date:
+    """与 db.budget_period_start_sql 一致：周预算从周一开始，其余按自然月。"""
+    if period == 'weekly':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
 
 class BudgetService:
+    """预算管理与评估。
+
+    每个预算每个周期的支出由 budget_spend 计数器随记录写入增量累加，评估时只读计数器，
+    代价与预算数量成正比，与记录数无关。
+    """
     def __init__(self, db: Database):
         self.db = db
 
     def set_budget(self, b: Budget) -> None:
-        self.db.execute("INSERT OR REPLACE INTO budgets(budget_id, category_id, limit_value, period) VALUES (?, ?, ?, ?)",
-                        (b.budget_id, b.category_id, b.limit, b.period))
+        if b.period not in BUDGET_PERIODS:
+            raise ValueError(f'unknown budget period {b.period!r}; expected one of {", ".join(BUDGET_PERIODS)}')
+        with self.db.transaction():
+            self.db.execute("INSERT OR REPLACE INTO budgets(budget_id, category_id, limit_value, period, updated_at) "
+                            f"VALUES (?, ?, ?, ?, {TS_NOW_SQL})",
+                            (b.budget_id, b.category_id, b.limit, b.period))
+            # 新建或修改预算时一次性从日汇总回填计数器
+            recompute_budget_spend(self.db.conn, b.budget_id)
 
     def list_budgets(self) -> List[Budget]:
         rows = self.db.query("SELECT * FROM budgets")
         return [Budget(budget_id=r["budget_id"], category_id=r["category_id"], limit=r["limit_value"], period=r["period"]) for r in rows]
 
+    def spent(self, budget_id: str, as_of: Optional[date] = None) -> float:
+        """预算在 as_of 所在周期内已经发生的支出。"""
+        rows = self.db.query("SELECT period FROM budgets WHERE budget_id = ?", (budget_id,))
+        if not rows:
+            return 0.0
+        start = budget_period_start(rows[0]["period"], as_of or date.today())
+        rows = self.db.query("SELECT spent FROM budget_spend WHERE budget_id = ? AND period_start = ?",
+                             (budget_id, start.isoformat()))
+        return rows[0]["spent"] if rows else 0.0
+
+    def evaluate(self, as_of: Optional[date] = None, category_id: Optional[str] = None,
+                 only_category: bool = False) -> List[Notification]:
+        """评估 as_of 所在周期的预算，对新越过的阈值发送通知并返回这些通知。
+
+        每个预算每个周期每个阈值最多提醒一次。only_category=True 时只评估 category_id
+        对应的预算以及不限分类的总预算（记录写入后的增量检查使用）。
+        """
+        d = as_of or date.today()
+        sql = ("SELECT b.budget_id, b.category_id, b.limit_value, b.period, s.period_start, s.spent, s.notified_level "
+               "FROM budgets b JOIN budget_spend s ON s.budget_id = b.budget_id "
+               "AND s.period_start = (CASE b.period WHEN 'weekly' THEN ? ELSE ? END)")
+        params: List[Any] = [budget_period_start('weekly', d).isoformat(), budget_period_start('monthly', d).isoformat()]
+        if only_category:
+            sql += " WHERE b.category_id IS NULL OR b.category_id = ?"
+            params.append(category_id)
+        out: List[Notification] = []
+        with self.db.transaction():
+            for r in self.db.query(sql, tuple(params)):
+                limit = r["limit_value"]
+                if not limit or limit <= 0:
+                    continue
+                ratio = (r["spent"] or 0.0) / limit
+                crossed = [t for t in BUDGET_THRESHOLDS if ratio >= t and t > r["notified_level"]]
+                if not crossed:
+                    continue
+                level = max(crossed)
+                notif = Notification(
+                    notif_id=str(uuid.uuid4()), type='budget',
+                    message=(f"预算提醒：{r['category_id'] or '全部分类'} 本{'周' if r['period'] == 'weekly' else '月'}"
+                             f"已使用 {ratio:.0%}（{r['spent']:.2f}/{limit:.2f}）"),
+                )
+                NotificationService(self.db).send_notification(notif)
+                self.db.execute("UPDATE budget_spend SET notified_level = ? WHERE budget_id = ? AND period_start = ?",
+                                (level, r["budget_id"], r["period_start"]))
+                out.append(notif)
+        return out
+
 
 class NotificationService:
     def __init__(self, db: Database):
@@ -171,100 +596,192 @@ class NotificationService:
 
 
 class StatisticsService:
+    """收支统计。summary/account_summary/by_category 直接读取增量维护的 daily_rollup 日汇总表，
+    查询代价与天数成正比而不是与记录数成正比。
+
+    金额按账户币种记账。currency 参数指定报告币种（默认 BASE_CURRENCY）：所有账户都是该币种时照常求和，
+    否则按 exchange_rates 的当日汇率换算其他币种账户的金额（见 _sum 和 currency 模块）。
+    account_summary 总是使用账户自己的币种。
+    """
     def __init__(self, db: Database):
         self.db = db
+        self._fts = db.has_table('records_fts')
 
-    def summary(self, start: date, end: date) -> Dict[str, Any]:
-        rows = self.db.query("SELECT type, SUM(amount) as total FROM records WHERE date BETWEEN ? AND ? GROUP BY type", (start.isoformat(), end.isoformat()))
-        res = {"income": 0.0, "expense": 0.0}
-        for r in rows:
-            t = r["type"]
-            res[t] = r["total"] or 0.0
-        res["balance"] = res.get("income", 0.0) - res.get("expense", 0.0)
-        return res
+    def report_currency(self, currency: Optional[str] = None) -> Optional[str]:
+        """需要换算时返回报告币种（大写）；所有账户（以及没有账户的记录）都已是该币种时返回 None。
 
-    def summary(self, start: date, end: date, account_id: Optional[str] = None) -> Dict[str, Any]:
-        """Summary of income/expense between start and end. Optionally filter by account_id."""
-        if account_id:
-            rows = self.db.query("SELECT type, SUM(amount) as total FROM records WHERE date BETWEEN ? AND ? AND account_id = ? GROUP BY type", (start.isoformat(), end.isoformat(), account_id))
+        报告币种或某个账户币种在 exchange_rates 中没有任何汇率时抛出 ValueError。
+        """
+        target = (currency or BASE_CURRENCY).upper()
+        in_use = currencies_in_use(ReferenceCache.for_db(self.db).accounts())
+        if in_use == {target}:
+            return None
+        missing = missing_rates(self.db, in_use | {target})
+        if missing:
+            raise ValueError(f"no exchange rates for {', '.join(missing)}; load them with currency.load_rates()")
+        return target
+
+    def _aggregate(self, query: RecordQuery, key: str, total: str = "SUM({amount})", params: Tuple = (),
+                   join: str = "", rollup: bool = True) -> Dict[Optional[str], float]:
+        """按 key 汇总 total；params 为 total 中占位符的参数。
+
+        key/total/join 中的 {t} 替换为表名，{amount}/{day} 替换为金额列和日期列，{s} 替换为库名前缀。
+        rollup 为真且 query 只含日期/账户/分类/类型条件时读 daily_rollup（其中已包含归档的记录），
+        否则（金额区间、全文、标签）在 records 和日期范围内的归档库上分别聚合后相加。
+        """
+        if rollup and query.rollup_compatible:
+            names = dict(t='daily_rollup', amount='daily_rollup.total', day='daily_rollup.day', s='')
+            k = key.format(**names)
+            parts = [query.rollup(f"{k}, {total.format(**names)}", k, join=join.format(**names))]
         else:
-            rows = self.db.query("SELECT type, SUM(amount) as total FROM records WHERE date BETWEEN ? AND ? GROUP BY type", (start.isoformat(), end.isoformat()))
-        res = {"income": 0.0, "expense": 0.0}
-        for r in rows:
-            t = r["type"]
-            res[t] = r["total"] or 0.0
-        res["balance"] = res.get("income", 0.0) - res.get("expense", 0.0)
+            parts = []
+            for schema in _schemas(self.db, query):
+                names = dict(t='records', amount='records.amount', day='records.date', s=schema + "." if schema else "")
+                k = key.format(**names)
+                parts.append(query.select(f"{k}, {total.format(**names)}", self._fts, join=join.format(**names),
+                                          group_by=k, ordered=False, schema=schema))
+        out: Dict[Optional[str], float] = {}
+        for sql, p in parts:
+            for k, value in self.db.query(sql, params + p, tuples=True):
+                out[k] = out.get(k, 0.0) + (value or 0.0)
+        return out
+
+    def _sum(self, query: RecordQuery, key: str, currency: Optional[str] = None, join: str = "",
+             rollup: bool = True) -> Dict[Optional[str], float]:
+        """按 key 汇总金额并换算成报告币种 currency。
+
+        先不分币种直接相加（与单币种时完全相同的查询），再为币种不同的每个账户补上差额
+        SUM(金额 × (当日汇率 - 1))：差额查询按 (account_id, 日期) 索引只扫描这些账户的行，
+        报告币种账户的行不做任何额外工作。报告币种不是 BASE_CURRENCY 时，没有账户的记录另算一次差额。
+        """
+        target = self.report_currency(currency)
+        out = self._aggregate(query, key, join=join, rollup=rollup)
+        if target is None:
+            return out
+        ref = ReferenceCache.for_db(self.db)
+        adjust = "SUM({amount} * (%s - 1))" % rate_factor_sql('{day}')
+        deltas = []
+        for account in ref.accounts():
+            cur = (account.currency or BASE_CURRENCY).upper()
+            if cur != target and query.account_id in (None, account.account_id):
+                deltas.append(self._aggregate(query.replace(account_id=account.account_id), key, adjust,
+                                              fx_params(cur, target), join, rollup))
+        if target != BASE_CURRENCY and (query.account_id is None or ref.account(query.account_id) is None):
+            orphan = "SUM(CASE WHEN accounts.account_id IS NULL THEN {amount} * (%s - 1) END)" % rate_factor_sql('{day}')
+            deltas.append(self._aggregate(query, key, orphan, fx_params(BASE_CURRENCY, target),
+                                          (join + " LEFT JOIN main.accounts ON accounts.account_id = {t}.account_id").strip(),
+                                          rollup))
+        for delta in deltas:
+            for k, value in delta.items():
+                out[k] = out.get(k, 0.0) + value
+        return out
+
+    def totals(self, query: RecordQuery, group_by: str = 'type',
+               currency: Optional[str] = None) -> Dict[Optional[str], float]:
+        """按 group_by（type/category_id/account_id 之一）汇总金额，以 currency 为报告币种。"""
+        if group_by not in ('type', 'category_id', 'account_id'):
+            raise ValueError(f'cannot group by {group_by!r}')
+        return self._sum(query, f"{{t}}.{group_by}", currency)
+
+    @staticmethod
+    def _balance(by_type: Dict[Optional[str], float]) -> Dict[str, float]:
+        res = {"income": by_type.get("income", 0.0), "expense": by_type.get("expense", 0.0)}
+        res["balance"] = res["income"] - res["expense"]
         return res
 
+    def summary(self, start: date, end: date, account_id: Optional[str] = None,
+                currency: Optional[str] = None) -> Dict[str, Any]:
+        """Summary of income/expense between start and end. Optionally filter by account_id.
+
+        Amounts are reported in currency (default BASE_CURRENCY), converted at each day's rate.
+        """
+        return self._balance(self.totals(RecordQuery(start=start, end=end, account_id=account_id), currency=currency))
+
     def account_summary(self, account_id: str) -> Dict[str, float]:
-        """Return total income, expense and balance for the given account across all time."""
-        rows = self.db.query("SELECT type, SUM(amount) as total FROM records WHERE account_id = ? GROUP BY type", (account_id,))
-        res = {"income": 0.0, "expense": 0.0}
-        for r in rows:
-            t = r["type"]
-            res[t] = r["total"] or 0.0
-        res["balance"] = res.get("income", 0.0) - res.get("expense", 0.0)
-        return res
+        """Return total income, expense and balance for the given account across all time, in its own currency."""
+        return self._balance(self._aggregate(RecordQuery(account_id=account_id), '{t}.type'))
 
-    def by_category(self, start: date, end: date, account_id: Optional[str] = None) -> Dict[str, float]:
-        """Totals by category; optionally filter by account."""
-        if account_id:
-            rows = self.db.query("SELECT category_id, SUM(amount) as total FROM records WHERE date BETWEEN ? AND ? AND account_id = ? GROUP BY category_id", (start.isoformat(), end.isoformat(), account_id))
-        else:
-            rows = self.db.query("SELECT category_id, SUM(amount) as total FROM records WHERE date BETWEEN ? AND ? GROUP BY category_id", (start.isoformat(), end.isoformat()))
-        out: Dict[str, float] = {}
-        for r in rows:
-            out[r["category_id"] or "uncategorized"] = r["total"] or 0.0
-        return out
+    def by_category(self, start: date, end: date, account_id: Optional[str] = None,
+                    currency: Optional[str] = None) -> Dict[str, float]:
+        """Totals by category in currency (default BASE_CURRENCY); optionally filter by account."""
+        totals = self.totals(RecordQuery(start=start, end=end, account_id=account_id), 'category_id', currency)
+        return {cid or "uncategorized": total for cid, total in totals.items()}
+
+    def verify_rollup(self, repair: bool = False) -> List[Dict[str, Any]]:
+        """比对 daily_rollup 与 records 的实时聚合（加上已归档记录的汇总），返回不一致的汇总行。
+
+        repair=True 时若发现偏差则整表重建。金额按 6 位小数比较，忽略浮点累加误差。
+        """
+        rows = self.db.query(f"""
+            SELECT day, account_id, category_id, type, SUM(expected) AS expected, SUM(actual) AS actual,
+                   SUM(expected_cnt) AS expected_cnt, SUM(actual_cnt) AS actual_cnt
+            FROM (
+                SELECT day, account_id, category_id, type, total AS expected, 0 AS actual, cnt AS expected_cnt, 0 AS actual_cnt
+                FROM ({rollup_source_sql(self.db.conn)})
+                UNION ALL
+                SELECT day, account_id, category_id, type, 0, total, 0, cnt FROM daily_rollup
+            )
+            GROUP BY day, account_id, category_id, type
+            HAVING ROUND(SUM(expected) - SUM(actual), 6) != 0 OR SUM(expected_cnt) != SUM(actual_cnt)
+        """)
+        drift = [dict(r) for r in rows]
+        if drift and repair:
+            self.rebuild_rollup()
+        return drift
+
+    def rebuild_rollup(self) -> int:
+        """按 records 完整重建 daily_rollup，返回汇总行数。"""
+        with self.db.transaction():
+            return rebuild_daily_rollup(self.db.conn)
+
+    def by_tag(self, start: date, end: date, account_id: Optional[str] = None,
+               rtype: Optional[RecordType] = None, currency: Optional[str] = None) -> Dict[str, float]:
+        """按标签汇总金额（一条记录有多个标签时分别计入）；可按账户和收支类型过滤，currency 为报告币种。"""
+        query = RecordQuery(start=start, end=end, account_id=account_id, type=rtype)
+        return self._sum(query, "t.tag", currency, join="JOIN {s}record_tags t ON t.record_id = records.record_id",
+                         rollup=False)
 
 
 class SearchService:
-    """提供基本的搜索和筛选功能。"""
+    """提供基本的搜索和筛选功能。
+
+    文本搜索使用 records_fts（FTS5 trigram）全文索引；sqlite 不支持 FTS5 时退回 LIKE 扫描。
+    """
     def __init__(self, db: Database):
         self.db = db
+        self._fts = db.has_table('records_fts')
 
     def search(self, query: str = "", start: Optional[date] = None, end: Optional[date] = None,
-               category: Optional[str] = None) -> List[Record]:
-        sql = "SELECT * FROM records WHERE 1=1"
-        params: List[Any] = []
-        if start and end:
-            sql += " AND date BETWEEN ? AND ?"
-            params.extend([start.isoformat(), end.isoformat()])
-        if category:
-            sql += " AND category_id = ?"
-            params.append(category)
-        if query:
-            sql += " AND (note LIKE ? OR tags LIKE ? )"
-            like = f"%{query}%"
-            params.extend([like, like])
-        sql += " ORDER BY date DESC"
-        rows = self.db.query(sql, tuple(params))
-        out: List[Record] = []
-        for r in rows:
-            out.append(Record(
-                record_id=r["record_id"],
-                amount=r["amount"],
-                type=RecordType(r["type"]),
-                date=date.fromisoformat(r["date"]),
-                category_id=r["category_id"],
-                tags=json.loads(r["tags"] or "[]"),
-                note=r["note"],
-                attachments=json.loads(r["attachments"] or "[]"),
-            ))
-        return out
+               category: Optional[str] = None, ranked: bool = False,
+               tags_any: Optional[List[str]] = None, tags_all: Optional[List[str]] = None,
+               account_id: Optional[str] = None, rtype: Optional[Union[RecordType, str]] = None,
+               min_amount: Optional[float] = None, max_amount: Optional[float] = None,
+               limit: Optional[int] = None) -> List[Record]:
+        """按文本/日期/分类/账户/类型/金额/标签搜索记录。ranked=True 时按相关度（bm25）排序，否则按日期倒序。
+        相关度只在主库内排序，已归档的匹配记录排在主库结果之后、按日期倒序。
+
+        start/end 可以只给一端。tags_any: 至少带有其中一个标签；tags_all: 必须同时带有全部标签，两者都走 record_tags 索引。
+        """
+        return self.find(RecordQuery(start=start, end=end, account_id=account_id, category_id=category, type=rtype,
+                                     min_amount=min_amount, max_amount=max_amount, text=query,
+                                     tags_any=tuple(tags_any or ()), tags_all=tuple(tags_all or ()),
+                                     order='rank' if ranked else 'date_desc', limit=limit))
 
+    def find(self, query: RecordQuery) -> List[Record]:
+        """执行任意 RecordQuery，包括日期范围内已归档的记录（见 archival）。"""
+        return [record_from_row(r) for r in _find_rows(self.db, query, self._fts)]
+
+    def rebuild_index(self) -> int:
+        """一次性回填/重建全文索引（旧数据库升级或外部 VACUUM 之后使用），返回索引条数。"""
+        if not self._fts:
+            return 0
+        with self.db.transaction():
+            return rebuild_search_index(self.db.conn)
 
-def export_records_to_csv(db: Database, path: str, start: Optional[date] = None, end: Optional[date] = None) -> None:
-    import csv
-    sql = "SELECT * FROM records"
-    params: List[Any] = []
-    if start and end:
-        sql += " WHERE date BETWEEN ? AND ?"
-        params.extend([start.isoformat(), end.isoformat()])
-    rows = db.query(sql, tuple(params))
-    with open(path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['record_id', 'amount', 'type', 'date', 'category_id', 'tags', 'note', 'attachments'])
-        for r in rows:
-            writer.writerow([r['record_id'], r['amount'], r['type'], r['date'], r['category_id'], r['tags'], r['note'], r['attachments']])
 
+def export_records_to_csv(db: Database, path: str, start: Optional[date] = None, end: Optional[date] = None) -> None:
+    try:
+        from .export_import import export_records
+    except Exception:
+        from export_import import export_records
+    export_records(db, path, start, end)
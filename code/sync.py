@@ -0,0 +1,149 @@
+"""基于变更日志的增量同步。
+
+每个库的 records/categories/accounts/budgets 写入都由触发器记入 change_log：
+seq 单调递增，同一主键只保留最新一条（含整行 JSON、updated_at 和写入方的 site_id）。
+export_changes(since_seq) 导出某个 seq 之后的变更，apply_changes(stream) 在另一个库上应用，
+两边只需交换增量。冲突按“最后写入者胜出”确定性地解决：版本为 (updated_at, site_id)，
+较大者胜出，删除与修改同样比较，所以无论以什么顺序、重复多少次同步，各库最终一致。
+"""
+import json
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+try:
+    from .db import Database, SYNC_TABLES, recompute_budget_spend
+    from .archival import restore_records
+    from .services import budget_check_key, check_budgets
+except Exception:
+    from db import Database, SYNC_TABLES, recompute_budget_spend
+    from archival import restore_records
+    from services import budget_check_key, check_budgets
+
+
+@dataclass
+class ApplyResult:
+    applied: int = 0
+    skipped: int = 0
+    last_seq: int = 0  # 输入中最大的 seq，下次从这里继续导出
+
+
+def site_id(db: Database) -> str:
+    return db.query("SELECT value FROM meta WHERE key = 'site_id'", tuples=True)[0][0]
+
+
+def current_seq(db: Database) -> int:
+    """当前最大的变更序号；没有任何变更时为 0。"""
+    rows = db.query("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'", tuples=True)
+    return rows[0][0] if rows else 0
+
+
+def export_changes(db: Database, since_seq: int = 0, exclude_site: Optional[str] = None,
+                   batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """按 seq 顺序流式导出 since_seq 之后的变更。exclude_site 用于跳过来自对方自己的变更。"""
+    sql = "SELECT seq, tbl, pk, op, row, updated_at, site_id FROM change_log WHERE seq > ?"
+    params: Tuple = (since_seq,)
+    if exclude_site:
+        sql += " AND site_id != ?"
+        params += (exclude_site,)
+    sql += " ORDER BY seq"
+    for seq, tbl, pk, op, row, updated_at, site in db.iter_query(sql, params, batch_size, tuples=True):
+        yield {'seq': seq, 'tbl': tbl, 'pk': pk, 'op': op, 'row': json.loads(row) if row else None,
+               'updated_at': updated_at, 'site_id': site}
+
+
+def _upsert_sql(table: str) -> str:
+    pk, cols = SYNC_TABLES[table]
+    cols = cols + ('updated_at',)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c != pk)
+    return (f"INSERT INTO {table}({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT({pk}) DO UPDATE SET {updates}")
+
+
+def apply_changes(db: Database, changes: Iterable[Dict[str, Any]]) -> ApplyResult:
+    """在一个事务中应用变更流，返回应用/跳过的条数。
+
+    本地已有同一主键的更新版本（(updated_at, site_id) 更大或相等）时跳过；
+    应用后 change_log 中记录的是来源的版本，继续转发给其他库时不会被当作新的修改。
+    写入的支出越过预算阈值时，和本地写入一样发送通知（预算通知本身不同步）。
+    """
+    result = ApplyResult()
+    upserts = {t: _upsert_sql(t) for t in SYNC_TABLES}
+    touched_reference = False
+    touched_budgets = set()
+    with db.transaction():
+        for ch in changes:
+            result.last_seq = max(result.last_seq, ch['seq'])
+            table, key, version = ch['tbl'], ch['pk'], (ch['updated_at'], ch['site_id'])
+            if table not in SYNC_TABLES:
+                raise ValueError(f"unknown table in change stream: {table!r}")
+            local = db.query("SELECT updated_at, site_id FROM change_log WHERE tbl = ? AND pk = ?", (table, key),
+                             tuples=True)
+            if local and tuple(local[0]) >= version:
+                result.skipped += 1
+                continue
+            pk, cols = SYNC_TABLES[table]
+            if table == 'records' and not db.query("SELECT 1 FROM records WHERE record_id = ?", (key,)):
+                # 已归档的记录先移回主库，否则更新会在主库插入第二份、删除会漏掉归档库中的那份
+                restore_records(db, [key])
+            if ch['op'] == 'delete':
+                db.execute(f"DELETE FROM {table} WHERE {pk} = ?", (key,))
+                row_json = None
+            else:
+                row = ch['row']
+                db.execute(upserts[table], tuple(row.get(c) for c in cols) + (ch['updated_at'],))
+                row_json = json.dumps(row, ensure_ascii=False)
+                if table == 'accounts':
+                    # balance 是派生列：开户余额加上本库中该账户记录的净额
+                    db.execute("""
+                        UPDATE accounts SET balance = opening_balance + COALESCE((
+                            SELECT SUM(CASE type WHEN 'income' THEN total ELSE -total END)
+                            FROM daily_rollup WHERE daily_rollup.account_id = accounts.account_id), 0.0)
+                        WHERE account_id = ?""", (key,))
+                elif table == 'budgets':
+                    recompute_budget_spend(db.conn, key)
+                elif table == 'records' and row.get('type') == 'expense':
+                    touched_budgets.add(budget_check_key(date.fromisoformat(row['date']), row.get('category_id')))
+            # 触发器按本库的 site_id 和当前时间记了日志；换成来源的版本（删除不存在的行时补一条墓碑）
+            db.execute("INSERT OR REPLACE INTO change_log(tbl, pk, op, row, updated_at, site_id) VALUES (?, ?, ?, ?, ?, ?)",
+                       (table, key, ch['op'], row_json, ch['updated_at'], ch['site_id']))
+            touched_reference = touched_reference or table in ('categories', 'accounts')
+            result.applied += 1
+        # 与本地写入一样，新同步来的支出越过预算阈值时发送通知
+        check_budgets(db, touched_budgets)
+    if touched_reference:
+        db.bump_generation()
+    return result
+
+
+def pull(dst: Database, src: Database) -> ApplyResult:
+    """把 src 上次同步之后的变更应用到 dst；dst 的 meta 中记录已同步到的 src 序号。"""
+    key = f"peer_seq:{site_id(src)}"
+    rows = dst.query("SELECT value FROM meta WHERE key = ?", (key,), tuples=True)
+    since = int(rows[0][0]) if rows else 0
+    with dst.transaction():
+        result = apply_changes(dst, export_changes(src, since, exclude_site=site_id(dst)))
+        if result.last_seq > since:
+            dst.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, str(result.last_seq)))
+    return result
+
+
+def sync(a: Database, b: Database) -> Tuple[ApplyResult, ApplyResult]:
+    """双向增量同步，返回 (a 从 b 拉取的结果, b 从 a 拉取的结果)。"""
+    return pull(a, b), pull(b, a)
+
+
+def write_changes(db: Database, path: str, since_seq: int = 0) -> int:
+    """把 since_seq 之后的变更写成 JSON Lines 文件（用于不能直接打开对方数据库的场景），返回最大 seq。"""
+    last = since_seq
+    with open(path, 'w', encoding='utf-8') as f:
+        for ch in export_changes(db, since_seq):
+            f.write(json.dumps(ch, ensure_ascii=False) + '\n')
+            last = ch['seq']
+    return last
+
+
+def read_changes(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
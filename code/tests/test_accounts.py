@@ -0,0 +1,92 @@
+import tempfile
+import os
+from datetime import date
+from ..db import Database
+from ..models import Record, RecordType, Account
+from ..services import RecordService, AccountService
+
+
+def _temp_db():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    return tf.name, Database(tf.name)
+
+
+def test_balances_follow_record_writes():
+    path, db = _temp_db()
+    rs = RecordService(db)
+    asvc = AccountService(db)
+    asvc.add_account(Account(account_id='a1', name='Cash', balance=100.0))
+    asvc.add_account(Account(account_id='a2', name='Card'))
+
+    r1 = Record.create(50.0, RecordType.INCOME, date(2025, 1, 5), account_id='a1')
+    r2 = Record.create(30.0, RecordType.EXPENSE, date(2025, 1, 6), account_id='a1')
+    rs.add_records([r1, r2])
+    assert asvc.get_balance('a1') == 120.0
+
+    # moving a record between accounts adjusts both balances
+    r2.account_id = 'a2'
+    r2.amount = 40.0
+    rs.update_record(r2)
+    assert asvc.get_balance('a1') == 150.0
+    assert asvc.get_balance('a2') == -40.0
+
+    rs.delete_record(r1.record_id)
+    balances = {a.account_id: a.balance for a in asvc.list_accounts()}
+    assert balances == {'a1': 100.0, 'a2': -40.0}
+    db.close()
+    os.unlink(path)
+
+
+def test_balance_as_of_uses_checkpoints():
+    path, db = _temp_db()
+    rs = RecordService(db)
+    asvc = AccountService(db)
+    asvc.add_account(Account(account_id='a1', name='Cash', balance=10.0))
+    recs = [Record.create(1.0, RecordType.INCOME, date(2024, m, 15), account_id='a1') for m in range(1, 13)]
+    recs.append(Record.create(5.0, RecordType.EXPENSE, date(2024, 6, 20), account_id='a1'))
+    rs.add_records(recs)
+
+    db.execute("DELETE FROM balance_checkpoints")
+    before = [asvc.balance_as_of('a1', date(2024, m, 28)) for m in range(1, 13)]
+    assert asvc.refresh_checkpoints() == 12
+    after = [asvc.balance_as_of('a1', date(2024, m, 28)) for m in range(1, 13)]
+    assert before == after
+    assert after[4] == 15.0 and after[5] == 11.0 and after[11] == 17.0
+    assert asvc.balance_as_of('a1', date(2023, 12, 31)) == 10.0
+
+    # a back-dated write invalidates later checkpoints; the write path then rebuilds them
+    db.execute("INSERT INTO records(record_id, amount, type, date, account_id) VALUES ('raw', 0.5, 'income', '2024-03-01', 'a1')")
+    assert db.query("SELECT MAX(day) FROM balance_checkpoints")[0][0] == '2024-02-29'
+    db.execute("DELETE FROM records WHERE record_id = 'raw'")
+    rs.add_record(Record.create(100.0, RecordType.INCOME, date(2024, 3, 1), account_id='a1'))
+    assert db.query("SELECT balance FROM balance_checkpoints WHERE day = '2024-03-31'")[0][0] == 113.0
+    assert asvc.balance_as_of('a1', date(2024, 12, 31)) == 117.0
+    assert asvc.get_balance('a1') == 117.0
+    db.close()
+    os.unlink(path)
+
+
+def test_checkpoints_follow_normal_writes():
+    path, db = _temp_db()
+    rs = RecordService(db)
+    asvc = AccountService(db)
+    asvc.add_account(Account(account_id='a1', name='Cash', balance=10.0))
+    asvc.add_account(Account(account_id='a2', name='Card'))
+    first = Record.create(1.0, RecordType.INCOME, date(2024, 1, 10), account_id='a1')
+    rs.add_record(first)
+    for m in range(2, 7):
+        rs.add_record(Record.create(float(m), RecordType.INCOME, date(2024, m, 10), account_id='a1'))
+    rs.add_records([Record.create(2.0, RecordType.EXPENSE, date(2024, m, 11), account_id='a2') for m in range(1, 4)])
+    days = db.query("SELECT account_id, day, balance FROM balance_checkpoints ORDER BY 1, 2", tuples=True)
+    assert days[0] == ('a1', '2024-01-31', 11.0) and days[5] == ('a1', '2024-06-30', 31.0)
+    assert days[6:] == [('a2', '2024-01-31', -2.0), ('a2', '2024-02-29', -4.0), ('a2', '2024-03-31', -6.0)]
+    # fresh checkpoints are left alone; an update that invalidates them is followed by a refresh
+    assert asvc.refresh_stale_checkpoints() == 0
+    first.amount = 5.0
+    rs.update_record(first)
+    assert db.query("SELECT COUNT(*) FROM balance_checkpoints")[0][0] == 9
+    assert db.query("SELECT balance FROM balance_checkpoints WHERE account_id = 'a1' AND day = '2024-06-30'")[0][0] == 35.0
+    assert asvc.balance_as_of('a1', date(2024, 6, 30)) == asvc.get_balance('a1')
+    db.close()
+    os.unlink(path)
@@ -0,0 +1,61 @@
+import asyncio
+import tempfile
+import os
+import time
+from datetime import date
+from ..models import Record, RecordType
+from ..aio import AsyncDatabase, AsyncRecordService, AsyncStatisticsService
+
+SLOW_SQL = ("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+            "SELECT COUNT(*) FROM (SELECT i FROM n LIMIT 500000000)")
+
+
+def _temp_path():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    return tf.name
+
+
+def _cleanup(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def test_async_services_gather_stream_and_timeout():
+    path = _temp_path()
+
+    async def main():
+        async with AsyncDatabase.open(path, max_workers=3) as adb:
+            rs = AsyncRecordService(adb)
+            stats = AsyncStatisticsService(adb)
+            d = date(2025, 9, 1)
+            recs = [Record.create(float(i), RecordType.EXPENSE, d, category_id='food', tags=['t'], account_id='a1')
+                    for i in range(1, 1201)]
+            assert await rs.add_records(recs) == 1200
+
+            overview = await stats.overview(d, d)
+            assert overview['summary']['expense'] == sum(range(1, 1201))
+            assert overview['by_category'] == {'food': sum(range(1, 1201))}
+            assert overview['by_tag'] == {'t': sum(range(1, 1201))}
+
+            seen = [r.record_id async for r in rs.iter_records(batch_size=100)]
+            assert sorted(seen) == sorted(r.record_id for r in recs)
+
+            # 提前退出的流不会占住工作线程
+            async for _ in rs.iter_records(batch_size=10):
+                break
+
+            started = time.perf_counter()
+            try:
+                await adb.run(adb.db.query, SLOW_SQL, timeout=0.1)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                raise AssertionError("slow query should time out")
+            # 被中断的查询释放了工作线程，后续调用仍然可以马上完成
+            assert (await rs.get_record(recs[0].record_id)).amount == 1.0
+            assert time.perf_counter() - started < 5
+
+    asyncio.run(main())
+    _cleanup(path)
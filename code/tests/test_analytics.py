@@ -0,0 +1,59 @@
+import tempfile
+import os
+from datetime import date, timedelta
+import pytest
+from ..db import Database
+from ..models import Record, RecordType, Account
+from ..services import RecordService, AccountService, StatisticsService
+
+np = pytest.importorskip('numpy')
+from ..analytics import AnalyticsService, rolling_mean  # noqa: E402
+
+
+def test_vectorized_series_match_sql_statistics():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    path = tf.name
+    db = Database(path)
+    rs = RecordService(db)
+    AccountService(db).add_account(Account(account_id='a1', name='Cash', balance=1000.0))
+    start = date(2025, 1, 1)
+    recs = [Record.create(float(1 + i % 13), RecordType.INCOME if i % 4 == 0 else RecordType.EXPENSE,
+                          start + timedelta(days=i % 90), category_id=('c%d' % (i % 3)) if i % 5 else None,
+                          account_id='a1') for i in range(600)]
+    rs.add_records(recs)
+    an = AnalyticsService(db)
+    stats = StatisticsService(db)
+    end = date(2025, 3, 31)
+    cols = an.load(start, end)
+    assert cols.record_count == 600
+    raw = an.load(start, end, source='records')
+    assert len(raw) == 600
+    assert an.series(raw, 'M', start, end)['net'].tolist() == pytest.approx(an.series(cols, 'M', start, end)['net'].tolist())
+
+    daily = an.series(cols, 'D', start, end)
+    assert len(daily['period']) == 90
+    s = stats.summary(start, end)
+    assert daily['income'].sum() == pytest.approx(s['income'])
+    assert daily['expense'].sum() == pytest.approx(s['expense'])
+
+    monthly = an.series(cols, 'M', start, end)
+    assert [str(p) for p in monthly['period']] == ['2025-01-01', '2025-02-01', '2025-03-01']
+    feb = stats.summary(date(2025, 2, 1), date(2025, 2, 28))
+    assert monthly['net'][1] == pytest.approx(feb['balance'])
+
+    weekly = an.series(cols, 'W', start, end)
+    assert str(weekly['period'][0]) == '2024-12-30'  # Monday of the first week
+    assert weekly['net'].sum() == pytest.approx(s['balance'])
+
+    curve = an.balance_curve('a1', start, end)
+    assert curve['balance'][-1] == pytest.approx(AccountService(db).get_balance('a1'))
+
+    shares = an.category_shares(cols)
+    totals = {k: v for k, v in stats.by_category(start, end).items()}
+    assert sum(shares.values()) == pytest.approx(1.0)
+    assert set(shares) <= set(totals)
+
+    assert rolling_mean(np.array([1.0, 2.0, 3.0, 4.0]), 2).tolist() == [1.0, 1.5, 2.5, 3.5]
+    db.close()
+    os.unlink(path)
@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+
+from ..archival import ArchiveSet, archive_records
+from ..db import Database
+from ..models import Account, Record, RecordType
+from ..query import RecordQuery
+from ..services import AccountService, RecordService, SearchService, StatisticsService
+
+
+def _attached(db):
+    return {r[1] for r in db.conn.execute("PRAGMA database_list")} - {'main', 'temp'}
+
+
+def test_archive_old_years_and_query_across():
+    tmpdir = tempfile.mkdtemp()
+    db = Database(os.path.join(tmpdir, 'ledger.db'))
+    try:
+        AccountService(db).add_account(Account(account_id='a1', name='现金', balance=100.0))
+        rs, ss, stats = RecordService(db), SearchService(db), StatisticsService(db)
+        old = [Record.create(10.0 + i, RecordType.EXPENSE, date(2021 + i % 2, 3, 1 + i), tags=['旧账'],
+                             note=f'地铁通勤 {i}', account_id='a1') for i in range(6)]
+        new = [Record.create(50.0, RecordType.INCOME, date(2024, 5, 1), note='奖金', account_id='a1'),
+               Record.create(7.0, RecordType.EXPENSE, date(2024, 5, 2), tags=['旧账'], note='地铁', account_id='a1')]
+        rs.add_records(old + new)
+        full = stats.summary(date(2020, 1, 1), date(2025, 1, 1))
+        balance = AccountService(db).get_balance('a1')
+        by_tag = stats.by_tag(date(2020, 1, 1), date(2025, 1, 1))
+        changes = db.query("SELECT COUNT(*) FROM change_log WHERE op = 'delete'")[0][0]
+
+        result = archive_records(db, date(2023, 1, 1))
+        assert result.moved == {2021: 3, 2022: 3} and result.total == 6
+        assert db.query("SELECT COUNT(*) FROM records")[0][0] == 2
+        assert os.path.exists(os.path.join(tmpdir, 'ledger.2021.archive.db'))
+        assert [(a.year, a.records) for a in ArchiveSet.for_db(db).summaries()] == [(2021, 3), (2022, 3)]
+
+        # 汇总、余额、同步日志不受归档影响，日汇总校验把已归档部分计算在内
+        assert stats.summary(date(2020, 1, 1), date(2025, 1, 1)) == full
+        assert AccountService(db).get_balance('a1') == balance
+        assert db.query("SELECT COUNT(*) FROM change_log WHERE op = 'delete'")[0][0] == changes
+        assert stats.verify_rollup() == []
+        assert stats.rebuild_rollup() > 0 and stats.summary(date(2020, 1, 1), date(2025, 1, 1)) == full
+
+        # 按日期范围裁剪：只查 2024 年时不挂载任何归档库
+        ArchiveSet.for_db(db).detach_all()
+        assert [r.record_id for r in ss.search(start=date(2024, 1, 1))] == [new[1].record_id, new[0].record_id]
+        assert _attached(db) == set()
+        found = [r.record_id for r in ss.search('地铁', start=date(2022, 1, 1))]
+        assert found == [new[1].record_id, old[5].record_id, old[3].record_id, old[1].record_id]
+        assert _attached(db) == {'arc_2022'}
+        page = ss.find(RecordQuery(tags_any=('旧账',), limit=2, offset=1))
+        assert [r.record_id for r in page] == [old[5].record_id, old[3].record_id]
+
+        assert rs.get_record(old[0].record_id).note == '地铁通勤 0'
+        assert stats.by_tag(date(2020, 1, 1), date(2025, 1, 1)) == by_tag
+        assert stats.totals(RecordQuery(min_amount=12)) == {'expense': sum(r.amount for r in old[2:]), 'income': 50.0}
+
+        # 之后补记的旧日期记录再次归档时追加到已有的归档库
+        late = Record.create(1.0, RecordType.EXPENSE, date(2021, 12, 31), account_id='a1')
+        rs.add_record(late)
+        assert archive_records(db, date(2023, 1, 1)).moved == {2021: 1}
+        assert ArchiveSet.for_db(db).summaries()[0].records == 4
+        assert stats.verify_rollup() == []
+
+        # bm25 只在主库内排序；归档库的匹配记录接在后面，按日期倒序
+        card = Record.create(3.0, RecordType.EXPENSE, date(2024, 6, 1), note='地铁通勤 月票', account_id='a1')
+        rs.add_record(card)
+        found = [r.record_id for r in ss.search('地铁通勤', ranked=True)]
+        assert found == [card.record_id] + [old[i].record_id for i in (5, 3, 1, 4, 2, 0)]
+        page = ss.find(RecordQuery(text='地铁通勤', order='rank', limit=2, offset=1))
+        assert [r.record_id for r in page] == [old[5].record_id, old[3].record_id]
+    finally:
+        db.close()
+        shutil.rmtree(tmpdir)
+
+
+def test_writes_to_archived_records():
+    from ..sync import apply_changes
+    tmpdir = tempfile.mkdtemp()
+    db = Database(os.path.join(tmpdir, 'ledger.db'))
+    try:
+        AccountService(db).add_account(Account(account_id='a1', name='现金', balance=0.0))
+        rs, ss, stats = RecordService(db), SearchService(db), StatisticsService(db)
+        recs = [Record.create(10.0, RecordType.EXPENSE, date(2021, 3, 1), note='地铁通勤', account_id='a1'),
+                Record.create(20.0, RecordType.EXPENSE, date(2021, 4, 1), note='打车', account_id='a1'),
+                Record.create(30.0, RecordType.EXPENSE, date(2021, 5, 1), note='午饭', account_id='a1')]
+        rs.add_records(recs)
+        archive_records(db, date(2022, 1, 1))
+        assert db.query("SELECT COUNT(*) FROM records")[0][0] == 0
+
+        # 同步来的修改落在已归档的记录上：移回主库后更新，不会多出一份
+        row = {'record_id': recs[0].record_id, 'amount': 15.0, 'type': 'expense', 'date': '2021-03-01',
+               'category_id': None, 'account_id': 'a1', 'tags': '[]', 'note': '地铁通勤 改', 'attachments': '[]'}
+        change = {'seq': 1, 'tbl': 'records', 'pk': recs[0].record_id, 'op': 'upsert', 'row': row,
+                  'updated_at': '2999-01-01T00:00:00.000Z', 'site_id': 'peer'}
+        assert apply_changes(db, [change]).applied == 1
+        assert AccountService(db).get_balance('a1') == -65.0
+        assert stats.summary(date(2021, 1, 1), date(2021, 12, 31))['expense'] == 65.0
+        assert [r.note for r in ss.search('地铁', start=date(2021, 1, 1))] == ['地铁通勤 改']
+        assert stats.verify_rollup() == []
+        assert ArchiveSet.for_db(db).summaries()[0].records == 2
+
+        # 服务层的修改和删除同样作用于已归档的记录
+        recs[1].amount = 25.0
+        assert rs.update_record(recs[1])
+        assert rs.delete_record(recs[2].record_id)
+        assert not rs.delete_record(recs[2].record_id)
+        assert AccountService(db).get_balance('a1') == -40.0
+        assert stats.summary(date(2021, 1, 1), date(2021, 12, 31))['expense'] == 40.0
+        assert rs.get_record(recs[2].record_id) is None
+        assert [r.amount for r in ss.search(start=date(2021, 1, 1))] == [25.0, 15.0]
+        assert stats.verify_rollup() == []
+        assert ArchiveSet.for_db(db).summaries()[0].records == 0
+        assert db.query("SELECT op FROM change_log WHERE pk = ?", (recs[2].record_id,))[0][0] == 'delete'
+        assert rs.delete_records([recs[0].record_id, recs[1].record_id]) == 2
+        assert stats.summary(date(2021, 1, 1), date(2021, 12, 31))['expense'] == 0
+    finally:
+        db.close()
+        shutil.rmtree(tmpdir)
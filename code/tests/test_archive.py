@@ -0,0 +1,66 @@
+import tempfile
+import os
+from datetime import date
+from ..db import Database
+from ..models import Record, RecordType
+from ..services import RecordService, StatisticsService
+from ..archive import ArchiveReader, ArchiveWriter, export_archive, load_archive
+
+
+def _temp_db():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    return tf.name, Database(tf.name)
+
+
+def test_archive_roundtrip_column_views_and_bulk_load():
+    path, db = _temp_db()
+    recs = [Record.create(float(i) + 0.5, RecordType.INCOME if i % 5 == 0 else RecordType.EXPENSE,
+                          date(2025, 1 + i % 12, 1 + i % 28), category_id=['food', 'rent', None][i % 3],
+                          account_id='cash', tags=['午饭'] if i % 2 else [], note='公司楼下' if i % 4 else None)
+            for i in range(1000)]
+    RecordService(db).add_records(recs)
+
+    out = path + '.acar'
+    stats = export_archive(db, out)
+    assert stats.rows == 1000
+    with ArchiveReader(out) as ar:
+        assert len(ar) == 1000
+        assert ar.columns['record_id'][0] == 'U'
+        amounts = ar.column('amount')
+        assert amounts.format == 'd' and sum(amounts) == sum(r.amount for r in recs)
+        amounts.release()
+        cats = ar.column('category_id')
+        assert {ar.string(ref) for ref in cats} == {'food', 'rent', None}
+        cats.release()
+        by_id = {r.record_id: r for r in ar}
+    assert by_id == {r.record_id: r for r in recs}
+
+    path2, db2 = _temp_db()
+    RecordService(db2).add_record(recs[0])
+    assert load_archive(db2, out, chunk_size=64) == 999
+    assert load_archive(db2, out) == 0
+    d1, d2 = date(2025, 1, 1), date(2025, 12, 31)
+    assert StatisticsService(db2).summary(d1, d2) == StatisticsService(db).summary(d1, d2)
+    assert RecordService(db2).get_record(recs[7].record_id) == recs[7]
+
+    # record_id 不是 UUID 时退回字符串引用
+    odd = Record(record_id='n1', amount=3.0, type=RecordType.EXPENSE, date=date(2025, 2, 1))
+    with ArchiveWriter(out) as w:
+        w.add(recs[1])
+        w.add(odd)
+    with ArchiveReader(out) as ar:
+        assert ar.columns['record_id'][0] == 'I'
+        assert list(ar) == [recs[1], odd]
+    with open(path2 + '.bad', 'wb') as f:
+        f.write(b'record_id,amount\n')
+    try:
+        ArchiveReader(path2 + '.bad')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("non-archive file should be rejected")
+    db.close()
+    db2.close()
+    for p in (path, path2, out, path2 + '.bad'):
+        os.unlink(p)
@@ -0,0 +1,71 @@
+import tempfile
+import os
+import shutil
+from datetime import date
+from ..db import Database, list_backups
+from ..models import Record, RecordType
+from ..services import RecordService, SearchService, StatisticsService
+
+
+def test_backup_progress_restore_and_rotation():
+    tmpdir = tempfile.mkdtemp()
+    db = Database(os.path.join(tmpdir, 'acct.db'))
+    rs = RecordService(db)
+    d = date(2025, 10, 1)
+    rs.add_records([Record.create(2.0, RecordType.EXPENSE, d, note='x' * 500) for _ in range(200)])
+
+    seen = []
+    dest = os.path.join(tmpdir, 'copy.db')
+    stats = db.backup(dest, pages=5, progress=lambda st: seen.append(st.pages_done))
+    assert stats.pages_done == stats.pages_total > 5
+    assert stats.steps == len(seen) > 1 and seen == sorted(seen)
+    assert not os.path.exists(dest + '.part')
+
+    rs.add_record(Record.create(100.0, RecordType.EXPENSE, d))
+    assert StatisticsService(db).summary(d, d)['expense'] == 500.0
+    db.restore(dest, pages=5)
+    assert StatisticsService(db).summary(d, d)['expense'] == 400.0
+    assert db.query("SELECT COUNT(*) FROM records")[0][0] == 200
+
+    for _ in range(3):
+        db.backup_rotating(keep=2)
+    kept = list_backups(os.path.join(tmpdir, 'backups'), 'acct')
+    assert len(kept) == 2
+    db.restore(str(kept[0]))
+    assert db.query("SELECT COUNT(*) FROM records")[0][0] == 200
+
+    try:
+        db.restore(os.path.join(tmpdir, 'missing.db'))
+    except FileNotFoundError:
+        pass
+    else:
+        raise AssertionError("restoring a missing file should fail")
+    db.close()
+    shutil.rmtree(tmpdir)
+
+
+def test_backup_carries_archive_databases():
+    from ..archival import archive_records
+    from ..db import archive_backup_path
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db = Database(os.path.join(tmpdir, 'ledger.db'))
+        rs = RecordService(db)
+        rs.add_records([Record.create(1.0, RecordType.EXPENSE, date(y, 6, 1)) for y in (2020, 2021, 2024)])
+        archive_records(db, date(2022, 1, 1))
+        first = db.backup_rotating(keep=1).path
+        assert archive_backup_path(first, 2020).is_file() and archive_backup_path(first, 2021).is_file()
+
+        # rotating out a backup removes its archive copies too
+        latest = db.backup_rotating(keep=1).path
+        assert sorted(os.listdir(os.path.join(tmpdir, 'backups'))) == sorted(
+            os.path.basename(p) for p in (latest, archive_backup_path(latest, 2020), archive_backup_path(latest, 2021)))
+
+        os.unlink(os.path.join(tmpdir, 'ledger.2020.archive.db'))
+        db.restore(latest)
+        assert os.path.exists(os.path.join(tmpdir, 'ledger.2020.archive.db'))
+        found = SearchService(db).search(start=date(2020, 1, 1), end=date(2021, 12, 31))
+        assert sorted(r.date.year for r in found) == [2020, 2021]
+        db.close()
+    finally:
+        shutil.rmtree(tmpdir)
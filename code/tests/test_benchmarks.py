@@ -0,0 +1,36 @@
+import tempfile
+import os
+from ..db import Database
+from ..benchmarks.datagen import LedgerGenerator
+from ..benchmarks.runner import percentile, compare_to_baseline
+
+
+def test_ledger_generator_is_deterministic():
+    a = list(LedgerGenerator(2000, seed=7).records())
+    b = list(LedgerGenerator(2000, seed=7).records())
+    assert len(a) == 2000
+    assert [(r.record_id, r.amount, r.date, r.tags, r.note) for r in a] == \
+           [(r.record_id, r.amount, r.date, r.tags, r.note) for r in b]
+    assert [r.record_id for r in LedgerGenerator(2000, seed=8).records()] != [r.record_id for r in a]
+    assert [r.date for r in a] == sorted(r.date for r in a)
+    assert any(r.type.value == 'income' for r in a)
+
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    db = Database(tf.name)
+    gen = LedgerGenerator(500, seed=7)
+    assert gen.populate(db, batch_size=128) == 500
+    assert db.query("SELECT COUNT(*) FROM categories")[0][0] == len(gen.categories) + 1
+    db.close()
+    os.unlink(tf.name)
+
+
+def test_percentile_and_baseline_comparison():
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert percentile([5.0], 95) == 5.0
+    baseline = {'results': {'1/a': {'p50_ms': 10.0}, '1/b': {'p50_ms': 0.1}}}
+    current = {'results': {'1/a': {'p50_ms': 20.0}, '1/b': {'p50_ms': 0.5}, '1/new': {'p50_ms': 99.0}}}
+    # b 慢了 5 倍但只差 0.4ms，低于绝对阈值
+    regressions = compare_to_baseline(current, baseline, threshold=1.3)
+    assert len(regressions) == 1 and regressions[0].startswith('1/a')
+    assert compare_to_baseline(current, baseline, threshold=3.0) == []
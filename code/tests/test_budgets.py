@@ -0,0 +1,86 @@
+import tempfile
+import os
+import csv
+from datetime import date
+
+import pytest
+
+from ..db import Database
+from ..models import Record, RecordType, Budget
+from ..services import RecordService, BudgetService, NotificationService
+from ..export_import import bulk_import_csv
+from ..sync import sync
+
+
+def test_budget_thresholds_notify_once_per_period():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    path = tf.name
+    db = Database(path)
+    rs = RecordService(db)
+    bs = BudgetService(db)
+    ns = NotificationService(db)
+
+    # spending recorded before the budget exists is back-filled into the counter
+    rs.add_record(Record.create(50.0, RecordType.EXPENSE, date(2025, 3, 3), category_id='food'))
+    bs.set_budget(Budget(budget_id='b1', category_id='food', limit=100.0, period='monthly'))
+    bs.set_budget(Budget(budget_id='b2', category_id=None, limit=100.0, period='weekly'))
+    with pytest.raises(ValueError):
+        bs.set_budget(Budget(budget_id='b3', category_id=None, limit=100.0, period='month'))
+    assert sorted(b.budget_id for b in bs.list_budgets()) == ['b1', 'b2']
+    assert bs.spent('b1', date(2025, 3, 31)) == 50.0
+    assert ns.list_notifications() == []
+
+    rs.add_record(Record.create(35.0, RecordType.EXPENSE, date(2025, 3, 4), category_id='food'))
+    msgs = [n.message for n in ns.list_notifications()]
+    assert len(msgs) == 2  # 85% of the monthly food budget and of the weekly total budget
+    rs.add_record(Record.create(1.0, RecordType.EXPENSE, date(2025, 3, 5), category_id='food'))
+    assert len(ns.list_notifications()) == 2  # still between 80% and 100%: nothing new
+
+    rs.add_records([Record.create(20.0, RecordType.EXPENSE, date(2025, 3, 20), category_id='food'),
+                    Record.create(500.0, RecordType.INCOME, date(2025, 3, 20))])
+    assert len(ns.list_notifications()) == 3  # monthly food budget passed 100%
+    # a new week starts from zero for the weekly budget
+    assert bs.spent('b2', date(2025, 3, 20)) == 20.0
+    assert bs.spent('b1', date(2025, 3, 20)) == 106.0
+
+    # deleting spend lowers the counter, re-evaluation does not notify again
+    rows = db.query("SELECT record_id FROM records WHERE date = '2025-03-20' AND type = 'expense'")
+    rs.delete_record(rows[0][0])
+    assert bs.spent('b1', date(2025, 3, 20)) == 86.0
+    assert bs.evaluate(date(2025, 3, 20)) == []
+    db.close()
+    os.unlink(path)
+
+
+def test_bulk_import_and_sync_check_thresholds():
+    dbs = []
+    for _ in range(2):
+        tf = tempfile.NamedTemporaryFile(delete=False)
+        tf.close()
+        dbs.append((tf.name, Database(tf.name)))
+    (path_a, a), (path_b, b) = dbs
+    for db in (a, b):
+        BudgetService(db).set_budget(Budget(budget_id='food', category_id='food', limit=100.0, period='monthly'))
+
+    src = path_a + '.import.csv'
+    with open(src, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['record_id', 'amount', 'type', 'date', 'category_id'])
+        w.writerow(['r1', '60', 'expense', '2025-03-03', 'food'])
+        w.writerow(['r2', '25', 'expense', '2025-03-10', 'food'])
+        w.writerow(['r3', '500', 'income', '2025-03-10', 'food'])
+    assert bulk_import_csv(a, src).added == 3
+    assert len(NotificationService(a).list_notifications()) == 1  # 85% of the food budget
+
+    # the synced expenses cross the same threshold on the other side
+    sync(a, b)
+    assert BudgetService(b).spent('food', date(2025, 3, 31)) == 85.0
+    assert len(NotificationService(b).list_notifications()) == 1
+    RecordService(a).add_record(Record.create(20.0, RecordType.EXPENSE, date(2025, 3, 20), category_id='food'))
+    sync(a, b)
+    assert len(NotificationService(b).list_notifications()) == 2  # passed 100%
+    for path, db in dbs:
+        db.close()
+        os.unlink(path)
+    os.unlink(src)
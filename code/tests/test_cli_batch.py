@@ -0,0 +1,170 @@
+import builtins
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from .. import cli
+from ..db import Database
+from ..models import Account
+from ..services import AccountService
+
+
+def _db():
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+    return Database(tmp.name), tmp.name
+
+
+def _lines(out):
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_batch_runs_in_one_transaction_and_rolls_back_on_error():
+    db, path = _db()
+    try:
+        AccountService(db).add_account(Account(account_id='a1', name='现金'))
+        out = io.StringIO()
+        n = cli.run_batch(db, ["add --amount 10 --account 现金 --date 2024-01-05 --tags 午饭,外卖",
+                               "# comment", "",
+                               "add --amount 200 --type income --date 2024-01-10 --note '1月 工资'",
+                               "stats --account a1"], out)
+        assert n == 3
+        res = _lines(out)
+        assert 'added' in res[0] and 'added' in res[1]
+        assert res[2]['expense'] == 10 and res[2]['income'] == 0
+        assert db.query("SELECT COUNT(*) FROM records")[0][0] == 2
+
+        out = io.StringIO()
+        with pytest.raises(cli.CommandError, match='line 2'):
+            cli.run_batch(db, ["add --amount 1", "add --amount 2 --account nope"], out)
+        assert db.query("SELECT COUNT(*) FROM records")[0][0] == 2
+        assert out.getvalue() == ''  # nothing is reported for a rolled-back batch
+
+        out = io.StringIO()
+        cli.run_batch(db, ["list --limit 1 --start 2024-01-01"], out)
+        first, cursor = _lines(out)
+        assert first['note'] == '1月 工资' and 'next_cursor' in cursor
+    finally:
+        db.close()
+        os.unlink(path)
+
+
+def test_main_one_shot_commands(capsys):
+    db, path = _db()
+    db.close()
+    csv_path = path + '.csv'
+    try:
+        assert cli.main(['--db', path, 'add', '--amount', '5', '--date', '2024-03-01']) == 0
+        assert cli.main(['--db', path, 'export', csv_path]) == 0
+        assert cli.main(['--db', path, 'add', '--amount', 'abc']) == 2
+        out = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert out[1]['exported'] == 1 and 'error' in out[2]
+        # constraint violations are reported as JSON with a non-zero exit code
+        rule = ['--db', path, 'recur', 'add', '--id', 'r', '--amount', '1', '--every', 'daily', '--start', '2024-01-01']
+        assert cli.main(rule) == 0
+        assert cli.main(rule) == 1
+        out = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert 'UNIQUE' in out[-1]['error']
+    finally:
+        os.unlink(path)
+        if os.path.exists(csv_path):
+            os.unlink(csv_path)
+
+
+def test_interactive_addcat_before_add(monkeypatch, capsys):
+    db, path = _db()
+    db.close()
+    answers = iter(['addcat', '餐饮', 'exit'])
+    monkeypatch.setattr(builtins, 'input', lambda prompt='': next(answers))
+    try:
+        cli.run_cli(path)
+        assert 'category added: 餐饮' in capsys.readouterr().out
+    finally:
+        os.unlink(path)
+
+
+def test_recur_commands():
+    db, path = _db()
+    try:
+        AccountService(db).add_account(Account(account_id='a1', name='现金'))
+        out = io.StringIO()
+        cli.run_batch(db, ["recur add --id rent --amount 3000 --every monthly --start 2024-01-05 --end 2024-03-31 --account 现金",
+                           "recur upcoming --start 2024-01-01 --days 60",
+                           "recur run --through 2024-12-31",
+                           "recur list"], out)
+        res = _lines(out)
+        assert res[0] == {'added_rule': 'rent'}
+        assert [r['date'] for r in res[1:3]] == ['2024-01-05', '2024-02-05']
+        assert res[3] == {'materialized': 3}
+        assert res[4]['materialized_through'] == '2024-03-31' and res[4]['account'] == '现金'
+        assert db.query("SELECT COUNT(*) FROM records")[0][0] == 3
+    finally:
+        db.close()
+        os.unlink(path)
+
+
+def test_interactive_reset_then_restore_brings_archives_back(monkeypatch, capsys):
+    from datetime import date
+    from ..archival import archive_records
+    from ..models import Record, RecordType
+    from ..services import RecordService, SearchService
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'ledger.db')
+    db = Database(path)
+    AccountService(db).add_account(Account(account_id='a1', name='现金'))
+    RecordService(db).add_records([Record.create(5.0, RecordType.EXPENSE, date(y, 3, 1), account_id='a1')
+                                   for y in (2021, 2024)])
+    archive_records(db, date(2022, 1, 1))
+    db.execute("INSERT INTO exchange_rates(currency, day, rate) VALUES ('USD', '2024-01-01', 7.0)")
+    db.execute("INSERT INTO recurring_rules(rule_id, amount, type, frequency, start_date) "
+               "VALUES ('r', 1.0, 'expense', 'yearly', '2099-01-01')")
+    db.close()
+    answers = iter(['reset', 'YES', 'exit', 'restore', '1', 'YES', 'exit'])
+    monkeypatch.setattr(builtins, 'input', lambda prompt='': next(answers))
+    try:
+        cli.run_cli(path)
+        assert 'database reset complete' in capsys.readouterr().out
+        db = Database(path)
+        for table in ('records', 'accounts', 'daily_rollup', 'archived_rollup', 'archives', 'balance_checkpoints',
+                      'exchange_rates', 'recurring_rules'):
+            assert db.query(f"SELECT COUNT(*) FROM {table}")[0][0] == 0, table
+        db.close()
+        assert not os.path.exists(os.path.join(tmpdir, 'ledger.2021.archive.db'))
+        backups = os.path.join(tmpdir, 'backups')
+        assert sorted(p.split('.', 2)[2] for p in os.listdir(backups)) == ['bak', 'bak.2021.archive']
+
+        # restoring the backup puts the archive database back where the archives table expects it
+        cli.run_cli(path)
+        assert 'restored' in capsys.readouterr().out
+        db = Database(path)
+        found = SearchService(db).search(start=date(2021, 1, 1), end=date(2021, 12, 31))
+        assert [(r.date, r.amount) for r in found] == [(date(2021, 3, 1), 5.0)]
+        db.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_due_rules_materialize_only_on_record_writes(capsys):
+    db, path = _db()
+    try:
+        cli.run_batch(db, ["recur add --id tea --amount 2 --every daily --start 2024-01-01 --end 2024-01-10"], io.StringIO())
+        db.close()
+        # read-only commands never write
+        assert cli.main(['--db', path, 'stats']) == 0
+        assert cli.main(['--db', path, 'recur', 'upcoming', '--start', '2024-01-01', '--days', '3']) == 0
+        db = Database(path)
+        assert db.query("SELECT COUNT(*) FROM records")[0][0] == 0
+
+        # inside a batch the due occurrences are written in the batch transaction and roll back with it
+        with pytest.raises(cli.CommandError):
+            cli.run_batch(db, ["add --amount 1", "add --amount 2 --account nope"], io.StringIO())
+        assert db.query("SELECT COUNT(*) FROM records")[0][0] == 0
+        cli.run_batch(db, ["add --amount 1"], io.StringIO())
+        assert db.query("SELECT COUNT(*) FROM records")[0][0] == 11
+    finally:
+        db.close()
+        os.unlink(path)
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+
+import pytest
+
+from ..currency import RateResolver, load_rates
+from ..db import Database
+from ..models import Account, Record, RecordType
+from ..query import RecordQuery
+from ..services import AccountService, RecordService, StatisticsService
+
+
+RATES = """date,currency,rate
+2024-01-01,USD,7.0
+2024-02-01,usd,7.2
+2024-01-01,EUR,8.0
+"""
+
+
+def _ledger(tmpdir):
+    db = Database(os.path.join(tmpdir, 'fx.db'))
+    accounts = AccountService(db)
+    accounts.add_account(Account(account_id='cny', name='现金', balance=0.0))
+    accounts.add_account(Account(account_id='usd', name='美元卡', balance=0.0, currency='USD'))
+    RecordService(db).add_records([
+        Record.create(100.0, RecordType.INCOME, date(2024, 1, 10), account_id='cny'),
+        Record.create(10.0, RecordType.EXPENSE, date(2024, 1, 15), account_id='usd', category_id='food'),
+        Record.create(10.0, RecordType.EXPENSE, date(2024, 2, 15), account_id='usd', category_id='food'),
+        Record.create(5.0, RecordType.EXPENSE, date(2024, 2, 16), category_id='food'),
+    ])
+    path = os.path.join(tmpdir, 'rates.csv')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(RATES)
+    return db, path
+
+
+def test_summary_converts_at_daily_rate():
+    tmpdir = tempfile.mkdtemp()
+    db, rates = _ledger(tmpdir)
+    try:
+        stats = StatisticsService(db)
+        with pytest.raises(ValueError):
+            stats.summary(date(2024, 1, 1), date(2024, 12, 31))
+        assert load_rates(db, rates) == 3
+
+        s = stats.summary(date(2024, 1, 1), date(2024, 12, 31))
+        assert s['income'] == pytest.approx(100.0)
+        assert s['expense'] == pytest.approx(10 * 7.0 + 10 * 7.2 + 5.0)
+        assert stats.by_category(date(2024, 1, 1), date(2024, 12, 31))['food'] == pytest.approx(147.0)
+
+        usd = stats.summary(date(2024, 1, 1), date(2024, 12, 31), currency='usd')
+        assert usd['income'] == pytest.approx(100.0 / 7.0)
+        assert usd['expense'] == pytest.approx(20.0 + 5.0 / 7.2)
+        # 需要明细的统计（金额区间）走 records，结果一致
+        assert stats.totals(RecordQuery(start=date(2024, 1, 1), min_amount=0.0), currency='USD')['expense'] == pytest.approx(usd['expense'])
+
+        # 账户汇总保持账户自己的币种
+        assert stats.account_summary('usd')['expense'] == pytest.approx(20.0)
+    finally:
+        db.close()
+        shutil.rmtree(tmpdir)
+
+
+def test_rate_resolver_as_of_and_cache():
+    tmpdir = tempfile.mkdtemp()
+    db, rates = _ledger(tmpdir)
+    try:
+        load_rates(db, rates)
+        fx = RateResolver.for_db(db)
+        assert fx.rate('USD', date(2023, 12, 1)) == 7.0   # 早于第一条汇率时用第一条
+        assert fx.rate('USD', date(2024, 1, 31)) == 7.0
+        assert fx.rate('usd', date(2024, 3, 1)) == 7.2
+        assert fx.rate('CNY', date(2024, 3, 1)) == 1.0
+        assert fx.convert(16.0, 'EUR', 'USD', date(2024, 1, 5)) == pytest.approx(16.0 * 8.0 / 7.0)
+        hits = fx.cache_info().hits
+        fx.rate('USD', date(2024, 3, 1))
+        assert fx.cache_info().hits == hits + 1
+        with pytest.raises(KeyError):
+            fx.rate('JPY', date(2024, 3, 1))
+
+        # restore bumps db.generation, so rates cached before it are not served afterwards
+        bak = os.path.join(tmpdir, 'fx.bak')
+        db.backup(bak)
+        db.execute("UPDATE exchange_rates SET rate = 9.0 WHERE currency = 'USD'")
+        assert fx.rate('USD', date(2024, 3, 1)) == 7.2
+        db.restore(bak)
+        db.execute("UPDATE exchange_rates SET rate = 9.0 WHERE currency = 'USD'")
+        assert RateResolver.for_db(db).rate('USD', date(2024, 3, 1)) == 9.0
+    finally:
+        db.close()
+        shutil.rmtree(tmpdir)
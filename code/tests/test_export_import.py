@@ -0,0 +1,134 @@
+import tempfile
+import os
+import csv
+import gzip
+from datetime import date
+from ..db import Database
+from ..models import Record, RecordType
+from ..services import RecordService
+from ..export_import import export_records, bulk_import_csv, import_from_csv
+
+
+def _temp_db():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    return tf.name, Database(tf.name)
+
+
+def test_streaming_export_with_filters_and_gzip():
+    path, db = _temp_db()
+    rs = RecordService(db)
+    recs = [Record.create(float(i), RecordType.EXPENSE if i % 3 else RecordType.INCOME, date(2025, 3, 1 + i % 28),
+                          category_id='food' if i % 2 else None, note=f'备注{i}', account_id='a1')
+            for i in range(300)]
+    rs.add_records(recs)
+
+    out = path + '.csv.gz'
+    seen = []
+    stats = export_records(db, out, category_id='food', rtype=RecordType.EXPENSE, chunk_size=50,
+                           progress=lambda st: seen.append(st.rows))
+    with gzip.open(out, 'rt', encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    expected = [r for r in recs if r.category_id == 'food' and r.type == RecordType.EXPENSE]
+    assert stats.rows == len(rows) == len(expected)
+    assert seen and seen[-1] == stats.rows
+    assert all(r['account_id'] == 'a1' and r['note'].startswith('备注') for r in rows)
+
+    out2 = path + '.csv'
+    profiler = db.enable_profiling()
+    stats2 = export_records(db, out2, start=date(2025, 3, 20))
+    assert stats2.rows == sum(1 for r in recs if r.date >= date(2025, 3, 20))
+    # 导出查询经 iter_query 执行，计入查询统计
+    assert [s.rows for s in profiler.stats() if 'records.attachments' in s.shape] == [stats2.rows]
+    db.disable_profiling()
+    db.close()
+    for p in (path, out, out2):
+        os.unlink(p)
+
+
+def test_bulk_import_skips_duplicates_and_reports_malformed():
+    path, db = _temp_db()
+    rs = RecordService(db)
+    existing = Record.create(5.0, RecordType.EXPENSE, date(2025, 1, 1), account_id='a1')
+    rs.add_record(existing)
+
+    src = path + '.import.csv'
+    with open(src, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['record_id', 'amount', 'type', 'date', 'category_id', 'tags', 'note', 'attachments', 'account_id'])
+        w.writerow([existing.record_id, '5.0', 'expense', '2025-01-01', '', '[]', '', '[]', 'a1'])
+        w.writerow(['n1', '10', 'income', '2025-02-01', 'c1', '["x"]', '工资', '[]', 'a2'])
+        w.writerow(['n1', '10', 'income', '2025-02-01', 'c1', '["x"]', '工资', '[]', 'a2'])
+        w.writerow(['n2', 'abc', 'income', '2025-02-01', '', '', '', '', ''])
+        w.writerow(['n3', '3', 'transfer', '2025-02-01', '', '', '', '', ''])
+        w.writerow(['n4', '4', 'expense', '2025-02-30', '', '', '', '', ''])
+        w.writerow(['n5', '7.5', 'expense', '2025-02-03', '', '', '', '', 'a2'])
+
+    res = bulk_import_csv(db, src, chunk_size=2)
+    assert res.added == 2
+    assert res.skipped == 2
+    assert [line for line, _ in res.malformed] == [5, 6, 7]
+    rows = db.query("SELECT account_id FROM records WHERE record_id IN ('n1', 'n5')")
+    assert {r[0] for r in rows} == {'a2'}
+
+    # importing the same file again adds nothing
+    assert import_from_csv(db, src) == 0
+    db.close()
+    os.unlink(path)
+    os.unlink(src)
+
+
+def _derived_state(db):
+    return {
+        'rollup': db.query("SELECT day, account_id, category_id, type, round(total, 6), cnt FROM daily_rollup ORDER BY 1, 2, 3, 4", tuples=True),
+        'balances': db.query("SELECT account_id, round(balance, 6) FROM accounts ORDER BY 1", tuples=True),
+        'checkpoints': db.query("SELECT account_id, day FROM balance_checkpoints ORDER BY 1, 2", tuples=True),
+        'budget_spend': db.query("SELECT budget_id, period_start, round(spent, 6) FROM budget_spend ORDER BY 1, 2", tuples=True),
+        'tags': db.query("SELECT tag, record_id FROM record_tags ORDER BY 1, 2", tuples=True),
+        'fts': db.query("SELECT r.record_id FROM records_fts f JOIN records r ON r.rowid = f.rowid "
+                        "WHERE records_fts MATCH '工资收' ORDER BY 1", tuples=True),
+        'changes': db.query("SELECT tbl, pk, op, json_remove(row, '$.updated_at') FROM change_log ORDER BY 1, 2", tuples=True),
+    }
+
+
+def test_bulk_import_maintains_derived_tables_like_triggers():
+    from ..models import Account, Budget
+    from ..services import AccountService, BudgetService
+    dbs = []
+    for _ in range(2):
+        path, db = _temp_db()
+        AccountService(db).add_account(Account(account_id='a1', name='现金', balance=100.0))
+        AccountService(db).add_account(Account(account_id='a2', name='银行卡', balance=0.0))
+        BudgetService(db).set_budget(Budget(budget_id='b1', category_id='food', limit=500.0, period='monthly'))
+        BudgetService(db).set_budget(Budget(budget_id='b2', category_id=None, limit=100.0, period='weekly'))
+        RecordService(db).add_records([Record(record_id='old', amount=1.0, type=RecordType.EXPENSE, date=date(2025, 1, 5),
+                                              account_id='a1'),
+                                       Record(record_id='gone', amount=2.0, type=RecordType.EXPENSE, date=date(2025, 1, 6),
+                                              account_id='a1')])
+        RecordService(db).delete_record('gone')
+        AccountService(db).refresh_checkpoints()
+        dbs.append((path, db))
+    records = [Record(record_id=f'r{i}', amount=float(i + 1), type=RecordType.INCOME if i % 5 == 0 else RecordType.EXPENSE,
+                      date=date(2025, 1 + i % 3, 1 + i % 28), category_id='food' if i % 2 else None,
+                      tags=['工资收入'] if i % 5 == 0 else ['午饭', '外卖'], note=f'备注{i}',
+                      account_id=('a1', 'a2', None)[i % 3])
+               for i in range(200)] + [Record(record_id='gone', amount=3.0, type=RecordType.EXPENSE, date=date(2024, 12, 1),
+                                              account_id='a2')]
+
+    (path1, by_triggers), (path2, bulk) = dbs
+    RecordService(by_triggers).add_records(records)
+    src = path2 + '.import.csv'
+    export_records(by_triggers, src)
+    res = bulk_import_csv(bulk, src, chunk_size=50)
+    assert res.added == len(records) and res.skipped == 1
+    assert _derived_state(bulk) == _derived_state(by_triggers)
+    assert not bulk.query("SELECT 1 FROM meta WHERE key = 'bulk_loading'")
+    # 之后的逐行写入照常由触发器维护
+    RecordService(bulk).add_record(Record(record_id='later', amount=4.0, type=RecordType.EXPENSE, date=date(2025, 2, 1),
+                                          category_id='food', account_id='a1'))
+    assert bulk.query("SELECT spent FROM budget_spend WHERE budget_id = 'b1' AND period_start = '2025-02-01'")[0][0] == \
+        by_triggers.query("SELECT spent FROM budget_spend WHERE budget_id = 'b1' AND period_start = '2025-02-01'")[0][0] + 4.0
+    for path, db in dbs:
+        db.close()
+        os.unlink(path)
+    os.unlink(src)
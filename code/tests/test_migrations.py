@@ -0,0 +1,36 @@
+import tempfile
+import os
+import sqlite3
+from ..db import Database, SCHEMA_VERSION
+
+
+def test_legacy_database_is_migrated():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    path = tf.name
+    # legacy layout: records without account_id, user_version still 0
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE records (record_id TEXT PRIMARY KEY, amount REAL NOT NULL, type TEXT NOT NULL, "
+                 "date TEXT NOT NULL, category_id TEXT, tags TEXT, note TEXT, attachments TEXT)")
+    conn.executemany("INSERT INTO records VALUES (?, 1.0, 'income', '2025-01-01', NULL, '[]', NULL, '[]')",
+                     [(f'r{i}',) for i in range(200)])
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    assert db.query("PRAGMA user_version")[0][0] == SCHEMA_VERSION
+    cols = [r[1] for r in db.query("PRAGMA table_info(records)")]
+    assert 'account_id' in cols
+    indexes = {r[1] for r in db.query("PRAGMA index_list(records)")}
+    assert {'idx_records_account_date', 'idx_records_category_date', 'idx_records_date_type'} <= indexes
+    plan = " ".join(r[3] for r in db.query(
+        "EXPLAIN QUERY PLAN SELECT 1 FROM records WHERE category_id = ? LIMIT 1", ('c',)))
+    assert 'idx_records_category_date' in plan
+    db.close()
+
+    # reopening an up-to-date database keeps the data and the version
+    db = Database(path)
+    assert db.query("SELECT COUNT(*) FROM records")[0][0] == 200
+    assert db.query("PRAGMA user_version")[0][0] == SCHEMA_VERSION
+    db.close()
+    os.unlink(path)
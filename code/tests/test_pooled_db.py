@@ -0,0 +1,80 @@
+import tempfile
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from ..db import PooledDatabase
+from ..models import Record, RecordType, Category
+from ..services import RecordService, StatisticsService, CategoryService
+
+
+def _temp_db(**kwargs):
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    return tf.name, PooledDatabase(tf.name, **kwargs)
+
+
+def _cleanup(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def test_many_readers_one_writer_without_lock_errors():
+    path, db = _temp_db()
+    assert db.query("PRAGMA journal_mode")[0][0] == 'wal'
+    rs = RecordService(db)
+    stats = StatisticsService(db)
+    d = date(2025, 8, 1)
+    errors = []
+    done = threading.Event()
+
+    def writer():
+        try:
+            for i in range(40):
+                rs.add_records([Record.create(1.0, RecordType.EXPENSE, d, account_id='a1') for _ in range(25)])
+        except Exception as e:  # pragma: no cover - 失败时记录下来由断言报告
+            errors.append(e)
+        finally:
+            done.set()
+
+    def reader():
+        try:
+            last = 0
+            while not done.is_set():
+                n = db.query("SELECT COUNT(*) FROM records")[0][0]
+                # 每批在一个事务里提交，读者只会看到整批
+                assert n % 25 == 0 and n >= last
+                last = n
+                stats.summary(d, d)
+                rs.list_records(limit=10)
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert db.query("SELECT COUNT(*) FROM records")[0][0] == 1000
+    assert stats.summary(d, d)['expense'] == 1000.0
+    db.close()
+    _cleanup(path)
+
+
+def test_write_retries_while_another_connection_holds_the_lock():
+    path, db = _temp_db(busy_timeout=0.05, retries=6, retry_backoff=0.05)
+    other = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    timer = threading.Timer(0.3, other.execute, args=("COMMIT",))
+    timer.start()
+    started = time.perf_counter()
+    CategoryService(db).add_category(Category(category_id='c1', name='餐饮'))
+    assert time.perf_counter() - started >= 0.25
+    timer.join()
+    other.close()
+    assert [c.name for c in CategoryService(db).list_categories()] == ['餐饮']
+    db.close()
+    _cleanup(path)
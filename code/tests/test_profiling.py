@@ -0,0 +1,56 @@
+import json
+import os
+import tempfile
+from datetime import date
+
+from ..db import Database, statement_shape
+from ..models import Record, RecordType
+from ..services import RecordService
+
+
+def _db():
+    tmp = tempfile.NamedTemporaryFile(delete=False)
+    tmp.close()
+    return Database(tmp.name), tmp.name
+
+
+def test_statement_shape_merges_literals():
+    a = statement_shape("SELECT * FROM records WHERE amount > 10 AND note = 'x'  AND record_id IN (?, ?, ?)")
+    b = statement_shape("SELECT *\n FROM records WHERE amount > 2.5 AND note = 'it''s' AND record_id IN (?)")
+    assert a == b == "SELECT * FROM records WHERE amount > ? AND note = ? AND record_id IN (?...)"
+    assert statement_shape("INSERT INTO t VALUES (?, ?), (?, ?), (?, ?)") == "INSERT INTO t VALUES (?, ?), ..."
+
+
+def test_profiler_counts_and_flags_full_scans():
+    db, path = _db()
+    log_path = path + '.slow.jsonl'
+    try:
+        rs = RecordService(db)
+        rs.add_records(Record.create(float(i), RecordType.EXPENSE, date(2024, 1, 1 + i % 28), note=f'n{i}')
+                       for i in range(50))
+        assert db.profiler is None
+        profiler = db.enable_profiling(slow_ms=0, log_path=log_path)
+        for i in range(3):
+            db.query("SELECT record_id FROM records WHERE note = ?", (f'n{i}',))
+        db.query("SELECT record_id FROM records WHERE record_id = ?", ('x',))
+        stats = {s.shape: s for s in profiler.stats()}
+        st = stats["SELECT record_id FROM records WHERE note = ?"]
+        assert st.calls == 3 and st.rows == 3 and st.max_ms >= st.avg_ms
+        slow = [e for e in profiler.slow_queries if 'note' in e['sql']]
+        assert slow and slow[0]['full_scans'] == ['records']
+        by_id = [e for e in profiler.slow_queries if 'record_id = ?' in e['sql']]
+        assert by_id and by_id[0]['full_scans'] == []
+        with open(log_path, encoding='utf-8') as f:
+            assert len([json.loads(line) for line in f]) == len(profiler.slow_queries)
+        assert 'records' in profiler.report()
+
+        profiler.reset()
+        assert profiler.stats() == [] and not profiler.slow_queries
+        db.disable_profiling()
+        db.query("SELECT 1")
+        assert profiler.stats() == []
+    finally:
+        db.close()
+        os.unlink(path)
+        if os.path.exists(log_path):
+            os.unlink(log_path)
@@ -0,0 +1,61 @@
+import tempfile
+import os
+from datetime import date
+
+import pytest
+
+from ..db import Database
+from ..models import Record, RecordType
+from ..query import RecordQuery, statement_cache_info
+from ..services import RecordService, SearchService, StatisticsService, RECORD_SELECT
+
+
+def _db():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    return Database(tf.name), tf.name
+
+
+def test_sql_depends_only_on_shape():
+    a = RecordQuery(start=date(2024, 1, 1), account_id='a1', tags_any=('x',), limit=10)
+    b = RecordQuery(start=date(2023, 5, 5), account_id='a2', tags_any=('y', 'z', 'w'), limit=50)
+    sql_a, params_a = a.select(RECORD_SELECT)
+    before = statement_cache_info().hits
+    sql_b, params_b = b.select(RECORD_SELECT)
+    assert sql_a == sql_b and params_a != params_b
+    assert statement_cache_info().hits == before + 1
+    assert RecordQuery(type='income').type is RecordType.INCOME
+    with pytest.raises(ValueError):
+        RecordQuery(order='amount_desc', after=('2024-01-01', 'x'))
+    with pytest.raises(ValueError):
+        RecordQuery(text='abc').rollup("type, SUM(total)", "type")
+
+
+def test_search_filters_and_totals():
+    db, path = _db()
+    try:
+        rs, ss, stats = RecordService(db), SearchService(db), StatisticsService(db)
+        r1 = Record.create(30.0, RecordType.EXPENSE, date(2025, 5, 1), tags=['餐饮'], note='公司楼下吃午饭', account_id='a1')
+        r2 = Record.create(8000.0, RecordType.INCOME, date(2025, 5, 10), note='五月工资', account_id='a1')
+        r3 = Record.create(12.0, RecordType.EXPENSE, date(2025, 6, 2), tags=['交通'], note='地铁', account_id='a2')
+        rs.add_records([r1, r2, r3])
+
+        # 只给一端的日期也生效
+        assert [r.record_id for r in ss.search(start=date(2025, 5, 5))] == [r3.record_id, r2.record_id]
+        assert [r.record_id for r in ss.search(end=date(2025, 5, 5))] == [r1.record_id]
+        assert [r.record_id for r in ss.search(account_id='a1', rtype='expense')] == [r1.record_id]
+        assert {r.record_id for r in ss.search(min_amount=10, max_amount=100)} == {r1.record_id, r3.record_id}
+        assert [r.record_id for r in ss.search(limit=1)] == [r3.record_id]
+        assert [r.record_id for r in rs.find(RecordQuery(order='amount_asc'))] == [r3.record_id, r1.record_id, r2.record_id]
+
+        # 有金额条件时不能用日汇总表，退回 records 上聚合，结果口径一致
+        assert stats.totals(RecordQuery(account_id='a1')) == {'income': 8000.0, 'expense': 30.0}
+        assert stats.totals(RecordQuery(account_id='a1', max_amount=100)) == {'expense': 30.0}
+        assert stats.totals(RecordQuery(text='地铁'), 'account_id') == {'a2': 12.0}
+
+        page, cursor = rs.list_records_page(limit=2, filters=RecordQuery(min_amount=1))
+        rest, end = rs.list_records_page(limit=2, cursor=cursor, filters=RecordQuery(min_amount=1))
+        assert [r.record_id for r in page + rest] == [r3.record_id, r2.record_id, r1.record_id] and end is None
+    finally:
+        db.close()
+        os.unlink(path)
@@ -0,0 +1,108 @@
+import tempfile
+import os
+from datetime import date
+from ..db import Database
+from ..models import Record, RecordType, StoredRecord
+from ..services import RecordService, record_from_row
+
+
+def _temp_db():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    return tf.name, Database(tf.name)
+
+
+def test_add_and_delete_records_in_batch():
+    path, db = _temp_db()
+    rs = RecordService(db)
+
+    recs = [Record.create(float(i), RecordType.EXPENSE, date(2025, 1, 1 + i % 28)) for i in range(500)]
+    assert rs.add_records(recs) == 500
+    assert db.query("SELECT COUNT(*) FROM records")[0][0] == 500
+
+    assert rs.delete_records([r.record_id for r in recs[:100]] + ['missing']) == 100
+    assert db.query("SELECT COUNT(*) FROM records")[0][0] == 400
+    db.close()
+    os.unlink(path)
+
+
+def test_transaction_rollback_and_join():
+    path, db = _temp_db()
+    rs = RecordService(db)
+
+    r1 = Record.create(1.0, RecordType.INCOME, date.today())
+    try:
+        with db.transaction():
+            rs.add_record(r1)  # joins the open transaction instead of committing
+            raise RuntimeError('boom')
+    except RuntimeError:
+        pass
+    assert db.query("SELECT COUNT(*) FROM records")[0][0] == 0
+
+    r2 = Record.create(2.0, RecordType.INCOME, date.today())
+    r3 = Record.create(3.0, RecordType.INCOME, date.today())
+    with db.transaction():
+        rs.add_record(r2)
+        try:
+            with db.transaction():
+                rs.add_record(r3)
+                raise RuntimeError('inner')
+        except RuntimeError:
+            pass
+    rows = db.query("SELECT record_id FROM records")
+    assert [r[0] for r in rows] == [r2.record_id]
+    db.close()
+    os.unlink(path)
+
+
+def test_keyset_pagination_and_iterator():
+    path, db = _temp_db()
+    rs = RecordService(db)
+    recs = [Record.create(float(i), RecordType.EXPENSE, date(2025, 1 + i % 12, 1 + i % 28),
+                          account_id='a1' if i % 2 else 'a2') for i in range(250)]
+    rs.add_records(recs)
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = rs.list_records_page(40, cursor)
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert len(seen) == 250
+    assert len({r.record_id for r in seen}) == 250
+    keys = [(r.date, r.record_id) for r in seen]
+    assert keys == sorted(keys, reverse=True)
+
+    streamed = list(rs.iter_records({'account_id': 'a1'}, batch_size=16))
+    assert len(streamed) == 125
+    assert all(r.account_id == 'a1' for r in streamed)
+    db.close()
+    os.unlink(path)
+
+
+def test_record_from_row_decodes_lists_lazily():
+    row = ('r1', 12.5, 'expense', '2025-03-01', 'food', '', '["午饭", "外卖"]', '备注', '')
+    rec = record_from_row(row)
+    assert isinstance(rec, StoredRecord)
+    assert rec.account_id is None and rec.date == date(2025, 3, 1) and rec.type == RecordType.EXPENSE
+    # raw JSON is kept until the first access, then decoded once and cached
+    assert rec._tags_json == '["午饭", "外卖"]' and rec._attachments_json == ''
+    assert rec.tags == ['午饭', '外卖']
+    assert rec._tags_json is None
+    assert rec.tags is rec.tags
+    assert rec.attachments == [] and rec._attachments_json is None
+
+    # assigning before the first access replaces the raw JSON
+    other = record_from_row(row)
+    other.tags = ['晚饭']
+    assert other._tags_json is None and other.tags == ['晚饭']
+    other.attachments = ['a.png']
+    assert other.attachments == ['a.png']
+
+    plain = Record(record_id='r1', amount=12.5, type=RecordType.EXPENSE, date=date(2025, 3, 1), category_id='food',
+                   tags=['午饭', '外卖'], note='备注', account_id=None)
+    assert record_from_row(row) == plain and plain == record_from_row(row)
+    assert record_from_row(row) != other
+    plain.note = '改了'
+    assert record_from_row(row) != plain
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+
+import pytest
+
+from ..db import Database
+from ..models import Account, RecordType, RecurringRule
+from ..recurring import RecurringService, occurrence_id, occurrences
+from ..services import AccountService, RecordService, StatisticsService
+
+
+def _rule(**kw):
+    values = dict(rule_id='r', amount=10.0, type=RecordType.EXPENSE, frequency='monthly', start=date(2024, 1, 31))
+    values.update(kw)
+    return RecurringRule(**values)
+
+
+def test_occurrence_dates():
+    monthly = _rule()
+    assert list(occurrences(monthly, date(2024, 1, 1), date(2024, 5, 31))) == [
+        date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30), date(2024, 5, 31)]
+    # 从区间中间开始也能找到正确的下一次
+    assert list(occurrences(monthly, date(2024, 3, 1), date(2024, 4, 30))) == [date(2024, 3, 31), date(2024, 4, 30)]
+    biweekly = _rule(frequency='weekly', interval=2, start=date(2024, 1, 1), end=date(2024, 2, 1))
+    assert list(occurrences(biweekly, date(2024, 1, 10), date(2024, 12, 31))) == [
+        date(2024, 1, 15), date(2024, 1, 29)]
+    yearly = _rule(frequency='yearly', start=date(2020, 2, 29))
+    assert list(occurrences(yearly, date(2021, 1, 1), date(2024, 12, 31))) == [
+        date(2021, 2, 28), date(2022, 2, 28), date(2023, 2, 28), date(2024, 2, 29)]
+
+
+def test_materialize_is_batched_and_idempotent():
+    tmpdir = tempfile.mkdtemp()
+    db = Database(os.path.join(tmpdir, 'recur.db'))
+    try:
+        AccountService(db).add_account(Account(account_id='bank', name='银行卡', balance=0.0))
+        svc = RecurringService(db)
+        svc.add_rule(_rule(rule_id='salary', amount=8000.0, type=RecordType.INCOME, start=date(2023, 1, 10),
+                           account_id='bank', note='工资'))
+        svc.add_rule(_rule(rule_id='coffee', amount=5.0, frequency='daily', start=date(2023, 12, 25),
+                           end=date(2024, 1, 3), account_id='bank', tags=['咖啡']))
+        with pytest.raises(ValueError):
+            svc.add_rule(_rule(rule_id='bad', frequency='hourly'))
+
+        # 停机一年后一次补齐
+        assert svc.materialize(date(2023, 12, 31)) == 12 + 7
+        assert svc.get_rule('salary').materialized_through == date(2023, 12, 31)
+        assert svc.materialize(date(2023, 12, 31)) == 0
+        # 生成的记录被删除后不会再生成
+        RecordService(db).delete_record(occurrence_id('salary', date(2023, 12, 10)))
+        assert svc.materialize(date(2023, 12, 31)) == 0
+        # 水位线丢失时重新生成也只补缺失的那一条，已有的按 id 跳过
+        db.execute("UPDATE recurring_rules SET materialized_through = NULL")
+        assert svc.materialize(date(2023, 12, 31)) == 1
+        assert svc.materialize(date(2024, 3, 31)) == 3 + 3
+        assert svc.get_rule('coffee').materialized_through == date(2024, 1, 3)
+
+        stats = StatisticsService(db)
+        assert stats.summary(date(2023, 1, 1), date(2024, 3, 31)) == {
+            'income': 8000.0 * 15, 'expense': 50.0, 'balance': 8000.0 * 15 - 50.0}
+        assert AccountService(db).get_balance('bank') == 8000.0 * 15 - 50.0
+
+        # 未来的发生只读不写
+        upcoming = svc.upcoming(date(2024, 4, 1), date(2024, 6, 30))
+        assert [r.date for r in upcoming] == [date(2024, 4, 10), date(2024, 5, 10), date(2024, 6, 10)]
+        assert upcoming[0].record_id == occurrence_id('salary', date(2024, 4, 10))
+        assert RecordService(db).get_record(upcoming[0].record_id) is None
+        projected = svc.projected_summary(date(2024, 1, 1), date(2024, 6, 30))
+        assert projected['income'] == 8000.0 * 6 and projected['expense'] == 15.0
+    finally:
+        db.close()
+        shutil.rmtree(tmpdir)
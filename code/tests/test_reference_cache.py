@@ -0,0 +1,46 @@
+import tempfile
+import os
+import sqlite3
+from ..db import Database
+from ..models import Category, Account
+from ..services import CategoryService, AccountService, ReferenceCache
+
+
+def test_reference_cache_invalidation():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    path = tf.name
+    db = Database(path)
+    cs = CategoryService(db)
+    asvc = AccountService(db)
+    ref = ReferenceCache.for_db(db)
+    assert ReferenceCache.for_db(db) is ref
+
+    cs.add_category(Category(category_id='c1', name='Food'))
+    asvc.add_account(Account(account_id='a1', name='Cash'))
+    assert ref.category_names() == {'c1': 'Food'}
+    assert ref.account_by_name('Cash').account_id == 'a1'
+
+    # repeated reads do not re-query the reference tables
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    for _ in range(10):
+        ref.category_names()
+        ref.accounts()
+    db.conn.set_trace_callback(None)
+    assert not any('FROM categories' in s or 'FROM accounts' in s for s in statements)
+
+    # writes through the services invalidate
+    cs.add_category(Category(category_id='c2', name='Bus'))
+    assert [c.name for c in cs.list_categories()] == ['Bus', 'Food']
+    cs.delete_category('c2')
+    assert ref.category('c2') is None
+
+    # writes from another connection are detected through PRAGMA data_version
+    other = sqlite3.connect(path)
+    other.execute("UPDATE accounts SET name = 'Wallet' WHERE account_id = 'a1'")
+    other.commit()
+    other.close()
+    assert ref.account('a1').name == 'Wallet'
+    db.close()
+    os.unlink(path)
@@ -0,0 +1,71 @@
+import tempfile
+import os
+from datetime import date
+from ..db import Database
+from ..models import Record, RecordType
+from ..services import RecordService, SearchService
+
+
+def test_fulltext_search_notes_and_tags():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    path = tf.name
+    db = Database(path)
+    rs = RecordService(db)
+    ss = SearchService(db)
+
+    r1 = Record.create(30.0, RecordType.EXPENSE, date(2025, 5, 1), tags=['餐饮'], note='公司楼下吃午饭')
+    r2 = Record.create(8000.0, RecordType.INCOME, date(2025, 5, 10), tags=['工资收入'], note='五月工资')
+    r3 = Record.create(12.0, RecordType.EXPENSE, date(2025, 5, 2), tags=['交通'], note='地铁 subway card')
+    rs.add_records([r1, r2, r3])
+
+    assert [r.record_id for r in ss.search('楼下吃午饭')] == [r1.record_id]
+    assert [r.record_id for r in ss.search('工资收入')] == [r2.record_id]  # tag match
+    assert [r.record_id for r in ss.search('subw*')] == [r3.record_id]
+    assert [r.record_id for r in ss.search('午饭')] == [r1.record_id]  # short term falls back to LIKE
+    # JSON punctuation of the tags column is not searchable
+    assert ss.search('",') == []
+    assert ss.search('"]') == []
+
+    r1.note = '晚饭'
+    rs.update_record(r1)
+    assert ss.search('楼下吃午饭') == []
+    rs.delete_record(r3.record_id)
+    assert ss.search('subway') == []
+
+    assert ss.rebuild_index() == 2
+    assert [r.record_id for r in ss.search('五月工资', ranked=True)] == [r2.record_id]
+    db.close()
+    os.unlink(path)
+
+
+def test_tag_filters_and_tag_aggregates():
+    from ..services import StatisticsService
+
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    path = tf.name
+    db = Database(path)
+    rs = RecordService(db)
+    ss = SearchService(db)
+    stats = StatisticsService(db)
+
+    d = date(2025, 6, 1)
+    r1 = Record.create(10.0, RecordType.EXPENSE, d, tags=['food', 'work'], account_id='a1')
+    r2 = Record.create(20.0, RecordType.EXPENSE, d, tags=['food'], account_id='a2')
+    r3 = Record.create(5.0, RecordType.EXPENSE, d, tags=['taxi', 'work'], account_id='a1')
+    r4 = Record.create(99.0, RecordType.INCOME, d, tags=[], account_id='a1')
+    rs.add_records([r1, r2, r3, r4])
+
+    assert {r.record_id for r in ss.search(tags_any=['food', 'taxi'])} == {r1.record_id, r2.record_id, r3.record_id}
+    assert [r.record_id for r in ss.search(tags_all=['food', 'work'])] == [r1.record_id]
+    assert stats.by_tag(d, d) == {'food': 30.0, 'work': 15.0, 'taxi': 5.0}
+    assert stats.by_tag(d, d, account_id='a1') == {'food': 10.0, 'work': 15.0, 'taxi': 5.0}
+
+    r2.tags = ['gift']
+    rs.update_record(r2)
+    rs.delete_record(r3.record_id)
+    assert stats.by_tag(d, d) == {'food': 10.0, 'work': 10.0, 'gift': 20.0}
+    assert db.query("SELECT COUNT(*) FROM record_tags")[0][0] == 3
+    db.close()
+    os.unlink(path)
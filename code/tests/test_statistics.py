@@ -0,0 +1,48 @@
+import tempfile
+import os
+from datetime import date
+from ..db import Database
+from ..models import Record, RecordType
+from ..services import RecordService, StatisticsService
+
+
+def _temp_db():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    return tf.name, Database(tf.name)
+
+
+def test_statistics_follow_record_writes_through_rollup():
+    path, db = _temp_db()
+    rs = RecordService(db)
+    stats = StatisticsService(db)
+    d1, d2 = date(2025, 7, 1), date(2025, 7, 2)
+
+    r1 = Record.create(100.0, RecordType.INCOME, d1, account_id='a1')
+    r2 = Record.create(30.0, RecordType.EXPENSE, d1, category_id='food', account_id='a1')
+    r3 = Record.create(20.0, RecordType.EXPENSE, d2, category_id='food', account_id='a2')
+    rs.add_records([r1, r2, r3])
+
+    assert stats.summary(d1, d2) == {'income': 100.0, 'expense': 50.0, 'balance': 50.0}
+    assert stats.summary(d1, d2, account_id='a2') == {'income': 0.0, 'expense': 20.0, 'balance': -20.0}
+    assert stats.by_category(d1, d1) == {'uncategorized': 100.0, 'food': 30.0}
+
+    # move r2 to another day and account, then delete r3
+    r2.date = d2
+    r2.amount = 35.0
+    rs.update_record(r2)
+    db.execute("UPDATE records SET account_id = 'a2' WHERE record_id = ?", (r2.record_id,))
+    rs.delete_record(r3.record_id)
+    assert stats.summary(d1, d1) == {'income': 100.0, 'expense': 0.0, 'balance': 100.0}
+    assert stats.account_summary('a2') == {'income': 0.0, 'expense': 35.0, 'balance': -35.0}
+    assert stats.verify_rollup() == []
+    assert db.query("SELECT COUNT(*) FROM daily_rollup")[0][0] == 2
+
+    # simulate drift and let verify repair it
+    db.execute("UPDATE daily_rollup SET total = total + 1 WHERE type = 'income'")
+    drift = stats.verify_rollup(repair=True)
+    assert len(drift) == 1 and drift[0]['type'] == 'income'
+    assert stats.verify_rollup() == []
+    assert stats.summary(d1, d2)['income'] == 100.0
+    db.close()
+    os.unlink(path)
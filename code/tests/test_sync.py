@@ -0,0 +1,71 @@
+import tempfile
+import os
+import time
+from datetime import date
+from ..db import Database
+from ..models import Record, RecordType, Category, Account
+from ..services import RecordService, CategoryService, AccountService, StatisticsService
+from ..sync import export_changes, apply_changes, sync, current_seq, write_changes, read_changes
+
+
+def _temp_db():
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    tf.close()
+    return tf.name, Database(tf.name)
+
+
+def test_delta_sync_with_last_writer_wins():
+    path_a, a = _temp_db()
+    path_b, b = _temp_db()
+    d = date(2025, 11, 1)
+    CategoryService(a).add_category(Category(category_id='food', name='餐饮'))
+    AccountService(a).add_account(Account(account_id='cash', name='现金', balance=100.0))
+    r1 = Record.create(30.0, RecordType.EXPENSE, d, category_id='food', account_id='cash', tags=['午饭'])
+    r2 = Record.create(12.0, RecordType.EXPENSE, d, account_id='cash')
+    RecordService(a).add_records([r1, r2])
+
+    pulled_by_a, pulled_by_b = sync(a, b)
+    assert pulled_by_b.applied == 4 and pulled_by_a.applied == 0
+    assert [c.name for c in CategoryService(b).list_categories()] == ['餐饮']
+    assert AccountService(b).get_balance('cash') == 58.0
+    assert RecordService(b).get_record(r1.record_id).tags == ['午饭']
+    assert StatisticsService(b).summary(d, d)['expense'] == 42.0
+
+    # 只传增量：没有新修改时什么都不应用
+    assert sync(a, b)[1].applied == 0
+
+    # 两边修改同一条记录，后写的一方胜出；一边删除另一条
+    r1.amount = 31.0
+    RecordService(a).update_record(r1)
+    time.sleep(0.01)
+    r1_b = RecordService(b).get_record(r1.record_id)
+    r1_b.amount = 35.0
+    RecordService(b).update_record(r1_b)
+    RecordService(a).delete_record(r2.record_id)
+    sync(a, b)
+    sync(a, b)
+    for db in (a, b):
+        assert RecordService(db).get_record(r1.record_id).amount == 35.0
+        assert RecordService(db).get_record(r2.record_id) is None
+        assert AccountService(db).get_balance('cash') == 65.0
+        assert StatisticsService(db).verify_rollup() == []
+
+    # 过期的变更（例如重放旧文件）被跳过
+    stale = [ch for ch in export_changes(a) if ch['pk'] == r1.record_id]
+    stale[0]['updated_at'] = '2000-01-01T00:00:00.000Z'
+    assert apply_changes(b, stale).skipped == 1
+
+    # 直接写 SQL 的修改同样记入日志
+    seq = current_seq(a)
+    a.execute("UPDATE categories SET name = '吃饭' WHERE category_id = 'food'")
+    changes = list(export_changes(a, seq))
+    assert [(c['tbl'], c['row']['name']) for c in changes] == [('categories', '吃饭')]
+    out = path_a + '.changes.jsonl'
+    assert write_changes(a, out, seq) == changes[0]['seq']
+    assert apply_changes(b, read_changes(out)).applied == 1
+    assert [c.name for c in CategoryService(b).list_categories()] == ['吃饭']
+
+    a.close()
+    b.close()
+    for p in (path_a, path_b, out):
+        os.unlink(p)